@@ -0,0 +1,861 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*- 
+
+# **********
+# Filename:         Benchmarks.py
+# Description:      Performance tests for the tests sub-command
+# Author:           Marc Vieira Cardinal
+# Creation Date:    October 17, 2026
+# Revision Date:    October 17, 2026
+# **********
+
+
+# External imports
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import platform
+import resource
+import tempfile
+import threading
+import subprocess
+import SocketServer
+import BaseHTTPServer
+from hashlib import sha1
+
+
+# Application imports
+import LogUtils
+from BencodeUtils import bencode, bdecode, bdecode_buffer, bdecode_lazy
+from PieceSize import NewPiecePolicy, FixedPolicy
+from Scheduler import Scheduler, Stream, TorrentOptions
+from Torrent import Torrent
+
+
+class MockTrackerHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """ Accepts anything on push, answers gets with a small torrent, """
+    """ keeping connections alive """
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    wbufsize = -1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.getheader("Content-Length", 0)))
+        self.server.Count("requests")
+        self.Reply("ok")
+
+    def do_GET(self):
+        self.server.Count("requests")
+        self.Reply(self.server.torrent)
+
+    def Reply(self, body):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+class MockTracker(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """ A local stand-in for the tracker push/get endpoints """
+    daemon_threads = True
+
+    def __init__(self, torrent = "de"):
+        BaseHTTPServer.HTTPServer.__init__(self, ("127.0.0.1", 0), MockTrackerHandler)
+        self.torrent  = torrent
+        self.lock     = threading.Lock()
+        self.counters = { "requests": 0, "connections": 0 }
+
+        thread = threading.Thread(target = self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def Count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def process_request(self, request, client_address):
+        self.Count("connections")
+        SocketServer.ThreadingMixIn.process_request(self, request, client_address)
+
+    def Uri(self, path):
+        return "http://127.0.0.1:%s%s" % (self.server_address[1], path)
+
+    def Stats(self):
+        with self.lock:
+            return dict(self.counters)
+
+
+# Modules a short lived subcommand should not pay for
+HEAVY_MODULES = ("libtorrent", "requests", "pyinotify", "urllib2", "BaseHTTPServer",
+                 "ContentStore", "Verifier")
+
+# Runs a script as __main__, then writes the names of the modules it loaded
+# to the file named by the first argument
+LOADED_MODULES = """import os, sys, json, runpy
+outFile, script = sys.argv[1:3]
+sys.argv = sys.argv[2:]
+sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+try:
+    runpy.run_path(script, run_name = "__main__")
+finally:
+    with open(outFile, "w") as f:
+        json.dump(sorted(name for name, module in sys.modules.items() if module), f)
+"""
+
+
+class MockControlSocket(threading.Thread):
+    """ Answers every control socket command with ok """
+
+    def __init__(self, path):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.sock   = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(path)
+        self.sock.listen(16)
+        self.start()
+
+    def run(self):
+        while True:
+            conn, address = self.sock.accept()
+            conn.recv(4096)
+            conn.sendall("ok\n")
+            conn.close()
+
+
+# Synthetic datasets of the benchmark suite, (file count, total bytes)
+SUITE_PROFILES = {
+    "quick": [(1,      64 * 1024),
+              (1,      256 * 1024 ** 2),
+              (1000,   64 * 1024 ** 2),
+              (10000,  10 * 1024 ** 2)],
+    "full":  [(1,      64 * 1024),
+              (1,      1024 ** 3),
+              (1,      20 * 1024 ** 3),
+              (1000,   1024 ** 3),
+              (100000, 400 * 1024 ** 2)],
+}
+
+
+def SizeLabel(n):
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if n < 1024 or n % 1024 or unit == "GiB":
+            return "%d%s" % (n, unit)
+        n //= 1024
+
+
+class Benchmarks():
+    def __init__(self, logger):
+        self.logger      = logger.getChild(__name__)
+
+    def Timeit(self, func, minTime = 1.0):
+        """ Returns the number of calls per second of func """
+        calls, start = 0, time.time()
+        while True:
+            func()
+            calls += 1
+            elapsed = time.time() - start
+            if elapsed >= minTime:
+                return calls / elapsed
+
+    def SampleTorrents(self):
+        """ Returns a list of (label, bencoded torrent) shaped like """
+        """ the metadata we produce and receive """
+        single = { "announce":      "http://tracker.example.com:6969/announce",
+                   "creation date": int(time.time()),
+                   "created by":    "pyBTclient",
+                   "info":          { "piece length": 4194304,
+                                      "length":       100 * 1024 ** 3,
+                                      "name":         "payload.bin",
+                                      "md5sum":       "0" * 32,
+                                      "pieces":       os.urandom(20 * 25600) } }
+
+        multi = { "announce":      "http://tracker.example.com:6969/announce",
+                  "creation date": int(time.time()),
+                  "info":          { "piece length": 32768,
+                                     "name":         "dataset",
+                                     "files":        [{ "length": 4700 + i,
+                                                        "path":   ["d%03d" % (i % 100), "f%05d.dat" % i],
+                                                        "md5sum": "0" * 32 }
+                                                      for i in range(10000)],
+                                     "pieces":       os.urandom(20 * 1500) } }
+
+        scrape = { "files": dict((os.urandom(20), { "complete":   i % 50,
+                                                    "downloaded": i,
+                                                    "incomplete": i % 7 })
+                                 for i in range(5000)) }
+
+        return [("single-100GB", bencode(single)),
+                ("multi-10k",    bencode(multi)),
+                ("scrape-5k",    bencode(scrape))]
+
+    def TestBdecode(self, torrentFiles = ()):
+        """ Compares bdecode against bdecode_buffer, with and without """
+        """ zero-copy pieces, on sample and user supplied torrents """
+        samples = self.SampleTorrents()
+        for torrentFile in torrentFiles:
+            with open(torrentFile, "rb") as f:
+                samples.append((os.path.basename(torrentFile), f.read()))
+
+        for label, data in samples:
+            if bdecode(data) != bdecode_buffer(data):
+                self.logger.error("Decoders disagree on [%s]" % label)
+
+            rates = [self.Timeit(lambda: bdecode(data)),
+                     self.Timeit(lambda: bdecode_buffer(data)),
+                     self.Timeit(lambda: bdecode_buffer(data, views = ("pieces",)))]
+
+            self.logger.info("%s,%s bytes,bdecode %.1f/s,bdecode_buffer %.1f/s (x%.2f),"
+                             "bdecode_buffer+views %.1f/s (x%.2f)"
+                             % (label, len(data), rates[0], rates[1], rates[1] / rates[0],
+                                rates[2], rates[2] / rates[0]))
+
+    def TestBdecodeLazy(self, torrentFiles = ()):
+        """ Time to read the name and info-hash of a torrent, by full """
+        """ decoding and re-encoding versus lazy decoding """
+        samples = self.SampleTorrents()[:2]
+        for torrentFile in torrentFiles:
+            with open(torrentFile, "rb") as f:
+                samples.append((os.path.basename(torrentFile), f.read()))
+
+        def Full(data):
+            torrent = bdecode(data)
+            return torrent["info"]["name"], sha1(bencode(torrent["info"])).digest()
+
+        def Lazy(data):
+            torrent = bdecode_lazy(data)
+            return torrent["info"]["name"], sha1(torrent.raw("info")).digest()
+
+        for label, data in samples:
+            if Full(data) != Lazy(data):
+                self.logger.error("Lazy decoding disagrees on [%s]" % label)
+
+            rates = [self.Timeit(lambda: Full(data)),
+                     self.Timeit(lambda: Lazy(data))]
+
+            self.logger.info("%s,%s bytes,name+infohash full %.1f/s,lazy %.1f/s (x%.2f)"
+                             % (label, len(data), rates[0], rates[1], rates[1] / rates[0]))
+
+    def RunConcurrently(self, func, count, concurrency):
+        """ Calls func count times from concurrency threads, returns calls/s """
+        remaining = [count]
+        lock = threading.Lock()
+
+        def Worker():
+            while True:
+                with lock:
+                    if not remaining[0]:
+                        return
+                    remaining[0] -= 1
+                func()
+
+        threads = [threading.Thread(target = Worker) for i in range(concurrency)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return count / (time.time() - start)
+
+    def TestPush(self, count = 2000, concurrency = 8, batchSize = 50):
+        """ Pushes per second against a local mock tracker, one new """
+        """ connection per push versus the pooled TrackerClient, """
+        """ pushing one torrent or batchSize torrents per request, returns """
+        """ the pushes per second of each mode """
+        import requests
+        from TrackerClient import TrackerClient
+
+        torrentFile = tempfile.NamedTemporaryFile(suffix = ".torrent", delete = False)
+        torrentFile.write(self.SampleTorrents()[0][1][:16384])
+        torrentFile.close()
+
+        rates = {}
+        try:
+            def Unpooled():
+                with open(torrentFile.name, "rb") as f:
+                    requests.post(tracker.Uri("/push"),
+                                  files = { "torrentFile": ("key", f) }).raise_for_status()
+
+            tracker = MockTracker()
+            rate = self.RunConcurrently(Unpooled, count, concurrency)
+            rates["unpooled"] = rate
+            self.logger.info("push unpooled,%s pushes,%s threads,%.1f pushes/s,%s"
+                             % (count, concurrency, rate, tracker.Stats()))
+            tracker.shutdown()
+
+            tracker = MockTracker()
+            client = TrackerClient(self.logger, poolSize = concurrency)
+            rate = self.RunConcurrently(lambda: client.Push(tracker.Uri("/push"), "key", torrentFile.name),
+                                        count, concurrency)
+            rates["pooled"] = rate
+            self.logger.info("push pooled,%s pushes,%s threads,%.1f pushes/s,%s"
+                             % (count, concurrency, rate, tracker.Stats()))
+            tracker.shutdown()
+
+            tracker = MockTracker()
+            batch = [("key%s" % i, torrentFile.name) for i in range(batchSize)]
+            rate = self.RunConcurrently(lambda: client.PushBatch(tracker.Uri("/push"), batch),
+                                        max(1, count // batchSize), concurrency) * batchSize
+            rates["batched"] = rate
+            self.logger.info("push batched,%s pushes,%s threads,%s per batch,%.1f pushes/s,%s"
+                             % (count, concurrency, batchSize, rate, tracker.Stats()))
+            client.close()
+            tracker.shutdown()
+        finally:
+            os.unlink(torrentFile.name)
+
+        return rates
+
+    def HashRate(self, pieceSize, sampleSize = 32 * 1024 * 1024):
+        """ SHA-1 bytes per second when hashing pieces of pieceSize """
+        view = memoryview(os.urandom(min(sampleSize, max(pieceSize, 2**20))))
+        start = time.time()
+        for i in range(0, len(view), pieceSize):
+            sha1(view[i:i + pieceSize]).digest()
+        return len(view) / max(time.time() - start, 1e-9)
+
+    def SimulateDownload(self, totalSize, pieceSize, pieceCount, metadataSize,
+                         hashRate, peers = 20, peerRate = 2e6, pieceOverhead = 1e-4):
+        """ Rough download time in seconds from a swarm of peers each """
+        """ sending peerRate bytes/s: the metadata from a single peer, """
+        """ the bulk at the aggregate rate, the last piece from a single """
+        """ peer (end game), its hash check, and a fixed bookkeeping cost """
+        """ (request, HAVE broadcast) per piece """
+        return (metadataSize / peerRate
+                + totalSize / (peers * peerRate)
+                + pieceSize / peerRate
+                + pieceSize / hashRate
+                + pieceCount * pieceOverhead)
+
+    def TestPiecePolicies(self, policies = ("monotorrent", "libtorrent", "fixed:1048576",
+                                            "fixed:16777216", "count:1500")):
+        """ Piece size, metadata size, hashing throughput and simulated """
+        """ download time of each policy over a range of payload sizes """
+        hashRates = {}
+        for spec in policies:
+            policy = NewPiecePolicy(spec, None if spec == "monotorrent" else 16 * 1024 * 1024)
+            for totalSize in (10 ** 7, 10 ** 9, 10 ** 10, 10 ** 11, 10 ** 12):
+                pieceSize, pieceCount = policy(totalSize)
+                if pieceSize not in hashRates:
+                    hashRates[pieceSize] = self.HashRate(pieceSize)
+
+                metadataSize = len(bencode({ "piece length": pieceSize,
+                                             "length":       totalSize,
+                                             "name":         "payload.bin",
+                                             "md5sum":       "0" * 32,
+                                             "pieces":       "\0" * (20 * pieceCount) }))
+                seconds = self.SimulateDownload(totalSize, pieceSize, pieceCount,
+                                                metadataSize, hashRates[pieceSize])
+
+                self.logger.info("%s,%s,%s,%s,metadata %s bytes,hash %.1f MB/s,download %.1f s"
+                                 % (policy, totalSize, pieceSize, pieceCount, metadataSize,
+                                    hashRates[pieceSize] / 1e6, seconds))
+
+
+    def TestMetaVersions(self, pieceSize = 65536):
+        """ Creates v1, v2 and hybrid torrents of a synthetic tree, loads """
+        """ them with libtorrent and, for v2 and hybrid, compares the info """
+        """ hash with the one of libtorrent's own create_torrent """
+        import libtorrent as lt
+        tempDir = tempfile.mkdtemp()
+        try:
+            source = os.path.join(tempDir, "payload")
+            sizes  = [0, 5, pieceSize, pieceSize * 5 + 100, 16384 * 9 + 3, 3 * 2**20]
+            for i, size in enumerate(sizes):
+                path = os.path.join(source, "d%d" % (i % 3), "f%d.bin" % i)
+                if not os.path.isdir(os.path.dirname(path)):
+                    os.makedirs(os.path.dirname(path))
+                with open(path, "wb") as f:
+                    f.write(os.urandom(size))
+
+            flags = { "v1":     getattr(lt.create_torrent, "v1_only", None),
+                      "v2":     getattr(lt.create_torrent, "v2_only", None),
+                      "hybrid": 0 }
+            for metaVersion in ("v1", "v2", "hybrid"):
+                torrent = Torrent(self.logger, piecePolicy = FixedPolicy(pieceSize),
+                                  metaVersion = metaVersion)
+                start   = time.time()
+                content = torrent.GenTorrentFileContent(source, "http://127.0.0.1/announce")
+                elapsed = time.time() - start
+
+                info = lt.torrent_info(lt.bdecode(content))
+                infoHash = sha1(bencode(bdecode(content)["info"])).hexdigest()
+
+                match = "n/a"
+                if metaVersion != "v1" and flags[metaVersion] is not None:
+                    fileStorage = lt.file_storage()
+                    lt.add_files(fileStorage, source)
+                    reference = lt.create_torrent(fileStorage, pieceSize, flags = flags[metaVersion])
+                    lt.set_piece_hashes(reference, tempDir)
+                    match = infoHash == sha1(lt.bencode(reference.generate()["info"])).hexdigest()
+
+                self.logger.info("%s,files %s,pieces %s,%.1f MB/s,info sha1 %s,matches libtorrent %s"
+                                 % (metaVersion, info.num_files(), info.num_pieces(),
+                                    sum(sizes) / max(elapsed, 1e-9) / 1e6, infoHash, match))
+        finally:
+            shutil.rmtree(tempDir, True)
+
+    def TestLogging(self, count = 2000, diskDelay = 0.0002):
+        """ Latency seen by the caller of logger.info when the records are """
+        """ written directly or through the queue, to the page cache and to """
+        """ a disk taking diskDelay seconds per write (rotation, slow disk), """
+        """ and the time until every record is written """
+        tempDir = tempfile.mkdtemp()
+        try:
+            modes = [("direct",      0,    "block", False),
+                     ("queue-block", 1024, "block", False),
+                     ("queue-drop",  1024, "drop",  False),
+                     ("queue-json",  1024, "block", True)]
+            for delay in (0, diskDelay):
+                for label, queueSize, policy, jsonFormat in modes:
+                    name   = "logbench-%s-%s" % (label, delay)
+                    logger = LogUtils.RotatingFile(name, "info", os.path.join(tempDir, name + ".log"),
+                                                   False, queueSize, policy, jsonFormat)
+                    logger.propagate = False
+
+                    queueHandler = logger.handlers[0] if queueSize else None
+                    handlers     = queueHandler.listener.handlers if queueSize else logger.handlers
+                    if delay:
+                        for handler in handlers:
+                            handler.emit = self.SlowEmit(handler.emit, delay)
+
+                    latencies = []
+                    start = time.time()
+                    for i in range(count):
+                        before = time.time()
+                        logger.info("Piece %s of [%s] hashed in %.3f s" % (i, "payload.bin", 0.001))
+                        latencies.append(time.time() - before)
+                    elapsed = time.time() - start
+
+                    if queueHandler:
+                        queueHandler.listener.stop()
+                    written = time.time() - start
+
+                    for handler in logger.handlers + handlers:
+                        logger.removeHandler(handler)
+                        handler.close()
+
+                    latencies.sort()
+                    self.logger.info("%s,disk delay %s us,%s records,mean %.1f us,p99 %.1f us,"
+                                     "max %.1f us,written after %.3f s,dropped %s"
+                                     % (label, int(delay * 1e6), count, elapsed / count * 1e6,
+                                        latencies[int(count * 0.99)] * 1e6, latencies[-1] * 1e6,
+                                        written, queueHandler.dropped if queueHandler else 0))
+        finally:
+            shutil.rmtree(tempDir, True)
+
+    def SlowEmit(self, emit, delay):
+        def Emit(record):
+            time.sleep(delay)
+            emit(record)
+        return Emit
+
+    def LoopbackSession(self, settings):
+        """ A session listening on 127.0.0.1 only, with peer discovery off """
+        """ and several connections per IP allowed, settings over that """
+        import libtorrent as lt
+        ses = lt.session()
+        loopback = { "listen_interfaces":                 "127.0.0.1:0",
+                     "enable_dht":                        False,
+                     "enable_lsd":                        False,
+                     "enable_upnp":                       False,
+                     "enable_natpmp":                     False,
+                     "allow_multiple_connections_per_ip": True }
+        loopback.update(settings)
+        loopback["listen_interfaces"] = "127.0.0.1:0"
+        ses.apply_settings(loopback)
+        return ses
+
+    def TestSwarm(self, profiles = ("default", "high_performance_seed", "min_memory"),
+                  leechers = 3, totalSize = 256 * 1024 ** 2, timeout = 600):
+        """ Time for leechers sessions to download totalSize bytes from one """
+        """ seeder over the loopback interface, all sessions using the same """
+        """ settings profile, the leechers also trading among themselves """
+        import libtorrent as lt
+        from SessionProfiles import SessionSettings
+        tempDir = tempfile.mkdtemp()
+        try:
+            seedDir = os.path.join(tempDir, "seed")
+            os.makedirs(seedDir)
+            source = self.GenerateTree(seedDir, 1, totalSize, sparseFrom = totalSize + 1)
+            torrentFile = os.path.join(tempDir, "swarm.torrent")
+            Torrent(self.logger).WriteTorrentFile(torrentFile, source, "http://127.0.0.1:1/announce")
+            info = lt.torrent_info(torrentFile)
+
+            results = {}
+            for profile in profiles:
+                settings = SessionSettings(profile)
+
+                seeder = self.LoopbackSession(settings)
+                seed   = seeder.add_torrent({ "ti": info, "save_path": seedDir })
+                while not seed.status().is_seeding:
+                    time.sleep(0.05)
+
+                sessions, handles = [], []
+                for i in range(leechers):
+                    ses = self.LoopbackSession(settings)
+                    h   = ses.add_torrent({ "ti":        info,
+                                            "save_path": os.path.join(tempDir, "%s-%s" % (profile, i)) })
+                    h.connect_peer(("127.0.0.1", seeder.listen_port()))
+                    for other in sessions:
+                        h.connect_peer(("127.0.0.1", other.listen_port()))
+                    sessions.append(ses)
+                    handles.append(h)
+
+                start = time.time()
+                while not all(h.status().is_seeding for h in handles):
+                    if time.time() - start > timeout:
+                        self.logger.error("%s: the swarm did not complete in %s s" % (profile, timeout))
+                        break
+                    time.sleep(0.05)
+                elapsed = time.time() - start
+                done    = sum(h.status().total_done for h in handles)
+
+                results[profile] = elapsed
+                self.logger.info("swarm,%s,%s settings,%s leechers,%s of %s bytes,%.2f s,%.1f MB/s aggregate"
+                                 % (profile, len(settings), leechers, done, totalSize * leechers,
+                                    elapsed, done / max(elapsed, 1e-9) / 1e6))
+
+                del handles, sessions, seed, seeder
+                for i in range(leechers):
+                    shutil.rmtree(os.path.join(tempDir, "%s-%s" % (profile, i)), True)
+            return results
+        finally:
+            shutil.rmtree(tempDir, True)
+
+    def TestScan(self, dirCount = 2000, filesPerDir = 10, jobs = 4):
+        """ Startup of the autoindexer on a tree of dirCount directories: """
+        """ one recursive add_watch against the TreeWatcher scan, with an """
+        """ empty snapshot then an up to date one """
+        import pyinotify
+        from TreeWatcher import TreeWatcher, WATCH_MASK
+        class NullPipeline():
+            def Submit(self, path, fileKey):
+                pass
+
+            def Failed(self):
+                return set()
+
+        tempDir = tempfile.mkdtemp()
+        try:
+            root = os.path.join(tempDir, "tree")
+            for i in range(dirCount):
+                path = os.path.join(root, *("%02d" % int(c) for c in str(i + 100000)[1:]))
+                os.makedirs(path)
+                for j in range(filesPerDir):
+                    open(os.path.join(path, "f%s" % j), "w").close()
+
+            watchManager = pyinotify.WatchManager()
+            start = time.time()
+            wdd = watchManager.add_watch(root, WATCH_MASK, rec = True)
+            elapsed = time.time() - start
+            self.logger.info("scan,add_watch rec=True,%s watches,%.3f s"
+                             % (sum(1 for wd in wdd.values() if wd >= 0), elapsed))
+            watchManager.close()
+
+            snapshotFile = os.path.join(tempDir, "snapshot.db")
+            for label in ("empty snapshot", "unchanged"):
+                watchManager = pyinotify.WatchManager()
+                watcher      = TreeWatcher(self.logger, watchManager, NullPipeline(), jobs, snapshotFile)
+                watcher.Start([root])
+                watcher.scanned.wait()
+                watcher.Stop()
+                watcher.Save()
+                watchManager.close()
+
+                stats = watcher.Stats()
+                self.logger.info("scan,%s,%s jobs,%s dirs,%s files,%s queued,%s watches in %s batches,%.3f s"
+                                 % (label, jobs, stats["dirs"], stats["files"], stats["queued"],
+                                    stats["watches"], stats["watchBatches"], stats["scanSeconds"]))
+        finally:
+            shutil.rmtree(tempDir, True)
+
+    def TestStreaming(self, totalSize = 256 * 1024 ** 2, rate = 32 * 1024 ** 2, readAhead = 8,
+                      deadline = 1000, timeout = 600):
+        """ Time to the first byte, to the first 10% and to the whole of """
+        """ a file read from its start, fetched over the loopback from a """
+        """ seeder capped at rate bytes/s, rarest first, sequential and """
+        """ streaming with deadlines """
+        import libtorrent as lt
+        tempDir = tempfile.mkdtemp()
+        try:
+            seedDir = os.path.join(tempDir, "seed")
+            os.makedirs(seedDir)
+            source = self.GenerateTree(seedDir, 1, totalSize, sparseFrom = totalSize + 1)
+            torrentFile = os.path.join(tempDir, "stream.torrent")
+            Torrent(self.logger).WriteTorrentFile(torrentFile, source, "http://127.0.0.1:1/announce")
+            info = lt.torrent_info(torrentFile)
+
+            modes = [("rarest-first", []),
+                     ("sequential",   []),
+                     ("stream",       ["stream=1", "readahead=%s" % readAhead, "deadline=%s" % deadline])]
+            results = {}
+            for label, params in modes:
+                seeder = self.LoopbackSession({})
+                seed   = seeder.add_torrent({ "ti": info, "save_path": seedDir })
+                # Session rate limits do not apply to loopback peers
+                seed.set_upload_limit(rate)
+                while not seed.status().is_seeding:
+                    time.sleep(0.05)
+
+                ses       = self.LoopbackSession({})
+                scheduler = Scheduler(self.logger, ses)
+                h         = ses.add_torrent({ "ti":        info,
+                                              "save_path": os.path.join(tempDir, label) })
+                scheduler.Add(h, info, TorrentOptions(params))
+                if label == "sequential":
+                    h.set_sequential_download(True)
+                head = Stream(h, info, [0], readAhead, deadline)
+
+                h.connect_peer(("127.0.0.1", seeder.listen_port()))
+                start, firstByte, tenth = time.time(), None, None
+                while not h.status().is_seeding and time.time() - start < timeout:
+                    scheduler.Step()
+                    available = sum(head.Available().values())
+                    if firstByte is None and available:
+                        firstByte = time.time() - start
+                    if tenth is None and available >= totalSize // 10:
+                        tenth = time.time() - start
+                    time.sleep(0.01)
+                elapsed = time.time() - start
+                if h.status().is_seeding:
+                    firstByte = elapsed if firstByte is None else firstByte
+                    tenth     = elapsed if tenth is None else tenth
+
+                results[label] = { "firstByte": firstByte, "tenth": tenth, "complete": elapsed }
+                self.logger.info("stream,%s,%s bytes,seeder capped at %s MB/s,first byte %.2f s,10%% %.2f s,complete %.2f s"
+                                 % (label, totalSize, rate / 1e6, firstByte or -1, tenth or -1, elapsed))
+                del h, ses, seed, seeder
+                shutil.rmtree(os.path.join(tempDir, label), True)
+            return results
+        finally:
+            shutil.rmtree(tempDir, True)
+
+    def TestStartup(self, runs = 20, jobs = 200):
+        """ Wall time of short pyBTclient.py commands, interpreter start """
+        """ and imports included, the heavy modules each one loads, and """
+        """ the time per mktorrent job of one process per job against """
+        """ a single worker process """
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pyBTclient.py")
+        tempDir = tempfile.mkdtemp()
+        tracker = MockTracker()
+        try:
+            source = self.GenerateTree(tempDir, 1, 64 * 1024)
+            torrentFile = os.path.join(tempDir, "payload.torrent")
+            Torrent(self.logger).WriteTorrentFile(torrentFile, source, "http://127.0.0.1:1/announce")
+            controlSocket = os.path.join(tempDir, "control.sock")
+            MockControlSocket(controlSocket)
+
+            logFile  = os.path.join(tempDir, "startup.log")
+            commands = [("help",        ["--help"]),
+                        ("mktorrent",   ["mktorrent", source, os.path.join(tempDir, "mk.torrent"),
+                                         "http://127.0.0.1:1/announce"]),
+                        ("pushtorrent", ["pushtorrent", torrentFile, "key", tracker.Uri("/push")]),
+                        ("verify",      ["verify", torrentFile, os.path.dirname(source)]),
+                        ("catalog",     ["catalog", os.path.join(tempDir, "catalog.db"), "stats"]),
+                        ("daemonctl",   ["daemonctl", "--control-socket", controlSocket, "status"])]
+
+            results = {}
+            with open(os.devnull, "w") as devNull:
+                def Run(command, stdin = None):
+                    start = time.time()
+                    subprocess.check_call(command, stdin = stdin, stdout = devNull)
+                    return time.time() - start
+
+                times = sorted(Run([sys.executable, "-c", "pass"]) for i in range(runs))
+                results["python"] = { "median": times[len(times) // 2] }
+                self.logger.info("startup,python,%s runs,median %.1f ms,min %.1f ms"
+                                 % (runs, times[len(times) // 2] * 1000, times[0] * 1000))
+
+                for name, params in commands:
+                    command = [script, "-o", logFile] + params
+                    times   = sorted(Run([sys.executable] + command) for i in range(runs))
+
+                    modulesFile = os.path.join(tempDir, "modules.json")
+                    Run([sys.executable, "-c", LOADED_MODULES, modulesFile] + command)
+                    with open(modulesFile) as f:
+                        modules = json.load(f)
+
+                    heavy = [module for module in HEAVY_MODULES if module in modules]
+                    results[name] = { "median":  times[len(times) // 2],
+                                      "modules": len(modules),
+                                      "heavy":   heavy }
+                    self.logger.info("startup,%s,%s runs,median %.1f ms,min %.1f ms,%s modules,heavy: %s"
+                                     % (name, runs, times[len(times) // 2] * 1000, times[0] * 1000,
+                                        len(modules), " ".join(heavy) or "none"))
+
+                # The same mktorrent jobs, one process each then one worker
+                jobLines = ["mktorrent %s %s http://127.0.0.1:1/announce\n"
+                            % (source, os.path.join(tempDir, "job-%s.torrent" % i)) for i in range(jobs)]
+                start = time.time()
+                for line in jobLines:
+                    Run([sys.executable, script, "-o", logFile] + line.split())
+                perProcess = (time.time() - start) / jobs
+
+                jobsFile = os.path.join(tempDir, "jobs")
+                with open(jobsFile, "w") as f:
+                    f.writelines(jobLines)
+                with open(jobsFile) as f:
+                    perJob = Run([sys.executable, script, "-o", logFile, "worker"], stdin = f) / jobs
+
+                results["worker"] = { "perProcess": perProcess, "perJob": perJob }
+                self.logger.info("startup,worker,%s mktorrent jobs,%.1f ms per process,%.1f ms per worker job,%.1fx"
+                                 % (jobs, perProcess * 1000, perJob * 1000, perProcess / max(perJob, 1e-9)))
+            return results
+        finally:
+            tracker.shutdown()
+            shutil.rmtree(tempDir, True)
+
+    #############
+    # Benchmark suite
+    ###
+
+    def GenerateTree(self, root, fileCount, totalSize, sparseFrom = 256 * 1024 ** 2):
+        """ Creates fileCount files of random data adding up to totalSize """
+        """ bytes, at most 1000 per directory, returns the path to give to """
+        """ mktorrent: the file itself when there is only one. Files of """
+        """ sparseFrom bytes or more are sparse past their first MiB, so """
+        """ tens of GB fit anywhere and reading them measures the hashing """
+        block    = os.urandom(2**20)
+        fileSize = totalSize // fileCount
+        source   = os.path.join(root, "payload")
+        paths    = []
+
+        for i in range(fileCount):
+            size = fileSize + (totalSize % fileCount if i == 0 else 0)
+            if fileCount == 1:
+                path = source + ".bin"
+            else:
+                path = os.path.join(source, "d%03d" % (i // 1000), "f%06d.dat" % i)
+                if i % 1000 == 0:
+                    os.makedirs(os.path.dirname(path))
+
+            with open(path, "wb") as f:
+                if size >= sparseFrom:
+                    f.write(block)
+                    f.truncate(size)
+                else:
+                    for offset in range(0, size, len(block)):
+                        f.write(block[:size - offset])
+            paths.append(path)
+
+        return paths[0] if fileCount == 1 else source
+
+    def MeasureInChild(self, func):
+        """ Runs func in a forked child, returns what it returns (JSON """
+        """ serializable) along with the peak RSS of the child in KiB, """
+        """ which starts from the RSS of this process """
+        readFd, writeFd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(readFd)
+            try:
+                result = { "value": func() }
+            except Exception as e:
+                result = { "error": str(e) }
+            result["peakRssKiB"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            os.write(writeFd, json.dumps(result))
+            os._exit(0)
+
+        os.close(writeFd)
+        chunks = []
+        while True:
+            chunk = os.read(readFd, 65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        os.close(readFd)
+        os.waitpid(pid, 0)
+
+        result = json.loads("".join(chunks))
+        if "error" in result:
+            raise RuntimeError(result["error"])
+        return result["value"], result["peakRssKiB"]
+
+    def SuiteDataset(self, root, fileCount, totalSize, jobs):
+        """ Results for one synthetic dataset: mktorrent latency from the """
+        """ command line, GenInfoDict MB/s and peak RSS, bencode and """
+        """ bdecode ops/s on the resulting torrent """
+        label   = "%sf-%s" % (fileCount, SizeLabel(totalSize))
+        results = []
+        base    = { "dataset": label, "files": fileCount, "bytes": totalSize }
+
+        start = time.time()
+        source = self.GenerateTree(root, fileCount, totalSize)
+        self.logger.info("Generated [%s] in %.1f s" % (label, time.time() - start))
+
+        # End to end, interpreter start and imports included
+        torrentFile = os.path.join(root, "payload.torrent")
+        command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "pyBTclient.py"),
+                   "-o", os.path.join(root, "mktorrent.log"),
+                   "mktorrent", source, torrentFile, "http://127.0.0.1/announce", "-j", str(jobs)]
+        start = time.time()
+        subprocess.check_call(command)
+        results.append(dict(base, benchmark = "mktorrent", seconds = time.time() - start))
+
+        def GenInfo():
+            start = time.time()
+            Torrent(self.logger, jobs).GenInfoDict(source)
+            return time.time() - start
+
+        seconds, peakRss = self.MeasureInChild(GenInfo)
+        results.append(dict(base, benchmark = "geninfodict", seconds = seconds,
+                            MBps = totalSize / max(seconds, 1e-9) / 1e6, peakRssKiB = peakRss))
+
+        with open(torrentFile, "rb") as f:
+            content = f.read()
+        torrent = bdecode(content)
+        results.append(dict(base, benchmark = "bdecode", torrentBytes = len(content),
+                            opsPerSecond = self.Timeit(lambda: bdecode(content))))
+        results.append(dict(base, benchmark = "bencode", torrentBytes = len(content),
+                            opsPerSecond = self.Timeit(lambda: bencode(torrent))))
+
+        for result in results:
+            self.logger.info("suite,%s" % ",".join("%s=%s" % item for item in sorted(result.items())))
+        return results
+
+    def RunSuite(self, profile = "quick", jobs = 1, pushCount = 2000, workDir = None, outFile = None):
+        """ Runs every benchmark over the datasets of profile and writes """
+        """ the results as JSON to outFile (stdout when None), along with """
+        """ the commit and machine they were measured on """
+        report = { "profile":  profile,
+                   "started":  time.strftime("%Y-%m-%dT%H:%M:%S"),
+                   "commit":   None,
+                   "python":   platform.python_version(),
+                   "platform": platform.platform(),
+                   "cpus":     os.sysconf("SC_NPROCESSORS_ONLN"),
+                   "jobs":     jobs,
+                   "results":  [] }
+        try:
+            report["commit"] = subprocess.check_output(["git", "rev-parse", "HEAD"],
+                                                       cwd = os.path.dirname(os.path.abspath(__file__)),
+                                                       stderr = open(os.devnull, "w")).strip()
+        except (OSError, subprocess.CalledProcessError):
+            pass
+
+        for fileCount, totalSize in SUITE_PROFILES[profile]:
+            root = tempfile.mkdtemp(dir = workDir)
+            try:
+                report["results"].extend(self.SuiteDataset(root, fileCount, totalSize, jobs))
+            finally:
+                shutil.rmtree(root, True)
+
+        for mode, rate in sorted(self.TestPush(pushCount, max(jobs, 1)).items()):
+            report["results"].append({ "benchmark":      "push",
+                                       "mode":           mode,
+                                       "pushes":         pushCount,
+                                       "pushesPerSecond": rate })
+
+        if outFile:
+            with open(outFile, "w") as f:
+                json.dump(report, f, indent = 1, sort_keys = True)
+            self.logger.info("Wrote the results to [%s]" % outFile)
+        else:
+            print json.dumps(report, indent = 1, sort_keys = True)
+        return report
@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# **********
+# Filename:         BencodeUtils.py
+# Description:      Faster and streaming bencoding on top of the vendored bencode module
+# Author:           Marc Vieira Cardinal
+# Creation Date:    October 17, 2026
+# Revision Date:    October 17, 2026
+# Notes:
+#   bencode.py is kept as vendored, this module adds the single pass and
+#   lazy decoders, encoding of buffer and memoryview values, streamed
+#   encoding and the pybt_bdecode_seconds and pybt_bencode_seconds metrics.
+# **********
+
+
+# External imports
+import mmap
+import time
+from types import BufferType
+from collections import Mapping, Sequence
+
+
+# Application imports
+import bencode as vendored
+from bencode import BTFailure, encode_func
+from Metrics import registry
+
+
+BDECODE_SECONDS = registry.Histogram("pybt_bdecode_seconds", "Time to bdecode a value")
+BENCODE_SECONDS = registry.Histogram("pybt_bencode_seconds", "Time to bencode a value")
+
+
+def bdecode(x):
+    start = registry.enabled and time.time()
+    r = vendored.bdecode(x)
+    if start:
+        BDECODE_SECONDS.Observe(time.time() - start)
+    return r
+
+
+def bencode(x):
+    start = registry.enabled and time.time()
+    r = vendored.bencode(x)
+    if start:
+        BENCODE_SECONDS.Observe(time.time() - start)
+    return r
+
+
+# Single pass, non-recursive decoder over str, bytearray, memoryview or mmap.
+# String values stored under a dict key listed in views are returned as
+# zero-copy views over x (memoryview, or buffer for mmap) instead of copies.
+
+def scanner(x):
+    """ Returns (scan, view): scan is x or a str copy of it that supports """
+    """ find and str slices, view(start, n) is a zero-copy view into x """
+    if isinstance(x, (str, mmap.mmap)):
+        scan = x
+    else:
+        # bytearray and memoryview slices are not str, scan a str copy
+        # of the data while views still point into x itself
+        scan = str(x) if isinstance(x, bytearray) else x.tobytes()
+    if isinstance(x, mmap.mmap):
+        view = lambda start, n: buffer(x, start, n)
+    else:
+        xview = memoryview(x)
+        view = lambda start, n: xview[start:start + n]
+    return scan, view
+
+
+def bdecode_buffer(x, views = ()):
+    scan, view = scanner(x)
+
+    find      = scan.find
+    end       = len(scan)
+    stack     = []
+    push      = stack.append
+    pop       = stack.pop
+    container = None    # list or dict being filled, None at the top level
+    isDict    = False
+    key       = None    # dict key waiting for its value
+    f         = 0
+    try:
+        while True:
+            c = scan[f]
+
+            if '0' <= c <= '9':
+                colon = find(':', f)
+                if colon < 0 or (c == '0' and colon != f+1):
+                    raise ValueError
+                start = colon + 1
+                n = int(scan[f:colon])
+                f = start + n
+                if f > end:
+                    raise ValueError
+                if isDict and key is None:
+                    key = scan[start:f]
+                    continue
+                if key in views:
+                    v = view(start, n)
+                else:
+                    v = scan[start:f]
+            elif c == 'i':
+                newf = find('e', f)
+                if newf < 0:
+                    raise ValueError
+                v = int(scan[f+1:newf])
+                if scan[f+1] == '-':
+                    if scan[f+2] == '0':
+                        raise ValueError
+                elif scan[f+1] == '0' and newf != f+2:
+                    raise ValueError
+                f = newf + 1
+            elif c == 'l' or c == 'd':
+                push((container, isDict, key))
+                isDict    = c == 'd'
+                container = {} if isDict else []
+                key       = None
+                f += 1
+                continue
+            elif c == 'e' and container is not None and key is None:
+                v = container
+                container, isDict, key = pop()
+                f += 1
+            else:
+                raise ValueError
+
+            if container is None:
+                break
+            if isDict:
+                if key is None:
+                    raise ValueError
+                container[key] = v
+                key = None
+            else:
+                container.append(v)
+    except (IndexError, KeyError, ValueError, TypeError):
+        raise BTFailure("not a valid bencoded string")
+    if f != end:
+        raise BTFailure("invalid bencoded value (data after valid prefix)")
+    return v
+
+
+# Lazy decoding: containers are indexed on first access, only recording the
+# offsets of their direct children, and values are decoded when read.
+
+def skip_value(scan, f):
+    """ Returns the offset just past the value starting at f """
+    depth = 0
+    while True:
+        c = scan[f]
+        if '0' <= c <= '9':
+            colon = scan.find(':', f)
+            if colon < 0:
+                raise ValueError
+            f = colon + 1 + int(scan[f:colon])
+        elif c == 'i':
+            f = scan.find('e', f)
+            if f < 0:
+                raise ValueError
+            f += 1
+        elif c == 'l' or c == 'd':
+            depth += 1
+            f += 1
+        elif c == 'e' and depth:
+            depth -= 1
+            f += 1
+        else:
+            raise ValueError
+        if not depth:
+            if f > len(scan):
+                raise ValueError
+            return f
+
+
+class LazyValue(object):
+    """ Common part of LazyDict and LazyList, a container spanning """
+    """ scan[start:end] whose children are indexed on first access """
+
+    def __init__(self, scan, view, start, end):
+        self.scan  = scan
+        self.view  = view
+        self.start = start
+        self.end   = end
+        self.index = None
+
+    def raw(self, key = None):
+        """ Zero-copy view of the bencoded bytes of this container, """
+        """ or of one of its values, e.g. sha1(torrent.raw("info")) """
+        if key is None:
+            start, end = self.start, self.end
+        else:
+            start, end = self.spans()[key]
+        return self.view(start, end - start)
+
+    def spans(self):
+        if self.index is None:
+            try:
+                self.index = self.build_index()
+            except (IndexError, ValueError):
+                raise BTFailure("not a valid bencoded string")
+        return self.index
+
+    def decode_at(self, start, end):
+        scan = self.scan
+        c = scan[start]
+        if c == 'd':
+            return LazyDict(scan, self.view, start, end)
+        if c == 'l':
+            return LazyList(scan, self.view, start, end)
+        return bdecode_buffer(scan[start:end])
+
+    def decode(self):
+        """ Fully decodes this container """
+        return bdecode_buffer(self.scan[self.start:self.end])
+
+
+class LazyDict(LazyValue, Mapping):
+
+    def build_index(self):
+        scan, index, f = self.scan, {}, self.start + 1
+        while scan[f] != 'e':
+            colon = scan.find(':', f)
+            if colon < 0 or not '0' <= scan[f] <= '9':
+                raise ValueError
+            f = colon + 1 + int(scan[f:colon])
+            key = scan[colon+1:f]
+            index[key] = (f, skip_value(scan, f))
+            f = index[key][1]
+        if f + 1 != self.end:
+            raise ValueError
+        return index
+
+    def __getitem__(self, key):
+        return self.decode_at(*self.spans()[key])
+
+    def __iter__(self):
+        return iter(self.spans())
+
+    def __len__(self):
+        return len(self.spans())
+
+
+class LazyList(LazyValue, Sequence):
+
+    def build_index(self):
+        scan, index, f = self.scan, [], self.start + 1
+        while scan[f] != 'e':
+            index.append((f, skip_value(scan, f)))
+            f = index[-1][1]
+        if f + 1 != self.end:
+            raise ValueError
+        return index
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.decode_at(*span) for span in self.spans()[i]]
+        return self.decode_at(*self.spans()[i])
+
+    def __len__(self):
+        return len(self.spans())
+
+
+def bdecode_lazy(x):
+    """ Returns a LazyDict or LazyList over x (str, bytearray, memoryview """
+    """ or mmap), scalars are decoded right away """
+    scan, view = scanner(x)
+    try:
+        c = scan[0]
+    except IndexError:
+        raise BTFailure("not a valid bencoded string")
+    if c == 'd':
+        return LazyDict(scan, view, 0, len(scan))
+    if c == 'l':
+        return LazyList(scan, view, 0, len(scan))
+    return bdecode_buffer(x)
+
+
+# Views are encoded as the strings they point to, also when nested in the
+# lists and dicts handled by the vendored encoders
+
+def encode_view(x, r):
+    x = str(x) if isinstance(x, buffer) else x.tobytes()
+    r.extend((str(len(x)), ':', x))
+
+encode_func[BufferType] = encode_view
+encode_func[memoryview] = encode_view
+
+
+class BencodeWriter(object):
+    """ Stands in for the fragment list of the encode functions and """
+    """ writes the fragments to out in chunks of about bufferSize bytes, """
+    """ strings larger than that are written through without joining """
+
+    __slots__ = ['out', 'bufferSize', 'parts', 'size']
+
+    def __init__(self, out, bufferSize):
+        self.out = out
+        self.bufferSize = bufferSize
+        self.parts = []
+        self.size = 0
+
+    def append(self, s):
+        if len(s) >= self.bufferSize:
+            self.flush()
+            self.out.write(s)
+            return
+        self.parts.append(s)
+        self.size += len(s)
+        if self.size >= self.bufferSize:
+            self.flush()
+
+    def extend(self, fragments):
+        for s in fragments:
+            self.append(s)
+
+    def flush(self):
+        if self.parts:
+            self.out.write(''.join(self.parts))
+            self.parts = []
+            self.size = 0
+
+
+def bencode_to(x, out, bufferSize = 65536):
+    """ Writes the bencoding of x to out, any object with a write method """
+    """ (file, socket.makefile(), BytesIO), without building it in memory """
+    start = registry.enabled and time.time()
+    r = BencodeWriter(out, bufferSize)
+    encode_func[type(x)](x, r)
+    r.flush()
+    if start:
+        BENCODE_SECONDS.Observe(time.time() - start)
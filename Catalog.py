@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# **********
+# Filename:         Catalog.py
+# Description:      A local SQLite catalog of the torrents we made or fetched
+# Author:           Marc Vieira Cardinal
+# Creation Date:    October 17, 2026
+# Revision Date:    October 17, 2026
+# **********
+
+
+# External imports
+import os
+import time
+import sqlite3
+import threading
+from hashlib import sha1, sha256
+
+
+# Application imports
+from BencodeUtils import bdecode_lazy
+
+
+def TorrentSummary(content):
+    """ Returns the info-hash (SHA-1, or truncated SHA-256 for v2 only """
+    """ torrents, as libtorrent does), the full v2 info-hash or None, the """
+    """ name, payload size, file count and piece length of a torrent """
+    torrent = bdecode_lazy(content)
+    info    = torrent["info"]
+    raw     = info.raw()
+
+    infoHashV2 = sha256(raw).hexdigest() if info.get("meta version") == 2 else None
+    infoHash   = sha1(raw).hexdigest() if "pieces" in info else infoHashV2[:40]
+
+    if "files" in info:
+        files = [f for f in info["files"].decode() if "p" not in f.get("attr", "")]
+        sizes = [f["length"] for f in files]
+    elif "length" in info:
+        sizes = [info["length"]]
+    else:
+        sizes = []
+        nodes = [info["file tree"].decode()]
+        while nodes:
+            node = nodes.pop()
+            for name, child in node.items():
+                if name == "":
+                    sizes.append(child["length"])
+                else:
+                    nodes.append(child)
+
+    return { "infoHash":    infoHash,
+             "infoHashV2":  infoHashV2,
+             "name":        info["name"],
+             "size":        sum(sizes),
+             "fileCount":   len(sizes),
+             "pieceLength": info["piece length"] }
+
+
+class Catalog():
+    """ Torrent files stored in SQLite with their info-hash, key, name and """
+    """ size, so that a key is served without asking the tracker and a """
+    """ torrent is found by any of those """
+
+    COLUMNS = ("infoHash", "infoHashV2", "fileKey", "name", "size",
+               "fileCount", "pieceLength", "torrentFile", "added")
+
+    def __init__(self, logger, dbFile):
+        self.logger      = logger.getChild(__name__)
+        self.lock        = threading.Lock()
+        self.hits        = 0
+        self.misses      = 0
+        self.added       = 0
+
+        self.db = sqlite3.connect(dbFile, check_same_thread = False)
+        self.db.text_factory = str
+        self.db.execute("""CREATE TABLE IF NOT EXISTS torrents (
+                               infoHash    TEXT    PRIMARY KEY,
+                               infoHashV2  TEXT,
+                               fileKey     TEXT,
+                               name        TEXT    NOT NULL,
+                               size        INTEGER NOT NULL,
+                               fileCount   INTEGER NOT NULL,
+                               pieceLength INTEGER NOT NULL,
+                               torrentFile TEXT,
+                               added       REAL    NOT NULL,
+                               content     BLOB    NOT NULL)""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS torrents_infoHashV2 ON torrents (infoHashV2)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS torrents_fileKey ON torrents (fileKey)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS torrents_name ON torrents (name)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS torrents_size ON torrents (size)")
+        self.db.commit()
+
+    def Row(self, content, fileKey, torrentFile):
+        summary = TorrentSummary(content)
+        return (summary["infoHash"], summary["infoHashV2"], fileKey, summary["name"],
+                summary["size"], summary["fileCount"], summary["pieceLength"],
+                torrentFile, time.time(), sqlite3.Binary(content))
+
+    def Add(self, content, fileKey = None, torrentFile = None):
+        """ Records a bencoded torrent, replacing any with the same """
+        """ info-hash, returns its info-hash """
+        row = self.Row(content, fileKey, torrentFile)
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO torrents VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row)
+            self.db.commit()
+            self.added += 1
+        self.logger.debug("Added [%s] as [%s]" % (row[0], fileKey))
+        return row[0]
+
+    def AddFile(self, torrentFile, fileKey = None):
+        with open(torrentFile, "rb") as f:
+            return self.Add(f.read(), fileKey, os.path.abspath(torrentFile))
+
+    def Import(self, paths, keyFromName = True, batchSize = 1000):
+        """ Loads every .torrent file under paths (files or directories), """
+        """ keyed by their file name without .torrent unless keyFromName """
+        """ is False, one transaction per batchSize torrents. Torrents """
+        """ already in the catalog keep their key. Returns the number of """
+        """ torrents imported and of files that failed """
+        def TorrentFiles():
+            for path in paths:
+                if os.path.isfile(path):
+                    yield path
+                    continue
+                for dirPath, dirNames, fileNames in os.walk(path):
+                    dirNames.sort()
+                    for fileName in sorted(fileNames):
+                        if fileName.endswith(".torrent"):
+                            yield os.path.join(dirPath, fileName)
+
+        imported, failed, rows = 0, 0, []
+        for torrentFile in TorrentFiles():
+            fileKey = None
+            if keyFromName:
+                fileKey = os.path.basename(torrentFile)
+                if fileKey.endswith(".torrent"):
+                    fileKey = fileKey[:-len(".torrent")]
+            try:
+                with open(torrentFile, "rb") as f:
+                    rows.append(self.Row(f.read(), fileKey, os.path.abspath(torrentFile)))
+            except Exception as e:
+                self.logger.warning("Skipping [%s]: %s" % (torrentFile, e))
+                failed += 1
+                continue
+
+            if len(rows) == batchSize:
+                imported += self.InsertMany(rows)
+                rows = []
+
+        imported += self.InsertMany(rows)
+        self.logger.info("Imported %s torrents, %s failed" % (imported, failed))
+        return imported, failed
+
+    def InsertMany(self, rows):
+        with self.lock:
+            before = self.db.total_changes
+            self.db.executemany("INSERT OR IGNORE INTO torrents VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self.db.commit()
+            inserted = self.db.total_changes - before
+            self.added += inserted
+        return inserted
+
+    def Content(self, where, value):
+        with self.lock:
+            row = self.db.execute("SELECT content FROM torrents WHERE %s = ? ORDER BY added DESC LIMIT 1"
+                                  % where, (value,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return str(row[0])
+
+    def ByKey(self, fileKey):
+        """ Returns the torrent content last stored under fileKey, or None """
+        return self.Content("fileKey", fileKey)
+
+    def ByInfoHash(self, infoHash):
+        """ Returns the torrent content for a hex v1 (or truncated v2) """
+        """ info-hash or a full v2 one, or None """
+        infoHash = infoHash.lower()
+        return self.Content("infoHashV2" if len(infoHash) == 64 else "infoHash", infoHash)
+
+    def Find(self, name = None, minSize = None, maxSize = None, limit = 100):
+        """ Returns dicts of the torrents whose name matches the SQL LIKE """
+        """ pattern name, within [minSize, maxSize] bytes, newest first """
+        clauses, params = [], []
+        if name is not None:
+            clauses.append("name LIKE ?")
+            params.append(name)
+        if minSize is not None:
+            clauses.append("size >= ?")
+            params.append(minSize)
+        if maxSize is not None:
+            clauses.append("size <= ?")
+            params.append(maxSize)
+
+        query = "SELECT %s FROM torrents" % ", ".join(self.COLUMNS)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY added DESC LIMIT ?"
+
+        with self.lock:
+            rows = self.db.execute(query, params + [limit]).fetchall()
+        return [dict(zip(self.COLUMNS, row)) for row in rows]
+
+    def Stats(self):
+        with self.lock:
+            count, size = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM torrents").fetchone()
+        return { "torrents": count,
+                 "bytes":    size,
+                 "hits":     self.hits,
+                 "misses":   self.misses,
+                 "added":    self.added }
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# **********
+# Filename:         ContentStore.py
+# Description:      Content addressed store of downloaded payloads, for deduplication
+# Author:           Marc Vieira Cardinal
+# Creation Date:    October 17, 2026
+# Revision Date:    October 17, 2026
+# Resources:
+#   http://man7.org/linux/man-pages/man2/ioctl_ficlone.2.html
+# Layout (every entry is a hard link or reflink, never a copy):
+#   <storeDir>/infohash/<info-hash>/<payload as laid out by the torrent>
+#   <storeDir>/md5/<ab>/<md5sum>            -- files with an md5sum
+#   <storeDir>/sha256/<ab>/<pieces root>    -- v2 files, the root of their
+#                                              16 KiB block merkle tree
+#   The store must be on the filesystem of the download directories,
+#   links to other filesystems are skipped.
+#   A prefilled file that libtorrent finds bad is rewritten in place, so
+#   it is only hard linked once its pieces checked good against the new
+#   torrent, else reflinked or copied.
+# **********
+
+
+# External imports
+import io
+import os
+import errno
+import fcntl
+import shutil
+from hashlib import sha1, sha256
+from binascii import hexlify
+
+
+# Application imports
+from BencodeUtils import bdecode_lazy
+from Verifier import Verifier, PayloadRoot
+
+
+# linux/fs.h _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+
+def Reflink(src, dest):
+    """ Makes dest share the blocks of src (btrfs, xfs, ...), raises """
+    """ IOError when the filesystem cannot """
+    with io.open(src, "rb") as s:
+        with io.open(dest, "wb") as d:
+            try:
+                fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+            except IOError:
+                os.unlink(dest)
+                raise
+
+
+def PayloadFiles(info):
+    """ Returns the payload root relative to the download directory and """
+    """ a list of (path components, length, md5sum, pieces root) of the """
+    """ files of a torrent, pad files excluded, digests in hex or None """
+    root  = PayloadRoot(info)
+    files = {}
+    order = []
+
+    if "files" in info:
+        for f in info["files"]:
+            if "p" not in f.get("attr", ""):
+                order.append(tuple(f["path"]))
+                files[order[-1]] = [f["length"], f.get("md5sum"), None]
+    elif "length" in info:
+        order.append((info["name"],))
+        files[order[-1]] = [info["length"], info.get("md5sum"), None]
+
+    if "file tree" in info:
+        nodes = [((), info["file tree"])]
+        while nodes:
+            components, node = nodes.pop()
+            for name, child in node.items():
+                if name == "":
+                    if components not in files:
+                        order.append(components)
+                    entry = files.setdefault(components, [child["length"], None, None])
+                    if "pieces root" in child:
+                        entry[2] = hexlify(child["pieces root"])
+                else:
+                    nodes.append((components + (name,), child))
+
+    return root, [(list(components),) + tuple(files[components]) for components in order]
+
+
+class ContentStore():
+    def __init__(self, logger, storeDir, linkMode = "auto"):
+        """
+        linkMode -- reflink, hardlink or auto: reflink when the filesystem
+                    can, so that the download and the store never share
+                    writes, else a hard link of a verified file
+        """
+        self.logger      = logger.getChild(__name__)
+        self.storeDir    = storeDir
+        self.linkMode    = linkMode
+        self.reflinks    = linkMode != "hardlink"
+
+        if not os.path.isdir(storeDir):
+            os.makedirs(storeDir)
+
+    def Load(self, torrentFile):
+        """ Returns the info-hash (v1, else truncated v2), payload root """
+        """ and files of torrentFile """
+        with io.open(torrentFile, "rb") as f:
+            torrent = bdecode_lazy(f.read())
+        raw  = torrent.raw("info")
+        info = torrent["info"].decode()
+        if "pieces" in info:
+            infoHash = sha1(raw).hexdigest()
+        else:
+            infoHash = sha256(raw).hexdigest()[:40]
+        root, files = PayloadFiles(info)
+        return infoHash, root, files
+
+    def Keys(self, infoHash, root, components, md5sum, piecesRoot):
+        """ The store paths of a file, most specific first """
+        keys = [os.path.join(self.storeDir, "infohash", infoHash, *(root + components))]
+        if md5sum:
+            keys.append(os.path.join(self.storeDir, "md5", md5sum[:2], md5sum))
+        if piecesRoot:
+            keys.append(os.path.join(self.storeDir, "sha256", piecesRoot[:2], piecesRoot))
+        return keys
+
+    def Link(self, src, dest, hardlink = True):
+        """ Reflinks src to dest, else hard links it when hardlink is set, """
+        """ returns False when neither is possible (other filesystem, no """
+        """ permission) """
+        parent = os.path.dirname(dest)
+        if not os.path.isdir(parent):
+            os.makedirs(parent)
+
+        if self.reflinks:
+            try:
+                Reflink(src, dest)
+                return True
+            except IOError as e:
+                if e.errno == errno.EXDEV:
+                    # This store file only, on another filesystem
+                    self.logger.warning("Cannot link [%s] to [%s]: %s" % (src, dest, e))
+                    return False
+                if self.linkMode == "reflink" or e.errno not in (errno.EOPNOTSUPP, errno.ENOTTY,
+                                                                 errno.EINVAL):
+                    self.logger.warning("Cannot reflink [%s] to [%s]: %s" % (src, dest, e))
+                    return False
+                # No reflinks on this filesystem, hard links from now on
+                self.reflinks = False
+
+        if not hardlink:
+            return False
+        try:
+            os.link(src, dest)
+            return True
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                self.logger.warning("Cannot link [%s] to [%s]: %s" % (src, dest, e))
+            return False
+
+    def Prefill(self, torrentFile, destPath):
+        """ Links into destPath every missing file of the torrent found in """
+        """ the store with the right length. Returns (files linked, bytes """
+        """ linked, complete, verified), complete == every file is now """
+        """ there, verified == and every one checked good already """
+        infoHash, root, files = self.Load(torrentFile)
+        linked, linkedBytes, complete = 0, 0, True
+        hardlinked = {}    # dest -> store file, until their pieces are checked
+        unverified = 0
+
+        for components, length, md5sum, piecesRoot in files:
+            dest = os.path.join(destPath, *(root + components))
+            if os.path.exists(dest):
+                complete = complete and os.path.getsize(dest) == length
+                unverified += 1
+                continue
+            if not length:
+                if not os.path.isdir(os.path.dirname(dest)):
+                    os.makedirs(os.path.dirname(dest))
+                io.open(dest, "wb").close()
+                continue
+
+            for key in self.Keys(infoHash, root, components, md5sum, piecesRoot):
+                if not os.path.isfile(key) or os.path.getsize(key) != length:
+                    continue
+                if self.Link(key, dest, hardlink = False):
+                    unverified += 1
+                elif self.linkMode != "reflink" and self.Link(key, dest):
+                    hardlinked[dest] = key
+                else:
+                    continue
+                linked      += 1
+                linkedBytes += length
+                break
+            else:
+                complete = False
+
+        if hardlinked:
+            good = Verifier(self.logger).GoodFiles(torrentFile, destPath, hardlinked)
+            for dest, key in hardlinked.items():
+                if dest not in good:
+                    # libtorrent would fix it through every link to the inode
+                    os.unlink(dest)
+                    shutil.copyfile(key, dest)
+                    unverified += 1
+            self.logger.info("%s of %s hard linked files of [%s] checked good%s"
+                             % (len(good), len(hardlinked), infoHash,
+                                "" if len(good) == len(hardlinked) else ", the others copied"))
+
+        verified = complete and not unverified
+        self.logger.info("Linked %s files, %s bytes of [%s] from the store%s"
+                         % (linked, linkedBytes, infoHash,
+                            ", verified" if verified else ", complete" if complete else ""))
+        return linked, linkedBytes, complete, verified
+
+    def Register(self, torrentFile, destPath):
+        """ Links the downloaded (and checked) payload into the store, """
+        """ existing entries are kept. Returns the number of links added """
+        infoHash, root, files = self.Load(torrentFile)
+        added = 0
+
+        for components, length, md5sum, piecesRoot in files:
+            src = os.path.join(destPath, *(root + components))
+            if not length or not os.path.isfile(src):
+                continue
+            for key in self.Keys(infoHash, root, components, md5sum, piecesRoot):
+                if not os.path.exists(key) and self.Link(src, key):
+                    added += 1
+
+        self.logger.info("Registered [%s] in the store, %s new links" % (infoHash, added))
+        return added
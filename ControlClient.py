@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# **********
+# Filename:         ControlClient.py
+# Description:      Client side of the session manager control socket
+# Author:           Marc Vieira Cardinal
+# Creation Date:    October 17, 2026
+# Revision Date:    October 17, 2026
+# Notes:
+#   Kept apart from SessionManager so that daemonctl does not load
+#   libtorrent or requests to send one line over a unix socket.
+# **********
+
+
+# External imports
+import socket
+
+
+def SendCommand(controlSocket, line):
+    """ Sends one command line to a running session manager, returns the reply """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(controlSocket)
+    sock.sendall(line.strip() + "\n")
+    sock.shutdown(socket.SHUT_WR)
+
+    reply = []
+    while True:
+        data = sock.recv(4096)
+        if not data:
+            break
+        reply.append(data)
+    sock.close()
+    return "".join(reply)
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*- 
+
+# **********
+# Filename:         HashCache.py
+# Description:      A persistent piece hash cache for incremental re-indexing
+# Author:           Marc Vieira Cardinal
+# Creation Date:    October 17, 2026
+# Revision Date:    October 17, 2026
+# **********
+
+
+# External imports
+import time
+import sqlite3
+import threading
+
+
+class HashCache():
+    """ Piece hashes stored in SQLite, keyed by (path, piece length) and """
+    """ validated against the (size, mtime, inode) of the file. Entries are """
+    """ evicted least recently used first once maxBytes of pieces is reached. """
+
+    HIT    = "hit"
+    APPEND = "append"
+    MISS   = "miss"
+
+    def __init__(self, logger, dbFile, maxBytes = 256 * 1024 * 1024):
+        self.logger      = logger.getChild(__name__)
+        self.maxBytes    = maxBytes
+        self.lock        = threading.Lock()
+        self.hits        = 0
+        self.appends     = 0
+        self.misses      = 0
+        self.evictions   = 0
+
+        self.db = sqlite3.connect(dbFile, check_same_thread = False)
+        self.db.text_factory = str
+        self.db.execute("""CREATE TABLE IF NOT EXISTS pieces (
+                               path        TEXT    NOT NULL,
+                               pieceLength INTEGER NOT NULL,
+                               size        INTEGER NOT NULL,
+                               mtime       REAL    NOT NULL,
+                               inode       INTEGER NOT NULL,
+                               md5sum      TEXT,
+                               prefixMd5   TEXT    NOT NULL,
+                               pieces      BLOB    NOT NULL,
+                               bytes       INTEGER NOT NULL,
+                               lastUsed    REAL    NOT NULL,
+                               PRIMARY KEY (path, pieceLength))""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS pieces_lastUsed ON pieces (lastUsed)")
+        self.db.commit()
+
+    def Lookup(self, path, pieceLength, st):
+        """ Returns (state, entry) where state is HIT when the file is """
+        """ unchanged, APPEND when it only grew on the same inode and """
+        """ MISS otherwise; entry is a dict of the cached row or None """
+        with self.lock:
+            row = self.db.execute("""SELECT size, mtime, inode, md5sum, prefixMd5, pieces
+                                     FROM pieces
+                                     WHERE path = ? AND pieceLength = ?""",
+                                  (path, pieceLength)).fetchone()
+            if row is None:
+                self.misses += 1
+                self.logger.debug("Lookup [%s,%s] -> %s" % (path, pieceLength, self.MISS))
+                return self.MISS, None
+
+            entry = { "size":      row[0],
+                      "mtime":     row[1],
+                      "inode":     row[2],
+                      "md5sum":    row[3],
+                      "prefixMd5": row[4],
+                      "pieces":    str(row[5]) }
+
+            if entry["inode"] != st.st_ino or entry["size"] > st.st_size:
+                state = self.MISS
+                self.misses += 1
+            elif entry["size"] == st.st_size and entry["mtime"] == st.st_mtime:
+                state = self.HIT
+                self.hits += 1
+            elif entry["size"] < st.st_size:
+                state = self.APPEND
+                self.appends += 1
+            else:
+                state = self.MISS
+                self.misses += 1
+
+            if state != self.MISS:
+                self.db.execute("UPDATE pieces SET lastUsed = ? WHERE path = ? AND pieceLength = ?",
+                                (time.time(), path, pieceLength))
+                self.db.commit()
+
+            self.logger.debug("Lookup [%s,%s] -> %s" % (path, pieceLength, state))
+            return state, (entry if state != self.MISS else None)
+
+    def Store(self, path, pieceLength, st, pieces, md5sum, prefixMd5):
+        """ prefixMd5 is the md5 hexdigest of the complete pieces only, """
+        """ it lets an appended file be validated without any SHA-1 """
+        with self.lock:
+            self.db.execute("""INSERT OR REPLACE INTO pieces
+                               (path, pieceLength, size, mtime, inode, md5sum, prefixMd5,
+                                pieces, bytes, lastUsed)
+                               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                            (path, pieceLength, st.st_size, st.st_mtime, st.st_ino,
+                             md5sum, prefixMd5, sqlite3.Binary(pieces), len(pieces), time.time()))
+            self.Evict()
+            self.db.commit()
+
+    def Evict(self):
+        """ Drops the least recently used entries until the cache fits in maxBytes, """
+        """ must be called with the lock held """
+        total = self.db.execute("SELECT COALESCE(SUM(bytes), 0) FROM pieces").fetchone()[0]
+        if total <= self.maxBytes:
+            return
+
+        for path, pieceLength, size in self.db.execute("""SELECT path, pieceLength, bytes
+                                                          FROM pieces
+                                                          ORDER BY lastUsed""").fetchall():
+            if total <= self.maxBytes:
+                break
+            self.db.execute("DELETE FROM pieces WHERE path = ? AND pieceLength = ?",
+                            (path, pieceLength))
+            total -= size
+            self.evictions += 1
+
+    def Stats(self):
+        return { "hits":      self.hits,
+                 "appends":   self.appends,
+                 "misses":    self.misses,
+                 "evictions": self.evictions }
+
+    def close(self):
+        with self.lock:
+            self.db.close()
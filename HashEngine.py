@@ -0,0 +1,350 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*- 
+
+# **********
+# Filename:         HashEngine.py
+# Description:      Piece hashing engine with an optional worker pool
+# Author:           Marc Vieira Cardinal
+# Creation Date:    October 17, 2026
+# Revision Date:    October 17, 2026
+# Resources:
+#   https://docs.python.org/2/library/hashlib.html
+#   (hashlib releases the GIL while hashing buffers larger than 2047 bytes)
+# **********
+
+
+# External imports
+import io
+import os
+import time
+import tempfile
+from collections import deque
+from hashlib import md5, sha1, sha256
+from multiprocessing.pool import ThreadPool
+
+
+# Application imports
+from Metrics import registry
+
+
+# BEP 52 merkle trees are built over 16 KiB blocks
+BLOCK_SIZE = 16384
+ZERO_HASH  = "\0" * 32
+
+
+READ_BYTES    = registry.Counter("pybt_read_bytes_total",
+                                 "Payload bytes read for hashing")
+HASHED_BYTES  = registry.Counter("pybt_hashed_bytes_total",
+                                 "Bytes run through the piece hashes")
+PIECE_SECONDS = registry.Histogram("pybt_piece_hash_seconds",
+                                   "Time to hash one piece")
+
+
+def PieceDigest(piece):
+    return sha1(piece).digest()
+
+
+def TimedPieceDigest(piece):
+    """ PieceDigest recording its latency, only used with metrics enabled """
+    start  = time.time()
+    digest = sha1(piece).digest()
+    PIECE_SECONDS.Observe(time.time() - start)
+    HASHED_BYTES.Inc(len(piece))
+    return digest
+
+
+def MerkleRoot(nodes, width, padHash = ZERO_HASH):
+    """ Root of a binary SHA-256 tree over nodes, padded up to width """
+    """ (a power of two) with padHash, doubled up at each level """
+    layer = list(nodes)
+    while width > 1:
+        if len(layer) % 2:
+            layer.append(padHash)
+        layer = [sha256(layer[i] + layer[i + 1]).digest()
+                 for i in range(0, len(layer), 2)]
+        padHash = sha256(padHash + padHash).digest()
+        width //= 2
+    return layer[0]
+
+
+def PadHash(width):
+    """ Root of a tree of width zero leaves """
+    padHash = ZERO_HASH
+    while width > 1:
+        padHash = sha256(padHash + padHash).digest()
+        width //= 2
+    return padHash
+
+
+def NextPowerOfTwo(n):
+    width = 1
+    while width < n:
+        width *= 2
+    return width
+
+
+class MultiFileReader():
+    """ A read-only stream over the concatenation of several files. """
+    """ Only one file is open at a time, files are opened on first read """
+    """ and closed as soon as their declared length has been consumed. """
+    """ A md5 hexdigest of each file is collected in md5sums on the way. """
+
+    def __init__(self, files, bufferSize = 2**20):
+        """
+        files      -- list of (path, length) tuples, in stream order
+        bufferSize -- read buffer for each underlying file
+        """
+        self.files      = files
+        self.bufferSize = bufferSize
+        self.md5sums    = []
+        self.index      = 0
+        self.current    = None
+        self.remaining  = 0
+        self.md5sum     = None
+
+    def OpenNext(self):
+        path, length = self.files[self.index]
+        self.current   = io.open(path, "rb", buffering = self.bufferSize)
+        self.remaining = length
+        self.md5sum    = md5()
+
+    def CloseCurrent(self):
+        self.current.close()
+        self.current = None
+        self.md5sums.append(self.md5sum.hexdigest())
+        self.index += 1
+
+    def readinto(self, view):
+        """ Reads up to len(view) bytes, stopping at file boundaries """
+        while self.index < len(self.files):
+            if self.current is None:
+                self.OpenNext()
+
+            if self.remaining:
+                n = self.current.readinto(view[:min(len(view), self.remaining)])
+                if not n:
+                    raise IOError("[%s] is shorter than its expected length"
+                                  % self.files[self.index][0])
+                self.md5sum.update(view[:n])
+                self.remaining -= n
+                return n
+
+            self.CloseCurrent()
+
+        return 0
+
+    def close(self):
+        if self.current is not None:
+            self.current.close()
+            self.current = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class LimitedReader():
+    """ Exposes at most length bytes of fileObj through readinto """
+
+    def __init__(self, fileObj, length):
+        self.fileObj   = fileObj
+        self.remaining = length
+
+    def readinto(self, view):
+        if not self.remaining:
+            return 0
+        n = self.fileObj.readinto(view[:min(len(view), self.remaining)])
+        self.remaining -= n or 0
+        return n
+
+
+class HashEngine():
+    def __init__(self, logger, jobs = 1):
+        self.logger      = logger.getChild(__name__)
+        self.jobs        = max(1, int(jobs))
+
+    def ReadInto(self, fileObj, view):
+        """ Fills view from fileObj, returns the number of bytes read, """
+        """ which is only smaller than the view at the end of the stream """
+        filled = 0
+        while filled < len(view):
+            n = fileObj.readinto(view[filled:])
+            if not n:
+                break
+            filled += n
+        return filled
+
+    def ReadPieces(self, fileObj, pieceLength):
+        """ Yields successive pieces of fileObj as memoryviews """
+        """ over a single reused buffer of pieceLength bytes, """
+        """ the view is only valid until the next iteration """
+        view  = memoryview(bytearray(pieceLength))
+        count = registry.enabled
+
+        while True:
+            filled = self.ReadInto(fileObj, view)
+            if not filled:
+                return
+            if count:
+                READ_BYTES.Inc(filled)
+
+            yield view[:filled]
+
+            if filled < pieceLength:
+                return
+
+    def UpdateMd5(self, fileObj, length, md5sum, chunkSize = 2**20):
+        """ Feeds the next length bytes of fileObj to md5sum only """
+        view = memoryview(bytearray(min(chunkSize, length) or 1))
+        while length:
+            n = self.ReadInto(fileObj, view[:min(len(view), length)])
+            if not n:
+                raise IOError("Unexpected end of stream")
+            md5sum.update(view[:n])
+            READ_BYTES.Inc(n)
+            length -= n
+
+    def HashFile(self, fileObj, pieceLength, withMd5 = True, md5sum = None):
+        """ Returns the concatenated SHA-1 piece digests and the md5 """
+        """ hexdigest (None unless withMd5) of everything readable from fileObj, """
+        """ md5sum may be an existing md5 object to continue from """
+        if self.jobs == 1:
+            return self.HashSerial(fileObj, pieceLength, withMd5, md5sum)
+        return self.HashParallel(fileObj, pieceLength, withMd5, md5sum)
+
+    def HashSerial(self, fileObj, pieceLength, withMd5 = True, md5sum = None):
+        pieces = []
+        md5sum = md5sum or (md5() if withMd5 else None)
+        digest = TimedPieceDigest if registry.enabled else PieceDigest
+        for piece in self.ReadPieces(fileObj, pieceLength):
+            pieces.append(digest(piece))
+            if md5sum:
+                md5sum.update(piece)
+
+        return "".join(pieces), md5sum and md5sum.hexdigest()
+
+    def HashParallel(self, fileObj, pieceLength, withMd5 = True, md5sum = None):
+        """ Pieces are read sequentially into a ring of buffers and hashed """
+        """ by the pool, the md5 runs on the reading thread meanwhile. """
+        """ At most two pieces per job are held in memory at once. """
+        window  = self.jobs * 2
+        buffers = [memoryview(bytearray(pieceLength)) for i in range(window)]
+        pending = deque()
+        pieces  = []
+        md5sum  = md5sum or (md5() if withMd5 else None)
+        digest  = TimedPieceDigest if registry.enabled else PieceDigest
+        count   = registry.enabled
+
+        pool = ThreadPool(self.jobs)
+        try:
+            index = 0
+            while True:
+                # Wait on the oldest piece before reusing its buffer
+                if len(pending) == window:
+                    pieces.append(pending.popleft().get())
+
+                view = buffers[index % window]
+                filled = self.ReadInto(fileObj, view)
+                if not filled:
+                    break
+                if count:
+                    READ_BYTES.Inc(filled)
+
+                piece = view[:filled]
+                pending.append(pool.apply_async(digest, (piece,)))
+                if md5sum:
+                    md5sum.update(piece)
+                index += 1
+
+                if filled < pieceLength:
+                    break
+
+            while pending:
+                pieces.append(pending.popleft().get())
+        finally:
+            pool.close()
+            pool.join()
+
+        return "".join(pieces), md5sum and md5sum.hexdigest()
+
+    def HashFileV2(self, fileObj, length, pieceLength, withV1 = False, withMd5 = False, padLast = True):
+        """ Hashes one file for BEP 52 in a single read pass, returns """
+        """ (piecesRoot, pieceLayer, v1Pieces, md5sum): piecesRoot is None """
+        """ for an empty file, pieceLayer is "" unless the file spans more """
+        """ than one piece. With withV1, v1Pieces holds the SHA-1 of each """
+        """ piece for hybrid torrents, where every file starts on a piece """
+        """ boundary: the last one is hashed as if zero padded to a full """
+        """ piece unless padLast is False (single file torrents). """
+        width      = pieceLength // BLOCK_SIZE
+        pieceNodes = []
+        v1Pieces   = []
+        md5sum     = md5() if withMd5 else None
+        leaves     = []
+        readLength = 0
+        timed      = registry.enabled
+
+        for piece in self.ReadPieces(LimitedReader(fileObj, length), pieceLength):
+            start = timed and time.time()
+            readLength += len(piece)
+            leaves = [sha256(piece[i:i + BLOCK_SIZE]).digest()
+                      for i in range(0, len(piece), BLOCK_SIZE)]
+            pieceNodes.append(MerkleRoot(leaves, width))
+
+            if withV1:
+                digest = sha1(piece)
+                if padLast and len(piece) < pieceLength:
+                    digest.update("\0" * (pieceLength - len(piece)))
+                v1Pieces.append(digest.digest())
+            if timed:
+                PIECE_SECONDS.Observe(time.time() - start)
+                HASHED_BYTES.Inc(len(piece))
+            if md5sum:
+                md5sum.update(piece)
+
+        if readLength != length:
+            raise IOError("File is shorter than its expected length")
+
+        if not pieceNodes:
+            piecesRoot, pieceLayer = None, ""
+        elif len(pieceNodes) == 1:
+            # A single piece tree only spans as many leaves as it needs
+            piecesRoot, pieceLayer = MerkleRoot(leaves, NextPowerOfTwo(len(leaves))), ""
+        else:
+            piecesRoot = MerkleRoot(pieceNodes, NextPowerOfTwo(len(pieceNodes)), PadHash(width))
+            pieceLayer = "".join(pieceNodes)
+
+        return piecesRoot, pieceLayer, "".join(v1Pieces), md5sum and md5sum.hexdigest()
+
+    def TestThroughput(self, totalSize, pieceLength = 2**20):
+        """ Compares the serial path against the worker pool """
+        """ on a synthetic file of totalSize bytes """
+        tempFile = tempfile.NamedTemporaryFile(delete = False)
+        try:
+            block = os.urandom(2**20)
+            for i in range(0, totalSize, len(block)):
+                tempFile.write(block[:totalSize - i])
+            tempFile.close()
+
+            results = {}
+            for jobs in sorted(set([1, self.jobs])):
+                engine = HashEngine(self.logger, jobs)
+
+                # Warm the page cache so both runs measure hashing only
+                with io.open(tempFile.name, "rb") as f:
+                    engine.HashFile(f, pieceLength)
+
+                start = time.time()
+                with io.open(tempFile.name, "rb") as f:
+                    results[jobs] = engine.HashFile(f, pieceLength)
+                elapsed = time.time() - start
+
+                self.logger.info("jobs=%s,%s bytes,%.3f s,%.1f MB/s"
+                                 % (jobs, totalSize, elapsed,
+                                    totalSize / max(elapsed, 1e-9) / 1e6))
+
+            if len(set(results.values())) != 1:
+                self.logger.error("Serial and parallel digests differ")
+        finally:
+            os.unlink(tempFile.name)
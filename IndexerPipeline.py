@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*- 
+
+# **********
+# Filename:         IndexerPipeline.py
+# Description:      Debounced, staged indexing pipeline for the autoindexer
+# Author:           Marc Vieira Cardinal
+# Creation Date:    October 17, 2026
+# Revision Date:    October 17, 2026
+# Stages:
+#   Submit()  -> pending events, coalesced per path until quiet for debounce seconds
+#   debouncer -> hashQueue (bounded) -> hash workers (makeTorrent)
+#             -> pushQueue (bounded) -> pusher (pushTorrents, in batches)
+#   Failed() lists the paths whose indexing or push failed since their
+#   last Submit, so they are not recorded as indexed
+# **********
+
+
+# External imports
+import os
+import time
+import Queue
+import tempfile
+import threading
+
+
+# Application imports
+from Metrics import registry
+
+
+class IndexerPipeline():
+    def __init__(self, logger, args, makeTorrent, pushTorrents):
+        """
+        makeTorrent  -- function(sourceFile, destFile), writes a torrent file
+        pushTorrents -- function([(fileKey, torrentFile), ...]), pushes a batch
+        """
+        self.logger       = logger.getChild(__name__)
+        self.makeTorrent  = makeTorrent
+        self.pushTorrents = pushTorrents
+        self.debounce     = args["debounce"]
+        self.hashWorkers  = args["hashWorkers"]
+        self.batchSize    = args["batchSize"]
+        self.flushTime    = args["flushInterval"]
+        self.statsTime    = args["statsInterval"]
+
+        self.lock         = threading.Lock()
+        self.pending      = {}    # path -> (deadline, fileKey)
+        self.failed       = set() # paths, until submitted again
+        self.hashQueue    = Queue.Queue(args["queueSize"])
+        self.pushQueue    = Queue.Queue(args["queueSize"])
+        self.stopping     = threading.Event()
+        self.threads      = []
+        self.counters     = { "events":    0,
+                              "coalesced": 0,
+                              "hashed":    0,
+                              "pushed":    0,
+                              "batches":   0,
+                              "errors":    0 }
+
+    def Count(self, name, n = 1):
+        with self.lock:
+            self.counters[name] += n
+
+    def Stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats["pending"] = len(self.pending)
+        stats["hashQueue"] = self.hashQueue.qsize()
+        stats["pushQueue"] = self.pushQueue.qsize()
+        return stats
+
+    #############
+    # Intake
+    ###
+
+    def Submit(self, path, fileKey):
+        """ Called from the inotify thread, never blocks on hashing or pushing """
+        with self.lock:
+            self.counters["events"] += 1
+            self.failed.discard(path)
+            if path in self.pending:
+                self.counters["coalesced"] += 1
+            self.pending[path] = (time.time() + self.debounce, fileKey)
+
+    #############
+    # Stages
+    ###
+
+    def Debouncer(self):
+        """ Moves the paths that stayed quiet for debounce seconds to the """
+        """ hash queue, blocking here (not in Submit) when it is full """
+        lastStats = time.time()
+        while True:
+            stopping = self.stopping.is_set()
+            now = time.time()
+            with self.lock:
+                ready = [(path, fileKey) for path, (deadline, fileKey) in self.pending.items()
+                         if stopping or deadline <= now]
+                for path, fileKey in ready:
+                    del self.pending[path]
+
+            for item in ready:
+                self.hashQueue.put(item)
+
+            if now - lastStats >= self.statsTime:
+                self.logger.info("Pipeline stats: %s" % self.Stats())
+                lastStats = now
+
+            if stopping:
+                break
+            # At least 10 ms, a zero debounce would spin
+            time.sleep(min(max(self.debounce, 0.01), 0.2))
+
+        for i in range(self.hashWorkers):
+            self.hashQueue.put(None)
+
+    def HashWorker(self):
+        while True:
+            item = self.hashQueue.get()
+            if item is None:
+                break
+
+            path, fileKey = item
+            tempFile = tempfile.NamedTemporaryFile(suffix = ".torrent", delete = False)
+            tempFile.close()
+            try:
+                self.makeTorrent(path, tempFile.name)
+            except Exception:
+                self.logger.exception("Indexing [%s] failed" % path)
+                self.MarkFailed([path])
+                os.unlink(tempFile.name)
+                continue
+
+            self.Count("hashed")
+            self.pushQueue.put((path, fileKey, tempFile.name))
+
+        self.pushQueue.put(None)
+
+    def Pusher(self):
+        """ Pushes batches of up to batchSize torrents, or whatever """
+        """ accumulated within flushInterval seconds """
+        workersLeft = self.hashWorkers
+        while workersLeft:
+            batch = []
+            flushAt = time.time() + self.flushTime
+            while len(batch) < self.batchSize:
+                try:
+                    item = self.pushQueue.get(timeout = max(0, flushAt - time.time()))
+                except Queue.Empty:
+                    break
+                if item is None:
+                    workersLeft -= 1
+                    if not workersLeft:
+                        break
+                    continue
+                batch.append(item)
+
+            if batch:
+                self.PushBatch(batch)
+
+    def PushBatch(self, batch):
+        try:
+            self.pushTorrents([(fileKey, torrentFile) for path, fileKey, torrentFile in batch])
+            self.Count("pushed", len(batch))
+            self.Count("batches")
+        except Exception:
+            self.logger.exception("Pushing %s torrents failed" % len(batch))
+            self.MarkFailed([path for path, fileKey, torrentFile in batch])
+        finally:
+            for path, fileKey, torrentFile in batch:
+                os.unlink(torrentFile)
+
+    def MarkFailed(self, paths):
+        with self.lock:
+            self.counters["errors"] += 1
+            self.failed.update(paths)
+
+    def Failed(self):
+        """ The paths whose last indexing or push failed """
+        with self.lock:
+            return set(self.failed)
+
+    #############
+    # Lifecycle
+    ###
+
+    def Start(self):
+        # Queue depths and counters, as pybt_indexer_* gauges
+        registry.Collect("pybt_indexer", self.Stats)
+
+        targets = [self.Debouncer, self.Pusher] + [self.HashWorker] * self.hashWorkers
+        for target in targets:
+            thread = threading.Thread(target = target)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def Stop(self):
+        """ Flushes the pending events through all the stages """
+        self.logger.info("Stopping, draining %s" % self.Stats())
+        self.stopping.set()
+        for thread in self.threads:
+            thread.join()
+        self.logger.info("Stopped, final %s" % self.Stats())
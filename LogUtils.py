@@ -11,32 +11,144 @@
 
 
 import sys
+import json
+import time
+import Queue
+import atexit
 import logging
+import threading
 from logging.handlers import TimedRotatingFileHandler
 
 
-def RotatingFile(tag, logLevel, logFile, foreground):
+class QueueHandler(logging.Handler):
+    """ Hands records to a bounded queue instead of writing them, the """
+    """ QueueListener thread does the disk and stdout writes. When the """
+    """ queue is full, policy "block" waits for room and "drop" discards """
+    """ the record, counting it in dropped. """
+
+    def __init__(self, queue, policy = "block"):
+        logging.Handler.__init__(self)
+        self.queue    = queue
+        self.block    = policy == "block"
+        self.dropped  = 0
+        self.listener = None
+
+    def prepare(self, record):
+        """ Formats the message and traceback on the calling thread, """
+        """ the arguments may not be safe to read later from another one """
+        record.msg  = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def emit(self, record):
+        try:
+            self.queue.put(self.prepare(record), self.block)
+        except Queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+
+class QueueListener():
+    """ Drains a QueueHandler queue into handlers from a daemon thread """
+
+    def __init__(self, queue, handlers):
+        self.queue    = queue
+        self.handlers = handlers
+        self.thread   = None
+
+    def Run(self):
+        while True:
+            record = self.queue.get()
+            if record is None:
+                return
+            for handler in self.handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+
+    def start(self):
+        self.thread = threading.Thread(target = self.Run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """ Writes out what is still queued, then stops the thread """
+        if self.thread:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+
+class JsonFormatter(logging.Formatter):
+    """ One JSON object per line, for log shippers, times in UTC """
+    converter = time.gmtime
+
+    def format(self, record):
+        entry = { "time":    self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + ".%03dZ" % record.msecs,
+                  "name":    record.name,
+                  "level":   record.levelname,
+                  "thread":  record.threadName,
+                  "message": record.getMessage() }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry)
+
+
+def RotatingFile(tag, logLevel, logFile, foreground, queueSize = 0, queuePolicy = "block", jsonFormat = False):
     """
-    logLevel   -- string,  one of NOTSET, DEBUG, INFO, WARNING, ERROR, CRITICAL
-    logFile    -- string,  path for a log file
-    foreground -- boolean, true == also log to stdout
+    logLevel    -- string,  one of NOTSET, DEBUG, INFO, WARNING, ERROR, CRITICAL
+    logFile     -- string,  path for a log file
+    foreground  -- boolean, true == also log to stdout
+    queueSize   -- integer, > 0 == write from a background thread, queueing
+                   up to queueSize records
+    queuePolicy -- string,  block or drop, what to do when the queue is full
+    jsonFormat  -- boolean, true == one JSON object per line
     """
 
     logLevel = logging.getLevelName(logLevel.upper())
     logger = logging.getLogger(tag)
     logger.setLevel(logLevel)
-    logFormatter = logging.Formatter('%(asctime)s,%(msecs)d %(name)s [%(levelname)s] %(message)s', "%Y-%m-%d %H:%M:%S")
+    if jsonFormat:
+        logFormatter = JsonFormatter()
+    else:
+        logFormatter = logging.Formatter('%(asctime)s,%(msecs)d %(name)s [%(levelname)s] %(message)s', "%Y-%m-%d %H:%M:%S")
+
+    handlers = []
 
     logFile = TimedRotatingFileHandler(logFile, "midnight")
     logFile.suffix = "%Y-%m-%d_%H:%M:%S"
     logFile.setFormatter(logFormatter)
     logFile.setLevel(logLevel)
-    logger.addHandler(logFile)
+    handlers.append(logFile)
 
     if foreground:
         logConsole = logging.StreamHandler(sys.stdout)
         logConsole.setFormatter(logFormatter)
         logConsole.setLevel(logLevel)
-        logger.addHandler(logConsole)
+        handlers.append(logConsole)
+
+    if queueSize > 0:
+        queue = Queue.Queue(queueSize)
+        logQueue = QueueHandler(queue, queuePolicy)
+        logQueue.setLevel(logLevel)
+        logger.addHandler(logQueue)
+
+        listener = QueueListener(queue, handlers)
+        listener.start()
+        logQueue.listener = listener
+
+        def Stop():
+            listener.stop()
+            if logQueue.dropped:
+                sys.stderr.write("%s log records dropped, the log queue was full\n" % logQueue.dropped)
+        atexit.register(Stop)
+    else:
+        for handler in handlers:
+            logger.addHandler(handler)
 
     return logger
@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# **********
+# Filename:         Metrics.py
+# Description:      Counters, gauges and histograms in the Prometheus text format
+# Author:           Marc Vieira Cardinal
+# Creation Date:    October 17, 2026
+# Revision Date:    October 17, 2026
+# Resources:
+#   https://prometheus.io/docs/instrumenting/exposition_formats/
+# Usage:
+#   Modules declare their metrics at import time from the shared registry,
+#   which stays disabled unless --metrics-port or --metrics-json is given.
+#   While disabled, Inc/Set/Observe return at once and Time() hands out a
+#   shared no-op timer; hot loops test registry.enabled once up front.
+# **********
+
+
+# External imports
+import json
+import time
+import threading
+
+
+# Seconds, from half a millisecond to a minute
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class NullTimer():
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+class Timer():
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.Observe(time.time() - self.start)
+
+
+class Metric():
+    kind = None
+
+    def __init__(self, registry, name, help):
+        self.registry = registry
+        self.name     = name
+        self.help     = help
+        self.lock     = threading.Lock()
+
+    def Header(self):
+        return ["# HELP %s %s" % (self.name, self.help),
+                "# TYPE %s %s" % (self.name, self.kind)]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, registry, name, help):
+        Metric.__init__(self, registry, name, help)
+        self.value = 0
+
+    def Inc(self, amount = 1):
+        if not self.registry.enabled:
+            return
+        with self.lock:
+            self.value += amount
+
+    def Render(self):
+        return self.Header() + ["%s %s" % (self.name, self.value)]
+
+    def Dump(self):
+        return self.value
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, registry, name, help):
+        Metric.__init__(self, registry, name, help)
+        self.value = 0
+
+    def Set(self, value):
+        if self.registry.enabled:
+            self.value = value
+
+    def Dump(self):
+        return self.value
+
+    def Render(self):
+        return self.Header() + ["%s %s" % (self.name, self.Dump())]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, registry, name, help, buckets = LATENCY_BUCKETS):
+        Metric.__init__(self, registry, name, help)
+        self.buckets = tuple(buckets)
+        self.counts  = [0] * (len(self.buckets) + 1)
+        self.sum     = 0.0
+
+    def Observe(self, value):
+        if not self.registry.enabled:
+            return
+        index = 0
+        while index < len(self.buckets) and value > self.buckets[index]:
+            index += 1
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def Time(self):
+        """ Context manager observing the seconds spent in its block """
+        return Timer(self) if self.registry.enabled else NULL_TIMER
+
+    def Dump(self):
+        with self.lock:
+            counts, total = list(self.counts), self.sum
+        cumulative, buckets = 0, []
+        for bound, count in zip(self.buckets + ("+Inf",), counts):
+            cumulative += count
+            buckets.append((bound, cumulative))
+        return { "buckets": buckets, "count": cumulative, "sum": total }
+
+    def Render(self):
+        dump  = self.Dump()
+        lines = self.Header()
+        for bound, cumulative in dump["buckets"]:
+            lines.append('%s_bucket{le="%s"} %s' % (self.name, bound, cumulative))
+        lines.append("%s_sum %s" % (self.name, repr(dump["sum"])))
+        lines.append("%s_count %s" % (self.name, dump["count"]))
+        return lines
+
+
+def MetricsHandler():
+    """ The request handler class, built on first use so that only the """
+    """ processes serving metrics load the HTTP server modules """
+    import BaseHTTPServer
+
+    class MetricsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+        """ /metrics in the Prometheus text format, /metrics.json as JSON """
+
+        def do_GET(self):
+            if self.path.split("?")[0] == "/metrics":
+                body, contentType = self.server.registry.Render(), "text/plain; version=0.0.4"
+            elif self.path.split("?")[0] == "/metrics.json":
+                body, contentType = json.dumps(self.server.registry.Dump()), "application/json"
+            else:
+                self.send_error(404)
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", contentType)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return MetricsHandler
+
+
+class Registry():
+    def __init__(self):
+        self.enabled    = False
+        self.lock       = threading.Lock()
+        self.metrics    = {}
+        self.collectors = {}
+        self.server     = None
+
+    def Get(self, cls, name, *args, **kwargs):
+        """ Returns the metric called name, created on first use so """
+        """ that several modules may share it """
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = cls(self, name, *args, **kwargs)
+            return self.metrics[name]
+
+    def Counter(self, name, help):
+        return self.Get(Counter, name, help)
+
+    def Gauge(self, name, help):
+        return self.Get(Gauge, name, help)
+
+    def Histogram(self, name, help, buckets = LATENCY_BUCKETS):
+        return self.Get(Histogram, name, help, buckets)
+
+    def Collect(self, prefix, func):
+        """ func returns a dict of numbers, each exported as the gauge """
+        """ <prefix>_<key> whenever the registry is rendered or dumped """
+        with self.lock:
+            self.collectors[prefix] = func
+
+    def Collected(self):
+        values = {}
+        with self.lock:
+            collectors = self.collectors.items()
+        for prefix, func in collectors:
+            for key, value in func().items():
+                values["%s_%s" % (prefix, key.replace(".", "_"))] = value
+        return values
+
+    def Render(self):
+        with self.lock:
+            metrics = sorted(self.metrics.items())
+        lines = []
+        for name, metric in metrics:
+            lines.extend(metric.Render())
+        for name, value in sorted(self.Collected().items()):
+            lines.append("# TYPE %s gauge" % name)
+            lines.append("%s %s" % (name, value))
+        return "\n".join(lines) + "\n"
+
+    def Dump(self):
+        with self.lock:
+            metrics = self.metrics.items()
+        dump = dict((name, metric.Dump()) for name, metric in metrics)
+        dump.update(self.Collected())
+        return dump
+
+    def DumpJson(self, path):
+        with open(path, "w") as f:
+            json.dump(self.Dump(), f, indent = 1, sort_keys = True)
+
+    def Serve(self, port, host = "127.0.0.1"):
+        """ Serves the metrics from a daemon thread until the process exits """
+        import BaseHTTPServer
+        self.server = BaseHTTPServer.HTTPServer((host, port), MetricsHandler())
+        self.server.registry = self
+
+        thread = threading.Thread(target = self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+
+registry = Registry()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*- 
+
+# **********
+# Filename:         PieceSize.py
+# Description:      Pluggable piece size selection policies
+# Author:           Marc Vieira Cardinal
+# Creation Date:    October 17, 2026
+# Revision Date:    October 17, 2026
+# Resources:
+#   http://www.libtorrent.org/reference-Create_Torrents.html
+#   (create_torrent picks the piece size for ~40 kB of piece hashes)
+# Policies, selected with a "name[:value]" spec:
+#   monotorrent    -- the Torrent.OptimalPieceSize ladder, 32 kB up to the max
+#   libtorrent     -- power of two giving about 2048 pieces, 16 kB up to the max
+#   fixed:<bytes>  -- always the same piece size, a power of two >= 16 kB
+#   count:<pieces> -- smallest power of two giving at most that many pieces
+# **********
+
+
+MIN_PIECE_SIZE = 16 * 1024
+MAX_PIECE_SIZE = 16 * 1024 * 1024
+
+
+class PiecePolicy():
+    def __init__(self, maxPieceSize = MAX_PIECE_SIZE):
+        self.maxPieceSize = maxPieceSize
+
+    def __call__(self, totalSize):
+        """ Returns (pieceSize, pieceCount) for totalSize bytes """
+        size = self.PieceSize(totalSize)
+        return size, max(1, (totalSize + size - 1) // size)
+
+    def PowerOfTwo(self, size, minSize = MIN_PIECE_SIZE):
+        """ Smallest power of two >= size, within [minSize, maxPieceSize] """
+        piece = minSize
+        while piece < size and piece < self.maxPieceSize:
+            piece *= 2
+        return piece
+
+    def __str__(self):
+        return self.__class__.__name__
+
+
+class MonoTorrentPolicy(PiecePolicy):
+    """ Torrent.OptimalPieceSize with a configurable maximum, it is """
+    """ identical to it with the default maximum of 4 MiB """
+
+    def __init__(self, maxPieceSize = 4 * 1024 * 1024):
+        PiecePolicy.__init__(self, maxPieceSize)
+
+    def __call__(self, totalSize):
+        size = 32768
+        while size < self.maxPieceSize:
+            pieces = int(totalSize / size) + 1
+            if (pieces * 20) < (60 * 1024):
+                return size, pieces
+            size *= 2
+
+        return self.maxPieceSize, int(totalSize / self.maxPieceSize) + 1
+
+
+class LibtorrentPolicy(PiecePolicy):
+    def PieceSize(self, totalSize):
+        return self.PowerOfTwo(totalSize / (40 * 1024 / 20))
+
+
+class FixedPolicy(PiecePolicy):
+    def __init__(self, pieceSize, maxPieceSize = MAX_PIECE_SIZE):
+        PiecePolicy.__init__(self, maxPieceSize)
+        self.pieceSize = pieceSize
+
+    def PieceSize(self, totalSize):
+        return self.pieceSize
+
+    def __str__(self):
+        return "FixedPolicy(%s)" % self.pieceSize
+
+
+class TargetCountPolicy(PiecePolicy):
+    def __init__(self, pieceCount, maxPieceSize = MAX_PIECE_SIZE):
+        PiecePolicy.__init__(self, maxPieceSize)
+        self.pieceCount = pieceCount
+
+    def PieceSize(self, totalSize):
+        return self.PowerOfTwo((totalSize + self.pieceCount - 1) // self.pieceCount)
+
+    def __str__(self):
+        return "TargetCountPolicy(%s)" % self.pieceCount
+
+
+POLICIES = ["monotorrent", "libtorrent", "fixed:<bytes>", "count:<pieces>"]
+
+
+def ValidPieceSize(size):
+    """ True for the piece sizes BitTorrent accepts, powers of two >= 16 kB """
+    return size >= MIN_PIECE_SIZE and not size & (size - 1)
+
+
+def NewPiecePolicy(spec, maxPieceSize = None):
+    """ Returns the policy for a "name[:value]" spec, see POLICIES, raises """
+    """ ValueError on a bad spec or maxPieceSize """
+    name, unused, value = spec.partition(":")
+    kwargs = {}
+    if maxPieceSize is not None:
+        if not ValidPieceSize(maxPieceSize):
+            raise ValueError("Max piece size [%s] is not a power of two of at least %s bytes"
+                             % (maxPieceSize, MIN_PIECE_SIZE))
+        kwargs["maxPieceSize"] = maxPieceSize
+
+    if name == "monotorrent" and not value:
+        return MonoTorrentPolicy(**kwargs)
+    if name == "libtorrent" and not value:
+        return LibtorrentPolicy(**kwargs)
+    if name == "fixed" and value.isdigit():
+        if not ValidPieceSize(int(value)):
+            raise ValueError("Fixed piece size [%s] is not a power of two of at least %s bytes"
+                             % (value, MIN_PIECE_SIZE))
+        return FixedPolicy(int(value), **kwargs)
+    if name == "count" and value.isdigit() and int(value):
+        return TargetCountPolicy(int(value), **kwargs)
+
+    raise ValueError("Unknown piece size policy [%s], expected one of %s" % (spec, POLICIES))
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*- 
+
+# **********
+# Filename:         ResumeData.py
+# Description:      Persistence of libtorrent fast-resume data
+# Author:           Marc Vieira Cardinal
+# Creation Date:    October 17, 2026
+# Revision Date:    October 17, 2026
+# Resources:
+#   http://www.rasterbar.com/products/libtorrent/manual.html#fast-resume
+# **********
+
+
+# External imports
+import os
+import time
+import libtorrent as lt
+
+
+class ResumeStore():
+    """ One <info-hash>.fastresume file per torrent in stateDir """
+
+    def __init__(self, logger, stateDir):
+        self.logger      = logger.getChild(__name__)
+        self.stateDir    = stateDir
+        self.pending     = set()
+
+        if not os.path.isdir(stateDir):
+            os.makedirs(stateDir)
+
+    def Path(self, infoHash):
+        return os.path.join(self.stateDir, "%s.fastresume" % infoHash)
+
+    def Load(self, infoHash):
+        """ Returns the bencoded resume data for infoHash or None """
+        try:
+            with open(self.Path(infoHash), "rb") as f:
+                data = f.read()
+        except IOError:
+            return None
+
+        self.logger.info("Loaded resume data for [%s]" % infoHash)
+        return data
+
+    def Discard(self, infoHash):
+        if os.path.exists(self.Path(infoHash)):
+            os.unlink(self.Path(infoHash))
+
+    def Save(self, infoHash, data):
+        """ Written to a temporary file then renamed, so a crash never """
+        """ leaves a truncated resume file behind """
+        path = self.Path(infoHash)
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.rename(path + ".tmp", path)
+        self.logger.debug("Saved resume data for [%s]" % infoHash)
+
+    def Request(self, handles, onlyIfNeeded = True):
+        """ Asks libtorrent for the resume data of handles, the answers """
+        """ arrive as alerts to be fed to HandleAlert """
+        for h in handles:
+            if not h.is_valid() or (onlyIfNeeded and not h.need_save_resume_data()):
+                continue
+            h.save_resume_data()
+            self.pending.add(str(h.info_hash()))
+
+    def HandleAlert(self, alert):
+        """ Returns True if the alert was a resume data answer """
+        if isinstance(alert, lt.save_resume_data_alert):
+            infoHash = str(alert.handle.info_hash())
+            self.Save(infoHash, lt.bencode(alert.resume_data))
+        elif isinstance(alert, lt.save_resume_data_failed_alert):
+            infoHash = str(alert.handle.info_hash())
+            self.logger.warning("Resume data for [%s] failed: %s" % (infoHash, alert.message()))
+        else:
+            return False
+
+        self.pending.discard(infoHash)
+        return True
+
+    def SaveAll(self, ses, handles, timeout = 30):
+        """ Requests and waits for the resume data of all handles, """
+        """ used on shutdown; other alerts are dropped """
+        self.Request(handles, onlyIfNeeded = False)
+
+        deadline = time.time() + timeout
+        while self.pending and time.time() < deadline:
+            ses.wait_for_alert(500)
+            for alert in ses.pop_alerts():
+                self.HandleAlert(alert)
+
+        if self.pending:
+            self.logger.warning("No resume data received for %s" % sorted(self.pending))
+            self.pending.clear()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*- 
+
+# **********
+# Filename:         Runtime.py
+# Description:      Single event loop driving downloads and indexing together
+# Author:           Marc Vieira Cardinal
+# Creation Date:    October 17, 2026
+# Revision Date:    October 17, 2026
+# Notes:
+#   The main thread multiplexes the inotify descriptor, the libtorrent
+#   alerts and the control socket commands. Hashing and tracker pushes
+#   run in the IndexerPipeline worker pools, transfers in libtorrent's
+#   own threads, so no concern ever blocks another one.
+# **********
+
+
+# External imports
+import errno
+import select
+
+
+class Runtime():
+    def __init__(self, logger, manager, pipeline, watcher, notifier, watchPaths, tick = 0.1):
+        """
+        manager      -- SessionManager, stepped without blocking
+        pipeline     -- IndexerPipeline fed by the watcher
+        watcher      -- TreeWatcher scanning and watching watchPaths, its
+                        watch manager's descriptor is selected on
+        notifier     -- pyinotify.Notifier reading and dispatching its events
+        tick         -- seconds between alert polls when nothing else happens
+        """
+        self.logger       = logger.getChild(__name__)
+        self.manager      = manager
+        self.pipeline     = pipeline
+        self.watcher      = watcher
+        self.notifier     = notifier
+        self.watchPaths   = watchPaths
+        self.tick         = tick
+
+    def Run(self):
+        self.pipeline.Start()
+        self.watcher.Start(self.watchPaths)
+        self.manager.Start()
+
+        inotifyFd = self.watcher.watchManager.get_fd()
+
+        self.logger.info("Main loop starting...")
+        try:
+            while self.manager.running:
+                try:
+                    readable, unused, unused = select.select([inotifyFd], [], [], self.tick)
+                except select.error as e:
+                    # A stop signal, the loop condition tells
+                    if e.args[0] != errno.EINTR:
+                        raise
+                    continue
+                if readable:
+                    self.notifier.read_events()
+                    self.notifier.process_events()
+
+                self.manager.Step(timeout = 0)
+        finally:
+            self.watcher.Stop()
+            self.pipeline.Stop()
+            self.manager.Shutdown()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# **********
+# Filename:         Scheduler.py
+# Description:      Priorities, rate limits and streaming on top of a libtorrent session
+# Author:           Marc Vieira Cardinal
+# Creation Date:    October 17, 2026
+# Revision Date:    October 17, 2026
+# Resources:
+#   http://www.rasterbar.com/products/libtorrent/reference-Core.html#torrent_handle
+#   http://www.rasterbar.com/products/libtorrent/streaming.html
+# Options (per torrent, name=value):
+#   priority=<n>         -- higher first, applied as the queue position
+#   down=<bytes/s>       -- download rate limit, 0 == none
+#   up=<bytes/s>         -- upload rate limit, 0 == none
+#   file:<glob>=<0..7>   -- priority of the files matching glob, 0 == skip
+#   pieces:<a>-<b>=<0..7> -- priority of the pieces a to b included
+#   stream=1             -- sequential, with deadlines on a read-ahead window
+#   readahead=<pieces>   -- pieces of the window, 8 by default
+#   deadline=<ms>        -- deadline step, piece k of the window is wanted
+#                           within (k + 1) * deadline ms, 1000 by default
+# **********
+
+
+# External imports
+import os
+import json
+import fnmatch
+
+
+DEFAULT_READ_AHEAD = 8
+DEFAULT_DEADLINE   = 1000
+
+
+def TorrentOptions(params):
+    """ Returns the options dict of a list of name=value strings, raises """
+    """ ValueError on an unknown or malformed one """
+    options = { "priority":        0,
+                "downloadLimit":   0,
+                "uploadLimit":     0,
+                "filePriorities":  [],
+                "piecePriorities": [],
+                "stream":          False,
+                "readAhead":       DEFAULT_READ_AHEAD,
+                "deadline":        DEFAULT_DEADLINE }
+
+    for param in params:
+        name, sep, value = param.rpartition("=")
+        if not sep or not name:
+            raise ValueError("Option [%s] is not name=value" % param)
+
+        if name.startswith("file:"):
+            options["filePriorities"].append((name[len("file:"):], Priority(value)))
+        elif name.startswith("pieces:"):
+            first, dash, last = name[len("pieces:"):].partition("-")
+            options["piecePriorities"].append((int(first), int(last or first), Priority(value)))
+        elif name == "priority":
+            options["priority"] = int(value)
+        elif name == "down":
+            options["downloadLimit"] = int(value)
+        elif name == "up":
+            options["uploadLimit"] = int(value)
+        elif name == "stream":
+            options["stream"] = value.lower() in ("1", "true", "yes", "on")
+        elif name == "readahead":
+            options["readAhead"] = max(1, int(value))
+        elif name == "deadline":
+            options["deadline"] = max(1, int(value))
+        else:
+            raise ValueError("Unknown torrent option [%s]" % name)
+
+    return options
+
+
+def Priority(value):
+    priority = int(value)
+    if not 0 <= priority <= 7:
+        raise ValueError("Priority [%s] is not within 0..7" % value)
+    return priority
+
+
+def IsPadFile(storage, index):
+    if hasattr(storage, "file_flags"):
+        return bool(storage.file_flags(index) & storage.flag_pad_file)
+    return ".pad" in storage.file_path(index).split(os.sep)
+
+
+class Stream():
+    """ The wanted files of a streamed torrent read head first: the """
+    """ missing pieces just past the downloaded head of the first """
+    """ unfinished file get deadlines, the rest follows sequentially """
+
+    def __init__(self, h, info, files, readAhead, deadline):
+        """
+        files -- indexes of the wanted files, in the order they are read
+        """
+        self.h         = h
+        self.readAhead = readAhead
+        self.deadline  = deadline
+        self.pending   = set()    # pieces with a deadline not yet downloaded
+
+        storage = info.files()
+        pieceLength = info.piece_length()
+        # (path, size, first piece, last piece, offset in its first piece)
+        self.files = []
+        for index in files:
+            offset, size = storage.file_offset(index), storage.file_size(index)
+            first = offset // pieceLength
+            last  = (offset + max(size, 1) - 1) // pieceLength
+            self.files.append((storage.file_path(index), size, first, last, offset - first * pieceLength))
+        self.pieceLength = pieceLength
+        self.heads       = [first for path, size, first, last, skip in self.files]
+
+    def Advance(self):
+        """ Moves every file head past its downloaded pieces """
+        for i, (path, size, first, last, skip) in enumerate(self.files):
+            while self.heads[i] <= last and self.h.have_piece(self.heads[i]):
+                self.heads[i] += 1
+
+    def Step(self):
+        """ Sets deadlines on the read-ahead window, returns how many """
+        """ pieces were given one """
+        self.Advance()
+        self.pending = set(piece for piece in self.pending if not self.h.have_piece(piece))
+
+        window = []
+        for i, (path, size, first, last, skip) in enumerate(self.files):
+            piece = self.heads[i]
+            while piece <= last and len(window) < self.readAhead:
+                if not self.h.have_piece(piece):
+                    window.append(piece)
+                piece += 1
+            if len(window) >= self.readAhead:
+                break
+
+        added = 0
+        for k, piece in enumerate(window):
+            if piece not in self.pending:
+                self.h.set_piece_deadline(piece, (k + 1) * self.deadline)
+                self.pending.add(piece)
+                added += 1
+        return added
+
+    def Available(self):
+        """ Returns {path: bytes readable from the start of the file} """
+        self.Advance()
+        available = {}
+        for i, (path, size, first, last, skip) in enumerate(self.files):
+            available[path] = max(0, min(size, (self.heads[i] - first) * self.pieceLength - skip))
+        return available
+
+
+class Scheduler():
+    def __init__(self, logger, ses, downloadLimit = 0, uploadLimit = 0):
+        """
+        downloadLimit -- bytes/s over the whole session, 0 == none
+        uploadLimit   -- bytes/s over the whole session, 0 == none
+        """
+        self.logger      = logger.getChild(__name__)
+        self.ses         = ses
+        self.torrents    = []     # (priority, sequence, handle)
+        self.streams     = {}     # handle -> Stream
+        self.sequence    = 0
+
+        if downloadLimit or uploadLimit:
+            ses.apply_settings({ "download_rate_limit": downloadLimit or 0,
+                                 "upload_rate_limit":   uploadLimit or 0 })
+
+    def Add(self, h, info, options):
+        """ Applies the options of TorrentOptions to a new torrent """
+        if options["downloadLimit"]:
+            h.set_download_limit(options["downloadLimit"])
+        if options["uploadLimit"]:
+            h.set_upload_limit(options["uploadLimit"])
+
+        if options["filePriorities"] or options["stream"]:
+            wanted = self.PrioritizeFiles(h, info, options["filePriorities"])
+        self.PrioritizePieces(h, info, options["piecePriorities"])
+
+        if options["stream"]:
+            h.set_sequential_download(True)
+            self.streams[h] = Stream(h, info, wanted, options["readAhead"], options["deadline"])
+            self.logger.info("Streaming [%s], %s pieces read ahead at %s ms per piece"
+                             % (h.name(), options["readAhead"], options["deadline"]))
+
+        self.sequence += 1
+        self.torrents.append((options["priority"], self.sequence, h))
+        if any(t[0] for t in self.torrents):
+            self.Reorder()
+
+    def Remove(self, h):
+        self.torrents = [t for t in self.torrents if t[2] != h]
+        self.streams.pop(h, None)
+
+    def PrioritizeFiles(self, h, info, filePriorities):
+        """ Sets the priority of the files matching each glob, the last """
+        """ match wins. Returns the indexes of the wanted files """
+        storage = info.files()
+        priorities = []
+        for index in range(storage.num_files()):
+            path     = storage.file_path(index)
+            priority = 4
+            for pattern, value in filePriorities:
+                if fnmatch.fnmatch(path, pattern) or fnmatch.fnmatch(os.path.basename(path), pattern):
+                    priority = value
+            priorities.append(priority)
+
+        if filePriorities:
+            h.prioritize_files(priorities)
+            self.logger.info("File priorities of [%s]: %s" % (h.name(), priorities))
+
+        return [index for index, priority in enumerate(priorities)
+                if priority and storage.file_size(index) and not IsPadFile(storage, index)]
+
+    def PrioritizePieces(self, h, info, piecePriorities):
+        if not piecePriorities:
+            return
+        priorities = list(h.piece_priorities())
+        for first, last, priority in piecePriorities:
+            for piece in range(max(0, first), min(last, info.num_pieces() - 1) + 1):
+                priorities[piece] = priority
+        h.prioritize_pieces(priorities)
+
+    def Update(self, h, params):
+        """ Changes the priority and rate limits of a torrent from """
+        """ priority, down and up name=value strings """
+        options = TorrentOptions(params)
+        names   = set(param.rpartition("=")[0] for param in params)
+        if names - set(("priority", "down", "up")):
+            raise ValueError("Only priority, down and up can be changed")
+
+        if "down" in names:
+            h.set_download_limit(options["downloadLimit"])
+        if "up" in names:
+            h.set_upload_limit(options["uploadLimit"])
+        if "priority" in names:
+            self.SetPriority(h, options["priority"])
+
+    def SetPriority(self, h, priority):
+        self.torrents = [(priority if t[2] == h else t[0], t[1], t[2]) for t in self.torrents]
+        self.Reorder()
+
+    def Reorder(self):
+        """ Queue positions follow the priorities, then the order of """
+        """ addition: libtorrent starts the first active_downloads """
+        self.torrents.sort(key = lambda t: (-t[0], t[1]))
+        for priority, sequence, h in self.torrents:
+            h.queue_position_bottom()
+
+    def Step(self):
+        for stream in self.streams.values():
+            stream.Step()
+
+    def Available(self, h):
+        stream = self.streams.get(h)
+        return stream.Available() if stream else {}
+
+    def WriteStatus(self, h, statusFile):
+        """ Writes {path: readable bytes} of a streamed torrent for its """
+        """ consumers, replaced atomically """
+        with open(statusFile + ".tmp", "w") as f:
+            json.dump(self.Available(h), f, sort_keys = True)
+        os.rename(statusFile + ".tmp", statusFile)
@@ -0,0 +1,345 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*- 
+
+# **********
+# Filename:         SessionManager.py
+# Description:      One libtorrent session shared by many torrents
+# Author:           Marc Vieira Cardinal
+# Creation Date:    October 17, 2026
+# Revision Date:    October 17, 2026
+# Resources:
+#   http://www.rasterbar.com/products/libtorrent/reference-Alerts.html
+#   http://www.rasterbar.com/products/libtorrent/reference-Settings.html
+# Control protocol (one command per line on the unix socket):
+#   add <torrentFile> [destPath] [option=value ...]
+#   addkey <fileKey> [destPath] [option=value ...]
+#                                  (from the catalog, else the tracker)
+#   set <infoHash> [priority=<n>] [down=<bytes/s>] [up=<bytes/s>]
+#   status
+#   quit
+#   The options are those of Scheduler.TorrentOptions
+# **********
+
+
+# External imports
+import os
+import time
+import Queue
+import signal
+import threading
+import SocketServer
+import libtorrent as lt
+
+
+# Application imports
+import Catalog
+import ResumeData
+import TrackerClient
+import SessionProfiles
+import Scheduler
+from Metrics import registry
+from ControlClient import SendCommand
+
+
+DOWNLOAD_RATE = registry.Gauge("pybt_download_rate_bytes",
+                               "Download rate over all torrents, bytes per second")
+UPLOAD_RATE   = registry.Gauge("pybt_upload_rate_bytes",
+                               "Upload rate over all torrents, bytes per second")
+PEERS         = registry.Gauge("pybt_peers",
+                               "Connected peers over all torrents")
+TORRENTS      = registry.Gauge("pybt_torrents",
+                               "Torrents in the session")
+STEP_SECONDS  = registry.Histogram("pybt_session_step_seconds",
+                                   "Time spent in one pass of the download loop, waits excluded")
+
+
+def OnStopSignals(logger, stop):
+    """ Calls stop() on SIGTERM or SIGHUP instead of dying at once, so """
+    """ that the loops save their resume data on the way out. Only from """
+    """ the main thread, elsewhere the signals are left alone """
+    def Handler(signum, frame):
+        logger.info("Stopping on signal %s" % signum)
+        stop()
+
+    try:
+        for signum in (signal.SIGTERM, signal.SIGHUP):
+            signal.signal(signum, Handler)
+    except ValueError:
+        logger.debug("Not the main thread, stop signals not handled")
+
+
+def RecordStatus(statuses):
+    """ Sets the session gauges from a list of torrent statuses """
+    DOWNLOAD_RATE.Set(sum(s.download_rate for s in statuses))
+    UPLOAD_RATE.Set(sum(s.upload_rate for s in statuses))
+    PEERS.Set(sum(s.num_peers for s in statuses))
+    TORRENTS.Set(len(statuses))
+
+
+class SessionStats():
+    """ Polls the libtorrent session counters (rates, peers, disk cache """
+    """ hits, ...) and exports the latest ones as pybt_lt_* gauges """
+
+    def __init__(self, ses, interval = 5):
+        self.ses      = ses
+        self.interval = interval
+        self.values   = {}
+        self.lastPoll = 0
+        registry.Collect("pybt_lt", lambda: self.values)
+
+    def Poll(self, handles):
+        """ Every interval seconds, records the status of handles and asks """
+        """ for fresh counters, which come back as a session_stats_alert """
+        if time.time() - self.lastPoll < self.interval:
+            return
+        self.lastPoll = time.time()
+
+        RecordStatus([h.status() for h in handles])
+        if hasattr(self.ses, "post_session_stats"):
+            self.ses.post_session_stats()
+
+    def HandleAlert(self, alert):
+        """ Returns True if the alert was a session_stats_alert """
+        if not isinstance(alert, getattr(lt, "session_stats_alert", ())):
+            return False
+        self.values = dict(alert.values)
+        return True
+
+
+class ControlHandler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            words = line.split()
+            if not words:
+                continue
+            reply = self.server.manager.Submit(words[0], words[1:])
+            self.wfile.write(reply + "\n")
+            self.wfile.flush()
+
+
+class ControlServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+
+class SessionManager():
+    def __init__(self, logger, args):
+        self.logger      = logger.getChild(__name__)
+        self.args        = args
+        self.commands    = Queue.Queue()
+        self.handles     = {}
+        self.running     = True
+        self.resumeStore = None
+        self.stats       = None
+        self.catalog     = None
+        self.client      = TrackerClient.TrackerClient(logger,
+                                                       poolSize = args["httpPool"],
+                                                       timeout  = args["httpTimeout"],
+                                                       retries  = args["httpRetries"])
+        if args.get("stateDir"):
+            self.resumeStore = ResumeData.ResumeStore(logger, args["stateDir"])
+        if args.get("catalogFile"):
+            self.catalog = Catalog.Catalog(logger, args["catalogFile"])
+
+        self.ses = lt.session()
+        self.ses.listen_on(args["portStart"],
+                           args["portEnd"])
+        # The profile first, the queueing and alerts we rely on over it
+        settings = SessionProfiles.SessionSettings(args.get("ltProfile"), args.get("ltSettings"))
+        settings.update({ "active_downloads": args["activeDownloads"],
+                          "active_seeds":     args["activeSeeds"],
+                          "active_limit":     args["activeDownloads"] + args["activeSeeds"],
+                          "alert_mask":       lt.alert.category_t.error_notification |
+                                              lt.alert.category_t.status_notification |
+                                              lt.alert.category_t.storage_notification })
+        self.ses.apply_settings(settings)
+        self.scheduler = Scheduler.Scheduler(logger,
+                                             self.ses,
+                                             args.get("downloadLimit"),
+                                             args.get("uploadLimit"))
+        if registry.enabled:
+            self.stats = SessionStats(self.ses)
+
+    #############
+    # Control socket
+    ###
+
+    def Submit(self, command, params):
+        """ Called from the control socket threads, the command is handed """
+        """ to the alert loop and its reply is waited for. The torrent of """
+        """ an addkey is fetched here first, a slow tracker only holds up """
+        """ its own client """
+        content = None
+        if command == "addkey" and params and "=" not in params[0]:
+            try:
+                content = self.FetchKey(params[0])
+            except Exception as e:
+                self.logger.exception("Fetching key [%s] failed" % params[0])
+                return "error %s" % e
+
+        reply = Queue.Queue(1)
+        self.commands.put((command, params, content, reply))
+        return reply.get()
+
+    def StartControlServer(self):
+        path = self.args["controlSocket"]
+        if os.path.exists(path):
+            os.unlink(path)
+
+        self.server = ControlServer(path, ControlHandler)
+        self.server.manager = self
+
+        thread = threading.Thread(target = self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.logger.info("Control socket listening on [%s]" % path)
+
+    #############
+    # Torrents
+    ###
+
+    def AddTorrent(self, info, destPath = None, options = ()):
+        options = Scheduler.TorrentOptions(options)
+        params = {'ti':           info,
+                  'save_path':    destPath or self.args["destPath"],
+                  'storage_mode': (lt.storage_mode_t.storage_mode_allocate
+                                   if self.args["allocateStorage"]
+                                   else lt.storage_mode_t.storage_mode_sparse)
+                  }
+
+        if self.resumeStore:
+            if self.args["forceRecheck"]:
+                self.resumeStore.Discard(str(info.info_hash()))
+            else:
+                resumeData = self.resumeStore.Load(str(info.info_hash()))
+                if resumeData:
+                    params['resume_data'] = resumeData
+
+        h = self.ses.add_torrent(params)
+        self.handles[str(info.info_hash())] = h
+        self.scheduler.Add(h, info, options)
+        self.logger.info("Added [%s]" % h.name())
+        return "ok %s" % info.info_hash()
+
+    def FetchKey(self, fileKey):
+        """ Returns the torrent stored under fileKey, from the catalog """
+        """ else the tracker, blocking on the latter """
+        content = self.catalog.ByKey(fileKey) if self.catalog else None
+        if content is None:
+            if not self.args.get("trackerGetUri"):
+                raise ValueError("no tracker get endpoint configured")
+
+            self.logger.info("Retrieving key [%s]" % fileKey)
+            content = self.client.Get(self.args["trackerGetUri"], fileKey)
+            if self.catalog:
+                self.catalog.Add(content, fileKey)
+        return content
+
+    def AddTorrentKey(self, fileKey, destPath = None, options = (), content = None):
+        """ content -- the torrent of fileKey when already fetched """
+        if content is None:
+            content = self.FetchKey(fileKey)
+        return self.AddTorrent(lt.torrent_info(lt.bdecode(content)), destPath, options)
+
+    def SetOptions(self, infoHash, options):
+        if infoHash not in self.handles:
+            return "error unknown torrent [%s]" % infoHash
+        self.scheduler.Update(self.handles[infoHash], options)
+        return "ok"
+
+    def Status(self):
+        lines = []
+        for infoHash, h in self.handles.items():
+            s = h.status()
+            lines.append("%s %s %.2f%% down:%.1fkB/s up:%.1fkB/s peers:%d %s"
+                         % (infoHash, h.name(), s.progress * 100, s.download_rate / 1000,
+                            s.upload_rate / 1000, s.num_peers, s.state))
+        lines.append("ok %s torrents" % len(self.handles))
+        return "\n".join(lines)
+
+    def RunCommand(self, command, params, content = None):
+        options = [p for p in params if "=" in p]
+        params  = [p for p in params if "=" not in p]
+        try:
+            if command == "add" and 1 <= len(params) <= 2:
+                return self.AddTorrent(lt.torrent_info(params[0]), (params[1:] or [None])[0], options)
+            elif command == "addkey" and 1 <= len(params) <= 2:
+                return self.AddTorrentKey(params[0], (params[1:] or [None])[0], options, content)
+            elif command == "set" and len(params) == 1:
+                return self.SetOptions(params[0], options)
+            elif command == "status":
+                return self.Status()
+            elif command == "quit":
+                self.Stop()
+                return "ok"
+            return "error unknown command [%s]" % command
+        except Exception as e:
+            self.logger.exception("Command [%s %s] failed" % (command, params))
+            return "error %s" % e
+
+    #############
+    # Alert loop
+    ###
+
+    def HandleAlert(self, alert):
+        if self.resumeStore and self.resumeStore.HandleAlert(alert):
+            return
+        if self.stats and self.stats.HandleAlert(alert):
+            return
+        if isinstance(alert, lt.torrent_finished_alert):
+            self.logger.info("Completed [%s]" % alert.handle.name())
+        elif alert.category() & lt.alert.category_t.error_notification:
+            self.logger.error(alert.message())
+        else:
+            self.logger.debug(alert.message())
+
+    def Start(self):
+        for torrentFile in self.args.get("torrentFiles", []):
+            self.AddTorrent(lt.torrent_info(torrentFile))
+
+        self.StartControlServer()
+        self.lastSave = time.time()
+        OnStopSignals(self.logger, self.Stop)
+
+    def Stop(self):
+        self.running = False
+
+    def Step(self, timeout = 500):
+        """ One pass of the alert loop, waits up to timeout ms for alerts """
+        if timeout:
+            self.ses.wait_for_alert(timeout)
+
+        with STEP_SECONDS.Time():
+            for alert in self.ses.pop_alerts():
+                self.HandleAlert(alert)
+
+            while not self.commands.empty():
+                command, params, content, reply = self.commands.get_nowait()
+                reply.put(self.RunCommand(command, params, content))
+
+            if self.resumeStore and time.time() - self.lastSave >= self.args["resumeInterval"]:
+                self.resumeStore.Request(self.handles.values())
+                self.lastSave = time.time()
+
+            self.scheduler.Step()
+
+            if self.stats:
+                self.stats.Poll(self.handles.values())
+
+    def Shutdown(self):
+        self.server.shutdown()
+        if self.resumeStore:
+            self.resumeStore.SaveAll(self.ses, self.handles.values())
+        if self.catalog:
+            self.logger.info("Catalog stats: %s" % self.catalog.Stats())
+            self.catalog.close()
+        self.logger.info("Main loop stopped")
+
+    def Run(self):
+        self.Start()
+
+        self.logger.info("Main loop starting...")
+        try:
+            while self.running:
+                self.Step()
+        finally:
+            self.Shutdown()
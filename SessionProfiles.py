@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# **********
+# Filename:         SessionProfiles.py
+# Description:      Named and file based libtorrent settings profiles
+# Author:           Marc Vieira Cardinal
+# Creation Date:    October 17, 2026
+# Revision Date:    October 17, 2026
+# Resources:
+#   http://www.rasterbar.com/products/libtorrent/reference-Settings.html
+# Profiles:
+#   default                -- libtorrent's own defaults
+#   high_performance_seed  -- lt.high_performance_seed(), many peers, large
+#                             disk cache and send buffers
+#   min_memory             -- lt.min_memory_usage(), small buffers and caches
+#   <file>.json            -- { "setting_name": value, ... }
+#   <file>.ini             -- a [settings] section of setting_name = value
+# **********
+
+
+# External imports
+import os
+import json
+import ConfigParser
+import libtorrent as lt
+
+
+PROFILES = { "default":               lambda: {},
+             "high_performance_seed": lt.high_performance_seed,
+             "min_memory":            lt.min_memory_usage }
+
+
+def ParseValue(value):
+    """ Reads an INI or command line value as a bool, int or string """
+    if value.lower() in ("true", "yes", "on"):
+        return True
+    if value.lower() in ("false", "no", "off"):
+        return False
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+def LoadSettingsFile(path):
+    if path.endswith(".json"):
+        with open(path) as f:
+            settings = json.load(f)
+        # libtorrent wants str names and values, not unicode
+        return dict((str(k), str(v) if isinstance(v, unicode) else v)
+                    for k, v in settings.items())
+
+    parser = ConfigParser.RawConfigParser()
+    parser.optionxform = str
+    if not parser.read(path):
+        raise IOError("Cannot read the settings file [%s]" % path)
+    return dict((k, ParseValue(v)) for k, v in parser.items("settings"))
+
+
+def SessionSettings(profile = None, overrides = ()):
+    """ Returns the settings dict for apply_settings from a profile name """
+    """ or settings file, then the name=value strings of overrides """
+    settings = {}
+    if profile in PROFILES:
+        settings.update(PROFILES[profile]())
+    elif profile:
+        if not os.path.isfile(profile):
+            raise ValueError("Unknown settings profile [%s], use one of %s or a .json/.ini file"
+                             % (profile, ", ".join(sorted(PROFILES))))
+        settings.update(LoadSettingsFile(profile))
+
+    for override in overrides or ():
+        name, sep, value = override.partition("=")
+        if not sep:
+            raise ValueError("Setting [%s] is not name=value" % override)
+        settings[name.strip()] = ParseValue(value.strip())
+
+    return settings
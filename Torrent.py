@@ -14,19 +14,35 @@
 
 
 # External imports
+import io
+import os
 import time
 import types
 import socket
-from hashlib import md5, sha1
+from hashlib import md5
 
 
 # Application imports
-from bencode import bencode
+from BencodeUtils import bencode, bencode_to
+from HashCache import HashCache
+from HashEngine import HashEngine, LimitedReader, MultiFileReader
+from Metrics import registry
+
+
+GEN_INFO_SECONDS = registry.Histogram("pybt_gen_info_seconds",
+                                      "Time to build the info dictionary of a torrent")
 
 
 class Torrent():
-    def __init__(self, logger):
+    def __init__(self, logger, jobs = 1, hashCache = None, piecePolicy = None, metaVersion = "v1"):
+        """
+        metaVersion -- string, one of v1, v2 (BEP 52) or hybrid (v1 and v2)
+        """
         self.logger      = logger.getChild(__name__)
+        self.hashEngine  = HashEngine(logger, jobs)
+        self.hashCache   = hashCache
+        self.piecePolicy = piecePolicy
+        self.metaVersion = metaVersion
 
     def TestPieceSize(self):
         for i in range(1, 10):
@@ -108,35 +124,200 @@ class Torrent():
 
         return 4194304, int(totalSize / 4194304) + 1 # (2^22)
 
+    def ChoosePieceSize(self, totalSize):
+        """ The piece policy when one was given, OptimalPieceSize otherwise """
+        if self.piecePolicy is None:
+            return self.OptimalPieceSize(totalSize)
+        return self.piecePolicy(totalSize)
+
     def Slice(self, text, length):
         return [text[i:i+length] for i in range(0, len(text), length)]
 
+    def ListFiles(self, dirname):
+        """ Returns the sorted list of (path, length, pathComponents) """
+        """ for all regular files below dirname """
+        files = []
+        for root, dirs, names in os.walk(dirname):
+            dirs.sort()
+            for name in sorted(names):
+                path = os.path.join(root, name)
+                if not os.path.isfile(path):
+                    continue
+                relPath = os.path.relpath(path, dirname)
+                files.append((path, os.path.getsize(path), relPath.split(os.sep)))
+
+        # Same order as the bencoded v2 file tree
+        files.sort(key = lambda f: f[2])
+        return files
+
     def GenInfoDict(self, filename):
         """ Returns the info dictionary for a torrent file """
-        """ with a given source filename """
+        """ with a given source filename or directory """
+        if os.path.isdir(filename):
+            return self.GenMultiFileInfoDict(filename)
+
         self.logger.info("Generating torrent info for [%s]" % filename)
 
-        with open(filename) as f:
-            contents = f.read()
+        st = os.stat(filename)
+        length = st.st_size
+        pieceLength, pieceCount = self.ChoosePieceSize(length)
+
+        pieces, md5sum = self.HashSingleFile(filename, pieceLength, st)
+
+        return {
+            "piece length": pieceLength,
+            "length":       length,
+            "name":         os.path.basename(filename),
+            "md5sum":       md5sum,
+            "pieces":       pieces,
+        }
+
+    def HashSingleFile(self, filename, pieceLength, st):
+        """ Returns the pieces and md5sum of a single file, going through """
+        """ the hash cache when there is one """
+        if self.hashCache is None:
+            with io.open(filename, "rb") as f:
+                return self.hashEngine.HashFile(f, pieceLength)
+
+        path = os.path.abspath(filename)
+        state, entry = self.hashCache.Lookup(path, pieceLength, st)
+
+        if state == HashCache.HIT:
+            return entry["pieces"], entry["md5sum"]
+
+        with io.open(filename, "rb") as f:
+            hashed = None
+            if state == HashCache.APPEND:
+                hashed = self.HashAppended(f, pieceLength, st.st_size, entry)
+            if hashed is None:
+                f.seek(0)
+                hashed = self.HashFrom(f, pieceLength, st.st_size, 0, md5(), "")
+
+        pieces, md5sum, prefixMd5 = hashed
+        self.hashCache.Store(path, pieceLength, st, pieces, md5sum, prefixMd5)
+        return pieces, md5sum
+
+    def HashAppended(self, f, pieceLength, length, entry):
+        """ Only hashes the pieces past the last complete cached piece, """
+        """ the cached prefix is still read for the md5sum, which also """
+        """ validates it. Returns None if the prefix changed. """
+        start  = entry["size"] // pieceLength * pieceLength
+        md5sum = md5()
+        self.hashEngine.UpdateMd5(f, start, md5sum)
+
+        if md5sum.hexdigest() != entry["prefixMd5"]:
+            self.logger.info("Cached prefix changed, hashing the whole file")
+            return None
+
+        return self.HashFrom(f, pieceLength, length, start, md5sum,
+                             entry["pieces"][:start // pieceLength * 20])
+
+    def HashFrom(self, f, pieceLength, length, start, md5sum, pieces):
+        """ Hashes f from start (piece aligned) up to length, continuing """
+        """ md5sum and pieces, returns (pieces, md5sum, prefixMd5) """
+        end = length // pieceLength * pieceLength
+
+        full, unused = self.hashEngine.HashFile(LimitedReader(f, end - start),
+                                                pieceLength, md5sum = md5sum)
+        prefixMd5 = md5sum.hexdigest()
+        tail, md5hex = self.hashEngine.HashFile(LimitedReader(f, length - end),
+                                                pieceLength, md5sum = md5sum)
+
+        return pieces + full + tail, md5hex, prefixMd5
+
+    def GenMultiFileInfoDict(self, dirname):
+        """ Returns the multi-file info dictionary for a directory, """
+        """ pieces are hashed across file boundaries """
+        self.logger.info("Generating multi-file torrent info for [%s]" % dirname)
 
-        pieceLength, pieceCount = self.OptimalPieceSize(len(contents))
+        files = self.ListFiles(dirname)
+        pieceLength, pieceCount = self.ChoosePieceSize(sum(f[1] for f in files))
 
-        # Pieces processing
-        pieces = self.Slice(contents, pieceLength)
-        pieces = [ sha1(p).digest() for p in pieces ]
+        # Pieces processing, a single stream over all the files
+        with MultiFileReader([(f[0], f[1]) for f in files]) as reader:
+            pieces, md5sum = self.hashEngine.HashFile(reader, pieceLength, withMd5 = False)
 
         return {
             "piece length": pieceLength,
-            "length":       len(contents),
-            "name":         filename,
-            "md5sum":       md5(contents).hexdigest(),
-            "pieces":       "".join(pieces),
+            "name":         os.path.basename(os.path.normpath(dirname)),
+            "files":        [{ "length": length,
+                               "path":   pathComponents,
+                               "md5sum": fileMd5 }
+                             for (path, length, pathComponents), fileMd5
+                             in zip(files, reader.md5sums)],
+            "pieces":       pieces,
         }
 
-    def GenTorrentFileContent(self, filename, tracker, comment = None):
-        """ Generate a bencoded torrent file """
-        self.logger.info("Generating torrent content for [%s,%s,%s]" % (filename, tracker, comment))
+    def GenInfoDictV2(self, filename):
+        """ Returns (info dictionary, piece layers) for a v2 or hybrid """
+        """ torrent, every file is read once for both kinds of hashes """
+        hybrid = self.metaVersion == "hybrid"
+        self.logger.info("Generating %s torrent info for [%s]" % (self.metaVersion, filename))
+
+        if os.path.isdir(filename):
+            files = self.ListFiles(filename)
+            name  = os.path.basename(os.path.normpath(filename))
+        else:
+            name  = os.path.basename(filename)
+            files = [(filename, os.path.getsize(filename), [name])]
+
+        pieceLength, pieceCount = self.ChoosePieceSize(sum(f[1] for f in files))
+        if pieceLength < 16384 or pieceLength & (pieceLength - 1):
+            raise ValueError("v2 piece length must be a power of two >= 16 KiB, not %s" % pieceLength)
+
+        fileTree    = {}
+        pieceLayers = {}
+        v1Files     = []
+        v1Pieces    = []
+
+        # Like libtorrent, the last file of a directory is padded as well
+        padded      = os.path.isdir(filename)
+        for path, length, pathComponents in files:
+            with io.open(path, "rb") as f:
+                piecesRoot, pieceLayer, pieces, md5sum = \
+                    self.hashEngine.HashFileV2(f, length, pieceLength, hybrid, hybrid,
+                                               padLast = padded)
+
+            node = fileTree
+            for component in pathComponents:
+                node = node.setdefault(component, {})
+            node[""] = { "length": length }
+            if piecesRoot:
+                node[""]["pieces root"] = piecesRoot
+            if pieceLayer:
+                pieceLayers[piecesRoot] = pieceLayer
+
+            if hybrid:
+                v1Files.append({ "length": length,
+                                 "path":   pathComponents,
+                                 "md5sum": md5sum })
+                v1Pieces.append(pieces)
+
+                # Pad so the next file starts on a piece boundary
+                padLength = -length % pieceLength
+                if padLength and padded:
+                    v1Files.append({ "length": padLength,
+                                     "path":   [".pad", str(padLength)],
+                                     "attr":   "p" })
+
+        info = { "meta version": 2,
+                 "piece length": pieceLength,
+                 "name":         name,
+                 "file tree":    fileTree }
 
+        if hybrid:
+            info["pieces"] = "".join(v1Pieces)
+
+            if os.path.isdir(filename):
+                info["files"] = v1Files
+            else:
+                info["length"] = v1Files[0]["length"]
+                info["md5sum"] = v1Files[0]["md5sum"]
+
+        return info, pieceLayers
+
+    def GenTorrentDict(self, filename, tracker, comment = None):
+        """ Returns the torrent dictionary, not yet bencoded """
         torrent = {}
 
         # Multiple trackers
@@ -151,15 +332,38 @@ class Torrent():
         if comment:
             torrent["comment"] = comment
 
-        torrent["info"] = self.GenInfoDict(filename)
+        with GEN_INFO_SECONDS.Time():
+            if self.metaVersion == "v1":
+                torrent["info"] = self.GenInfoDict(filename)
+            else:
+                torrent["info"], torrent["piece layers"] = self.GenInfoDictV2(filename)
 
-        return bencode(torrent)
+        return torrent
+
+    def GenTorrentFileContent(self, filename, tracker, comment = None):
+        """ Generate a bencoded torrent file """
+        self.logger.info("Generating torrent content for [%s,%s,%s]" % (filename, tracker, comment))
+
+        return bencode(self.GenTorrentDict(filename, tracker, comment))
+
+    def WriteTorrent(self, out, filename, tracker, comment = None):
+        """ Stream the bencoded torrent to out, any object with a write method """
+        self.logger.info("Streaming torrent content for [%s,%s,%s]" % (filename, tracker, comment))
+
+        bencode_to(self.GenTorrentDict(filename, tracker, comment), out)
 
     def WriteTorrentFile(self, torrentFile, filename, tracker, comment = None):
-        """ Write the output of GenTorrentFileContent to a file """
+        """ Write the torrent to a file without building it in memory first, """
+        """ through a temp file renamed into place so that a failure never """
+        """ leaves a truncated torrentFile behind """
         self.logger.info("Writing torrent file [%s,%s,%s,%s]" % (torrentFile, filename, tracker, comment))
 
-        content = self.GenTorrentFileContent(filename, tracker, comment)
-
-        with open(torrentFile, "w") as f:
-            f.write(content)
+        tempFile = torrentFile + ".tmp"
+        try:
+            with open(tempFile, "wb") as f:
+                self.WriteTorrent(f, filename, tracker, comment)
+            os.rename(tempFile, torrentFile)
+        except BaseException:
+            if os.path.exists(tempFile):
+                os.unlink(tempFile)
+            raise
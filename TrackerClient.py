@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*- 
+
+# **********
+# Filename:         TrackerClient.py
+# Description:      Pooled, keep-alive HTTP client for the tracker endpoints
+# Author:           Marc Vieira Cardinal
+# Creation Date:    October 17, 2026
+# Revision Date:    October 17, 2026
+# Resources:
+#   http://docs.python-requests.org/en/latest/user/advanced/#session-objects
+# **********
+
+
+# External imports
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# Application imports
+from Metrics import registry
+
+
+PUSH_SECONDS    = registry.Histogram("pybt_push_seconds",
+                                     "Time to push a torrent or a batch, retries included")
+PUSHED          = registry.Counter("pybt_pushed_torrents_total",
+                                   "Torrents accepted by the push endpoint")
+PUSH_ERRORS     = registry.Counter("pybt_push_errors_total",
+                                   "Push requests that failed for good")
+TRACKER_RETRIES = registry.Counter("pybt_tracker_retries_total",
+                                   "Tracker requests retried after an error")
+
+
+class TrackerError(Exception):
+    def __init__(self, message, status = None):
+        Exception.__init__(self, message)
+        self.status = status
+
+
+class TrackerClient():
+    """ One requests session shared by all the pushes and gets, at most """
+    """ poolSize requests in flight, failed ones retried with backoff """
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    # Answers meaning the push endpoint does not take several torrents at once
+    NO_BATCH_PUSH  = (404, 405, 501)
+
+    # Answers rejecting one batch, its torrents are then pushed one at a time
+    BATCH_REJECTED = (400, 415, 422)
+
+    def __init__(self, logger, poolSize = 8, timeout = 30, retries = 3, backoff = 0.5):
+        self.logger      = logger.getChild(__name__)
+        self.timeout     = timeout
+        self.retries     = retries
+        self.backoff     = backoff
+        self.slots       = threading.BoundedSemaphore(poolSize)
+        self.batchPush   = True
+
+        adapter = HTTPAdapter(pool_connections = 4,
+                              pool_maxsize = poolSize,
+                              pool_block = True)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["User-Agent"] = "pyBTclient"
+
+    def Request(self, method, uri, **kwargs):
+        """ Returns the response, retrying connection errors, timeouts and """
+        """ RETRY_STATUSES with exponential backoff; raises TrackerError """
+        for attempt in range(self.retries + 1):
+            try:
+                with self.slots:
+                    response = self.session.request(method, uri,
+                                                    timeout = self.timeout,
+                                                    **kwargs)
+                if response.status_code not in self.RETRY_STATUSES:
+                    response.raise_for_status()
+                    return response
+                error = "HTTP %s" % response.status_code
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = str(e)
+            except requests.HTTPError as e:
+                raise TrackerError("%s %s failed: %s" % (method, uri, e),
+                                   e.response.status_code)
+
+            if attempt < self.retries:
+                TRACKER_RETRIES.Inc()
+                delay = self.backoff * 2 ** attempt
+                self.logger.warning("%s %s failed (%s), retrying in %.1fs"
+                                    % (method, uri, error, delay))
+                time.sleep(delay)
+
+        raise TrackerError("%s %s failed after %s attempts: %s"
+                           % (method, uri, self.retries + 1, error))
+
+    def Push(self, pushUri, fileKey, torrentFile):
+        """ Uploads torrentFile as the torrentFile field named fileKey """
+        with open(torrentFile, "rb") as f:
+            content = f.read()
+        return self.Post(pushUri, [("torrentFile", (fileKey, content))], 1)
+
+    def PushBatch(self, pushUri, batch):
+        """ Uploads a list of (fileKey, torrentFile) in a single request, """
+        """ one torrentFile field per torrent. A batch too large is split """
+        """ in two, a rejected one is pushed one torrent at a time, and if """
+        """ the endpoint has no batch support so are all the later ones. """
+        if self.batchPush and len(batch) > 1:
+            files = []
+            for fileKey, torrentFile in batch:
+                with open(torrentFile, "rb") as f:
+                    files.append(("torrentFile", (fileKey, f.read())))
+            try:
+                return self.Post(pushUri, files, len(files))
+            except TrackerError as e:
+                if e.status == 413:
+                    self.logger.warning("Batch of %s torrents too large, splitting it" % len(batch))
+                    half = len(batch) // 2
+                    self.PushBatch(pushUri, batch[:half])
+                    return self.PushBatch(pushUri, batch[half:])
+                if e.status in self.NO_BATCH_PUSH:
+                    self.logger.warning("Batch push not supported (%s), single pushes from now on" % e)
+                    self.batchPush = False
+                elif e.status in self.BATCH_REJECTED:
+                    self.logger.warning("Batch push rejected (%s), pushing its torrents one at a time" % e)
+                else:
+                    raise
+
+        for fileKey, torrentFile in batch:
+            self.Push(pushUri, fileKey, torrentFile)
+
+    def Post(self, pushUri, files, count):
+        """ Sends count torrents to the push endpoint, recording the push metrics """
+        try:
+            with PUSH_SECONDS.Time():
+                response = self.Request("POST", pushUri, files = files)
+        except TrackerError:
+            PUSH_ERRORS.Inc()
+            raise
+        PUSHED.Inc(count)
+        return response
+
+    def Get(self, getUri, fileKey):
+        """ Returns the torrent content stored under fileKey """
+        return self.Request("GET", getUri, params = { "key": fileKey }).content
+
+    def close(self):
+        self.session.close()
+
+
+class BatchPusher():
+    """ Collects (fileKey, torrentFile) pairs and pushes them as batches """
+    """ of batchSize, or whatever was added within flushInterval seconds. """
+    """ A failed push from the flush timer is raised by the next Add, """
+    """ Flush or close """
+
+    def __init__(self, logger, client, pushUri, batchSize = 50, flushInterval = 1.0):
+        self.logger      = logger.getChild(__name__)
+        self.client      = client
+        self.pushUri     = pushUri
+        self.batchSize   = batchSize
+        self.flushTime   = flushInterval
+        self.batch       = []
+        self.lock        = threading.Lock()
+        self.timer       = None
+        self.error       = None
+
+    def Add(self, fileKey, torrentFile):
+        self.RaiseError()
+        with self.lock:
+            self.batch.append((fileKey, torrentFile))
+            if len(self.batch) < self.batchSize:
+                if self.timer is None:
+                    self.timer = threading.Timer(self.flushTime, self.TimedFlush)
+                    self.timer.daemon = True
+                    self.timer.start()
+                return
+        self.Flush()
+
+    def TimedFlush(self):
+        try:
+            self.Flush()
+        except Exception as e:
+            self.logger.error("Pushing a batch failed: %s" % e)
+            with self.lock:
+                self.error = self.error or e
+
+    def RaiseError(self):
+        with self.lock:
+            error, self.error = self.error, None
+        if error is not None:
+            raise error
+
+    def Flush(self):
+        self.RaiseError()
+        with self.lock:
+            batch, self.batch = self.batch, []
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        if batch:
+            self.logger.info("Pushing a batch of %s torrents" % len(batch))
+            self.client.PushBatch(self.pushUri, batch)
+
+    def close(self):
+        self.Flush()
+
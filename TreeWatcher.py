@@ -0,0 +1,372 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# **********
+# Filename:         TreeWatcher.py
+# Description:      Startup reconciliation scan and lazy inotify watches for the autoindexer
+# Author:           Marc Vieira Cardinal
+# Creation Date:    October 17, 2026
+# Revision Date:    October 17, 2026
+# Resources:
+#   http://man7.org/linux/man-pages/man7/inotify.7.html
+#   https://www.python.org/dev/peps/pep-0471/ (scandir)
+# Notes:
+#   A pool of scan threads walks the watched trees one directory at a time.
+#   Each directory is watched before it is listed, all the subdirectories
+#   found in one listing are watched in a single add_watch call, so no file
+#   closed during the walk is missed and no upfront rec=True walk blocks the
+#   event loop. Files whose (size, mtime) differ from the snapshot saved at
+#   the last clean shutdown are submitted to the pipeline; the snapshot is
+#   only written once the pipeline has drained, without the files it failed
+#   to index or push, a crash means rescanning more, never indexing less.
+# **********
+
+
+# External imports
+import os
+import stat
+import errno
+import time
+import Queue
+import sqlite3
+import threading
+import pyinotify
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+
+# Application imports
+from Metrics import registry
+
+
+WATCH_MASK = pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO | pyinotify.IN_CREATE
+
+
+def ScanDir(path):
+    """ Returns the subdirectories and the (path, size, mtime) of the """
+    """ regular files in path, symlinks are not followed, entries """
+    """ removed while listing are skipped """
+    dirs, files = [], []
+    if scandir is not None:
+        for entry in scandir(path):
+            try:
+                if entry.is_dir(follow_symlinks = False):
+                    dirs.append(entry.path)
+                elif entry.is_file(follow_symlinks = False):
+                    st = entry.stat(follow_symlinks = False)
+                    files.append((entry.path, st.st_size, st.st_mtime))
+            except OSError:
+                continue
+        return dirs, files
+
+    for name in os.listdir(path):
+        child = os.path.join(path, name)
+        try:
+            st = os.lstat(child)
+        except OSError:
+            continue
+        if stat.S_ISDIR(st.st_mode):
+            dirs.append(child)
+        elif stat.S_ISREG(st.st_mode):
+            files.append((child, st.st_size, st.st_mtime))
+    return dirs, files
+
+
+def MaxUserWatches():
+    try:
+        with open("/proc/sys/fs/inotify/max_user_watches") as f:
+            return int(f.read())
+    except (IOError, ValueError):
+        return None
+
+
+class Snapshot():
+    """ The (size, mtime) of every file seen, by path, in SQLite """
+
+    def __init__(self, logger, dbFile):
+        self.logger      = logger.getChild(__name__)
+        self.db = sqlite3.connect(dbFile, check_same_thread = False)
+        self.db.text_factory = str
+        self.db.execute("""CREATE TABLE IF NOT EXISTS files (
+                               path  TEXT    PRIMARY KEY,
+                               size  INTEGER NOT NULL,
+                               mtime REAL    NOT NULL)""")
+        self.db.commit()
+
+    def Load(self):
+        return dict((path, (size, mtime))
+                    for path, size, mtime in self.db.execute("SELECT path, size, mtime FROM files"))
+
+    def Save(self, files):
+        """ Replaces the snapshot with files, in one transaction """
+        with self.db:
+            self.db.execute("DELETE FROM files")
+            self.db.executemany("INSERT INTO files VALUES (?, ?, ?)",
+                                ((path, size, mtime) for path, (size, mtime) in files.iteritems()))
+        self.logger.info("Saved a snapshot of %s files" % len(files))
+
+    def close(self):
+        self.db.close()
+
+
+class TreeWatcher():
+    def __init__(self, logger, watchManager, pipeline, jobs = 4, snapshotFile = None):
+        """
+        watchManager -- pyinotify.WatchManager the watches are added to
+        pipeline     -- IndexerPipeline receiving the new or changed files
+        jobs         -- number of scan threads
+        snapshotFile -- SQLite file of the (path, size, mtime) seen at the
+                        last clean shutdown, None == nothing is reconciled,
+                        files already there at startup are not indexed
+        """
+        self.logger       = logger.getChild(__name__)
+        self.watchManager = watchManager
+        self.pipeline     = pipeline
+        self.jobs         = max(1, int(jobs))
+        self.snapshot     = Snapshot(logger, snapshotFile) if snapshotFile else None
+
+        self.lock         = threading.Lock()
+        self.watchLock    = threading.Lock()
+        self.dirs         = Queue.Queue()
+        self.stopping     = threading.Event()
+        self.scanned      = threading.Event()
+        self.threads      = []
+        self.previous     = {}    # path -> (size, mtime), from the snapshot
+        self.current      = {}    # path -> (size, mtime), seen since startup
+        self.watchFull    = False
+        self.scanStart    = None
+        self.scanSeconds  = None
+        self.counters     = { "dirs":          0,
+                              "files":         0,
+                              "queued":        0,
+                              "scanErrors":    0,
+                              "watches":       0,
+                              "watchErrors":   0,
+                              "watchBatches":  0 }
+
+    def Count(self, name, n = 1):
+        with self.lock:
+            self.counters[name] += n
+
+    def Stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        stats["scanSeconds"] = self.scanSeconds if self.scanSeconds is not None else -1
+        return stats
+
+    #############
+    # Watches
+    ###
+
+    def Watch(self, paths):
+        """ Adds one batch of non recursive watches. Directories that """
+        """ vanished or cannot be read are skipped, once the inotify """
+        """ watch limit is hit the rest of the tree is still scanned, """
+        """ but no longer watched """
+        if self.watchFull or not paths:
+            return
+
+        with self.watchLock:
+            wdd = self.watchManager.add_watch(paths, WATCH_MASK, rec = False, quiet = True)
+        self.Count("watchBatches")
+
+        added = 0
+        for path, wd in wdd.items():
+            if wd < 0:
+                wd, code = self.WatchOne(path)
+            if wd >= 0:
+                added += 1
+                continue
+
+            self.Count("watchErrors")
+            if code != errno.ENOSPC:
+                self.logger.warning("Could not watch [%s]: %s" % (path, os.strerror(code)))
+            elif not self.watchFull:
+                self.watchFull = True
+                self.logger.error("Could not watch [%s], not watching new directories anymore; "
+                                  "%s watches added, fs.inotify.max_user_watches is %s"
+                                  % (path, self.counters["watches"] + added, MaxUserWatches()))
+        self.Count("watches", added)
+
+    def WatchOne(self, path):
+        """ Retries the watch of path alone, returns its wd and, when it """
+        """ failed again, the errno of inotify_add_watch """
+        with self.watchLock:
+            wd = self.watchManager.add_watch(path, WATCH_MASK, rec = False, quiet = True).get(path, -1)
+            wrapper = getattr(self.watchManager, "_inotify_wrapper", None)
+            code = wrapper.get_errno() if wrapper is not None and wd < 0 else None
+        if wd >= 0:
+            return wd, None
+
+        # Without the errno, tell a vanished or unreadable directory from the limit
+        if not code:
+            if not os.path.isdir(path):
+                code = errno.ENOENT
+            elif not os.access(path, os.R_OK):
+                code = errno.EACCES
+            else:
+                code = errno.ENOSPC
+        return wd, code
+
+    #############
+    # Scanning
+    ###
+
+    def Scanner(self):
+        while True:
+            item = self.dirs.get()
+            if item is None:
+                self.dirs.task_done()
+                break
+            if self.stopping.is_set():
+                # Left for the next startup scan
+                self.dirs.task_done()
+                continue
+            path, submit = item
+            try:
+                self.ScanOne(path, submit)
+            except OSError as e:
+                # Removed or unreadable since it was found
+                self.logger.warning("Cannot scan [%s]: %s" % (path, e))
+                self.Count("scanErrors")
+            finally:
+                self.dirs.task_done()
+
+    def ScanOne(self, path, submit):
+        """ submit == False only records the files, for the startup scan """
+        """ without a snapshot """
+        dirs, files = ScanDir(path)
+
+        # Watched before they are listed by whichever thread gets them
+        self.Watch(dirs)
+        for child in dirs:
+            self.dirs.put((child, submit))
+
+        changed = []
+        with self.lock:
+            self.counters["dirs"]  += 1
+            self.counters["files"] += len(files)
+            for child, size, mtime in files:
+                known = self.current.get(child) or self.previous.get(child)
+                self.current[child] = (size, mtime)
+                if submit and known != (size, mtime):
+                    changed.append(child)
+            self.counters["queued"] += len(changed)
+
+        for child in changed:
+            self.pipeline.Submit(child, os.path.basename(child))
+
+    def AddTree(self, path):
+        """ A directory created or moved in, watched then scanned """
+        self.Watch([path])
+        self.dirs.put((path, True))
+
+    def Changed(self, path):
+        """ A file written or moved in, recorded and submitted """
+        try:
+            st = os.lstat(path)
+        except OSError:
+            return
+        with self.lock:
+            self.current[path] = (st.st_size, st.st_mtime)
+        self.pipeline.Submit(path, os.path.basename(path))
+
+    def Reconciled(self):
+        """ Waits for the startup scan, then reports it """
+        self.dirs.join()
+        self.scanSeconds = time.time() - self.scanStart
+        if self.stopping.is_set():
+            self.logger.info("Startup scan interrupted after %.1f s: %s" % (self.scanSeconds, self.Stats()))
+        else:
+            with self.lock:
+                self.previous = {}
+            self.logger.info("Scanned %(dirs)s directories and %(files)s files in %(seconds).1f s, "
+                             "%(queued)s new or changed, %(watches)s watches in %(watchBatches)s "
+                             "batches (%(watchErrors)s failed, limit %(limit)s)"
+                             % dict(self.Stats(), seconds = self.scanSeconds, limit = MaxUserWatches()))
+        self.scanned.set()
+
+    #############
+    # Lifecycle
+    ###
+
+    def Start(self, roots):
+        registry.Collect("pybt_watcher", self.Stats)
+
+        if self.snapshot:
+            self.previous = self.snapshot.Load()
+            self.logger.info("Loaded a snapshot of %s files" % len(self.previous))
+
+        self.scanStart = time.time()
+        self.Watch(roots)
+        for root in roots:
+            self.dirs.put((root, self.snapshot is not None))
+
+        targets = [self.Scanner] * self.jobs
+        for target in targets:
+            thread = threading.Thread(target = target)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+        thread = threading.Thread(target = self.Reconciled)
+        thread.daemon = True
+        thread.start()
+
+    def Stop(self):
+        """ Stops scanning, call before stopping the pipeline so nothing """
+        """ is submitted to it afterwards """
+        self.stopping.set()
+        for thread in self.threads:
+            self.dirs.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def Save(self):
+        """ Writes the snapshot, call once the pipeline has drained. The """
+        """ files an interrupted startup scan did not reach keep their """
+        """ previous entry, the ones the pipeline failed on are left out """
+        """ to be submitted again on the next startup """
+        if self.snapshot:
+            with self.lock:
+                files = dict(self.previous)
+                files.update(self.current)
+            for path in self.pipeline.Failed():
+                files.pop(path, None)
+            self.snapshot.Save(files)
+            self.snapshot.close()
+
+
+class TreeWatcherEvents(pyinotify.ProcessEvent):
+    """ Hands the inotify events of the watched trees to a TreeWatcher """
+
+    def __init__(self, logger, watcher):
+        self.logger   = logger.getChild(self.__class__.__name__)
+        self.watcher  = watcher
+
+    def process_IN_CLOSE_WRITE(self, event):
+        path = os.path.join(event.path, event.name)
+        self.logger.debug("process_IN_CLOSE_WRITE -> %s" % path)
+
+        self.watcher.Changed(path)
+
+    def process_IN_CREATE(self, event):
+        # New files are indexed on IN_CLOSE_WRITE, new directories
+        # are watched and scanned for what was written before that
+        if event.dir:
+            self.logger.debug("process_IN_CREATE -> %s" % event.pathname)
+            self.watcher.AddTree(event.pathname)
+
+    def process_IN_MOVED_TO(self, event):
+        self.logger.debug("process_IN_MOVED_TO -> %s" % event.pathname)
+        if event.dir:
+            self.watcher.AddTree(event.pathname)
+        else:
+            self.watcher.Changed(event.pathname)
@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# **********
+# Filename:         Verifier.py
+# Description:      Offline piece validation of a payload against its torrent
+# Author:           Marc Vieira Cardinal
+# Creation Date:    October 17, 2026
+# Revision Date:    October 17, 2026
+# Resources:
+#   http://bittorrent.org/beps/bep_0003.html
+#   http://bittorrent.org/beps/bep_0047.html (pad files)
+#   http://bittorrent.org/beps/bep_0052.html
+# **********
+
+
+# External imports
+import io
+import os
+import mmap
+import time
+import random
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from hashlib import sha1, sha256
+from multiprocessing.pool import ThreadPool
+
+
+# Application imports
+from BencodeUtils import bdecode
+from HashEngine import BLOCK_SIZE, MerkleRoot, NextPowerOfTwo
+
+
+def PieceRootV2(piece, width):
+    """ Merkle root of the 16 KiB blocks of a v2 piece """
+    leaves = [sha256(piece[i:i + BLOCK_SIZE]).digest()
+              for i in range(0, len(piece), BLOCK_SIZE)]
+    return MerkleRoot(leaves, width or NextPowerOfTwo(len(leaves)))
+
+
+def PayloadRoot(info):
+    """ Components of the payload root under the download directory, [] """
+    """ for a single-file torrent. A v2 file tree has no such flag, a lone """
+    """ file named like the torrent is the single-file shape, any other """
+    """ tree is a directory, one file in it or not """
+    if "files" in info:
+        return [info["name"]]
+    if "length" in info:
+        return []
+    fileTree = info["file tree"]
+    node     = fileTree.get(info["name"], {})
+    if len(fileTree) == 1 and list(node) == [""]:
+        return []
+    return [info["name"]]
+
+
+class Payload():
+    """ The files of a torrent laid end to end as one read-only stream. """
+    """ Files are memory mapped on first read, pad files and the gaps """
+    """ between v2 files read as zeros and missing or short files as None. """
+
+    def __init__(self, layout, maxMaps = 64):
+        """
+        layout  -- list of (path, length), path is None for padding
+        maxMaps -- files kept mapped, the least recently read are dropped
+                   so that torrents of many files stay within the map
+                   count and descriptor limits
+        """
+        self.paths   = [path for path, length in layout]
+        self.lengths = [length for path, length in layout]
+        self.starts  = []
+        self.maps    = OrderedDict()    # index -> mmap, least recently read first
+        self.missing = set()
+        self.maxMaps = maxMaps
+        self.lock    = threading.Lock()
+
+        offset = 0
+        for path, length in layout:
+            self.starts.append(offset)
+            offset += length
+        self.length = offset
+
+    def Mapped(self, index):
+        """ Returns the map of file index, None when it is unavailable """
+        with self.lock:
+            m = self.maps.pop(index, None)
+            if m is None and index not in self.missing:
+                m = self.Map(self.paths[index], self.lengths[index])
+                if m is None:
+                    self.missing.add(index)
+            if m is not None:
+                self.maps[index] = m
+                while len(self.maps) > self.maxMaps:
+                    # Not closed, unmapped once the buffers still
+                    # read from it by other threads are gone
+                    self.maps.popitem(last = False)
+            return m
+
+    def Map(self, path, length):
+        if path is None or not length or not os.path.isfile(path):
+            return None
+        if os.path.getsize(path) < length:
+            return None
+        with io.open(path, "rb") as f:
+            return mmap.mmap(f.fileno(), length, access = mmap.ACCESS_READ)
+
+    def Read(self, offset, length):
+        """ Returns length bytes from offset, a zero-copy buffer when they """
+        """ fall within one file, None when any of them is unavailable """
+        index = bisect_right(self.starts, offset) - 1
+        parts = []
+        while length:
+            start = offset - self.starts[index]
+            n     = min(length, self.lengths[index] - start)
+
+            if not n:
+                pass
+            elif self.paths[index] is None:
+                parts.append("\0" * n)
+            else:
+                m = self.Mapped(index)
+                if m is None:
+                    return None
+                parts.append(buffer(m, start, n))
+
+            offset += n
+            length -= n
+            index  += 1
+
+        if len(parts) == 1:
+            return parts[0]
+        return "".join(str(part) for part in parts)
+
+    def close(self):
+        # Dropped rather than closed, buffers may still be in use
+        with self.lock:
+            self.maps.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Verifier():
+    def __init__(self, logger, jobs = 1):
+        self.logger      = logger.getChild(__name__)
+        self.jobs        = max(1, int(jobs))
+
+    def PlanV1(self, info, destPath):
+        """ Returns the payload layout and (index, offset, length, digest, """
+        """ hashFunc) of every v1 piece, pad files are not read from disk """
+        pieceLength = info["piece length"]
+
+        if "files" in info:
+            root   = os.path.join(destPath, info["name"])
+            layout = [(None if "p" in f.get("attr", "") else os.path.join(root, *f["path"]),
+                       f["length"])
+                      for f in info["files"]]
+        else:
+            layout = [(os.path.join(destPath, info["name"]), info["length"])]
+
+        totalLength = sum(length for path, length in layout)
+        pieces = info["pieces"]
+        checks = [(i, i * pieceLength, min(pieceLength, totalLength - i * pieceLength),
+                   pieces[i * 20:i * 20 + 20], self.HashV1)
+                  for i in range(len(pieces) // 20)]
+        return layout, checks
+
+    def PlanV2(self, info, pieceLayers, destPath):
+        """ Same as PlanV1 from the file tree, every file starting on a """
+        """ piece boundary: pieces of multi-piece files are checked against """
+        """ the piece layers, single-piece files against their root """
+        pieceLength = info["piece length"]
+        width       = pieceLength // BLOCK_SIZE
+        layout      = []
+        checks      = []
+        offset      = 0
+
+        def Walk(node, components):
+            for name in sorted(node):
+                if name == "":
+                    continue
+                if "" in node[name]:
+                    yield components + [name], node[name][""]
+                else:
+                    for entry in Walk(node[name], components + [name]):
+                        yield entry
+
+        root = os.path.join(destPath, *PayloadRoot(info))
+        for components, entry in Walk(info["file tree"], []):
+            length = entry["length"]
+            if not length:
+                layout.append((os.path.join(root, *components), 0))
+                continue
+
+            layout.append((os.path.join(root, *components), length))
+            index = offset // pieceLength
+            count = (length + pieceLength - 1) // pieceLength
+            if count == 1:
+                checks.append((index, offset, length, entry["pieces root"], self.HashV2Root))
+            else:
+                layer = pieceLayers[entry["pieces root"]]
+                for j in range(count):
+                    checks.append((index + j, offset + j * pieceLength,
+                                   min(pieceLength, length - j * pieceLength),
+                                   layer[j * 32:j * 32 + 32], self.HashV2Piece(width)))
+
+            padLength = -length % pieceLength
+            if padLength:
+                layout.append((None, padLength))
+            offset += length + padLength
+
+        return layout, checks
+
+    def HashV1(self, piece):
+        return sha1(piece).digest()
+
+    def HashV2Root(self, piece):
+        return PieceRootV2(piece, None)
+
+    def HashV2Piece(self, width):
+        return lambda piece: PieceRootV2(piece, width)
+
+    def Sample(self, checks, fraction, seed = None):
+        """ A random subset of about fraction of the checks, in piece order """
+        count = max(1, int(round(len(checks) * fraction)))
+        if count >= len(checks):
+            return checks
+        picked = random.Random(seed).sample(range(len(checks)), count)
+        return [checks[i] for i in sorted(picked)]
+
+    def Plan(self, torrentFile, destPath):
+        """ Returns the name, payload layout and piece checks of torrentFile """
+        with io.open(torrentFile, "rb") as f:
+            torrent = bdecode(f.read())
+        info = torrent["info"]
+
+        if "pieces" in info:
+            layout, checks = self.PlanV1(info, destPath)
+        else:
+            layout, checks = self.PlanV2(info, torrent.get("piece layers", {}), destPath)
+        return info["name"], layout, checks
+
+    def Verify(self, torrentFile, destPath, firstBad = False, sample = None, seed = None):
+        """ Checks the payload of torrentFile under destPath, returns """
+        """ the sorted list of bad piece indexes and a stats dict """
+        name, layout, checks = self.Plan(torrentFile, destPath)
+
+        total = len(checks)
+        if sample:
+            checks = self.Sample(checks, sample, seed)
+
+        self.logger.info("Verifying %s of %s pieces of [%s] in [%s] with %s jobs"
+                         % (len(checks), total, name, destPath, self.jobs))
+        return self.Check(layout, checks, total, firstBad)
+
+    def GoodFiles(self, torrentFile, destPath, paths):
+        """ Returns the set of paths, files of torrentFile under destPath, """
+        """ whose pieces all check good, the pieces they share with other """
+        """ files included """
+        name, layout, checks = self.Plan(torrentFile, destPath)
+
+        ranges, offset = {}, 0
+        for path, length in layout:
+            if path in paths and length:
+                ranges[path] = (offset, offset + length)
+            offset += length
+
+        def Overlaps(check, fileRange):
+            start, end = fileRange
+            return check[1] < end and start < check[1] + check[2]
+
+        checks = [check for check in checks if any(Overlaps(check, r) for r in ranges.values())]
+        self.logger.info("Verifying %s files of [%s] in [%s], %s pieces"
+                         % (len(ranges), name, destPath, len(checks)))
+        bad, stats = self.Check(layout, checks, len(checks))
+
+        bad       = set(bad)
+        badChecks = [check for check in checks if check[0] in bad]
+        return set(path for path, r in ranges.items()
+                   if not any(Overlaps(check, r) for check in badChecks))
+
+    def Check(self, layout, checks, total, firstBad = False):
+        """ Hashes the pieces of checks, returns the sorted list of bad """
+        """ piece indexes and a stats dict """
+        with Payload(layout) as payload:
+            def CheckOne(check):
+                index, offset, length, digest, hashFunc = check
+                piece = payload.Read(offset, length)
+                return index, length, piece is not None and hashFunc(piece) == digest
+
+            bad, checked, bytesRead = [], 0, 0
+            start = time.time()
+            pool  = ThreadPool(self.jobs) if self.jobs > 1 else None
+            try:
+                results = pool.imap(CheckOne, checks, 16) if pool else (CheckOne(c) for c in checks)
+                for index, length, good in results:
+                    checked   += 1
+                    bytesRead += length
+                    if not good:
+                        bad.append(index)
+                        self.logger.warning("Piece %s is bad" % index)
+                        if firstBad:
+                            break
+            finally:
+                if pool:
+                    pool.terminate()
+                    pool.join()
+            elapsed = time.time() - start
+
+        stats = { "pieces":  total,
+                  "checked": checked,
+                  "bad":     len(bad),
+                  "bytes":   bytesRead,
+                  "seconds": elapsed,
+                  "MBps":    bytesRead / max(elapsed, 1e-9) / 1e6 }
+        self.logger.info("Verified %(checked)s/%(pieces)s pieces, %(bad)s bad, "
+                         "%(bytes)s bytes in %(seconds).2f s, %(MBps).1f MB/s" % stats)
+
+        return sorted(bad), stats
@@ -16,97 +16,383 @@
 
 
 # External imports
+# Only what every subcommand needs, each action imports the rest itself so
+# that mktorrent or pushtorrent never load libtorrent or pyinotify, and
+# only pushes load requests
+import os
 import sys
 import time
-import urllib
-import requests
-import tempfile
-import pyinotify
-import libtorrent as lt
-from argparse import ArgumentParser
+from argparse import ArgumentParser, REMAINDER
 
 
 # Application imports
 import LogUtils
-import Torrent
+import Metrics
+import Scheduler        # light, for the argument parser defaults
 
 
 #############
 # ActionMKTorrent
 ###
 
-def ActionMKTorrent(logger, args):
-    torrent = Torrent.Torrent(logger)
+def ActionMKTorrent(logger, args, hashCache = None, catalog = None):
+    import Torrent
+    import Catalog
+    import HashCache
+    import PieceSize
+
+    ownCache = hashCache is None and args.get("hashCacheFile")
+    if ownCache:
+        hashCache = HashCache.HashCache(logger,
+                                        args["hashCacheFile"],
+                                        args["hashCacheSize"])
+    ownCatalog = catalog is None and args.get("catalogFile")
+    if ownCatalog:
+        catalog = Catalog.Catalog(logger, args["catalogFile"])
+
+    piecePolicy = None
+    if args.get("piecePolicy") or args.get("maxPieceSize"):
+        piecePolicy = PieceSize.NewPiecePolicy(args.get("piecePolicy") or "monotorrent",
+                                               args.get("maxPieceSize"))
+
+    torrent = Torrent.Torrent(logger, args.get("jobs", 1), hashCache, piecePolicy,
+                              args.get("metaVersion") or "v1")
     torrent.WriteTorrentFile(args["destFile"],
                              args["sourceFile"],
                              args["trackerAnnUri"],
                              comment = "Created by pyBTclient")
 
+    if catalog:
+        catalog.AddFile(args["destFile"], args.get("fileKey"))
+
+    if ownCache:
+        logger.info("Hash cache stats: %s" % hashCache.Stats())
+        hashCache.close()
+    if ownCatalog:
+        catalog.close()
+
 
 #############
 # ActionDNLDTorrent
 ###
 
 def ActionDNLDTorrent(logger, args):
+    import io
+    import libtorrent as lt
+    import Verifier
+    import ContentStore
+    import ResumeData
+    import SessionManager
+    import SessionProfiles
+    from BencodeUtils import bdecode_lazy
+
+    # Payloads already on this host are linked in, then only verified
+    store, linked = None, 0
+    if args.get("storeDir"):
+        store = ContentStore.ContentStore(logger, args["storeDir"], args["storeLink"])
+        linked, linkedBytes, complete, verified = store.Prefill(args["torrentFile"], args["destPath"])
+        if complete:
+            bad = [] if verified else Verifier.Verifier(logger).Verify(args["torrentFile"], args["destPath"])[0]
+            if not bad:
+                store.Register(args["torrentFile"], args["destPath"])
+                logger.info("Completed [%s] from the store" % args["torrentFile"])
+                return
 
     ses = lt.session()
     ses.listen_on(args["portStart"],
                   args["portEnd"])
 
+    settings = SessionProfiles.SessionSettings(args.get("ltProfile"), args.get("ltSettings"))
+    if settings:
+        logger.info("Applying %s libtorrent settings" % len(settings))
+        ses.apply_settings(settings)
+
+    scheduler = Scheduler.Scheduler(logger, ses, args.get("downloadLimit"), args.get("uploadLimit"))
+
     info = lt.torrent_info(args["torrentFile"])
-    h = ses.add_torrent({'ti':           info,
-                         'save_path':    args["destPath"],
-                         'storage_mode': (lt.storage_mode_t.storage_mode_allocate
-                                          if args["allocateStorage"]
-                                          else lt.storage_mode_t.storage_mode_sparse)
-                         })
+
+    # libtorrent reads a v2 torrent of a one-file directory as a single
+    # file, lay it out under the directory like the store and verify do
+    with io.open(args["torrentFile"], "rb") as f:
+        root = Verifier.PayloadRoot(bdecode_lazy(f.read())["info"])
+    storage = info.files()
+    if root and not storage.file_path(0).startswith(root[0] + os.sep):
+        for i in range(storage.num_files()):
+            if not Scheduler.IsPadFile(storage, i):
+                info.rename_file(i, os.path.join(root[0], storage.file_path(i)))
+
+    params = {'ti':           info,
+              'save_path':    args["destPath"],
+              'storage_mode': (lt.storage_mode_t.storage_mode_allocate
+                               if args["allocateStorage"]
+                               else lt.storage_mode_t.storage_mode_sparse)
+              }
+
+    # Fast-resume, skips the full check of the data already on disk
+    resumeStore = None
+    if args.get("stateDir"):
+        resumeStore = ResumeData.ResumeStore(logger, args["stateDir"])
+        if args["forceRecheck"] or linked:
+            resumeStore.Discard(str(info.info_hash()))
+        else:
+            resumeData = resumeStore.Load(str(info.info_hash()))
+            if resumeData:
+                params['resume_data'] = resumeData
+
+    h = ses.add_torrent(params)
+    scheduler.Add(h, info, TorrentOptions(args))
+    scheduler.Step()
+
+    stats = SessionManager.SessionStats(ses, interval = 1) if Metrics.registry.enabled else None
+
+    # SIGTERM or SIGHUP end the loop, the resume data is saved below
+    stopped = []
+    SessionManager.OnStopSignals(logger, lambda: stopped.append(True))
 
     logger.info("Starting [%s]" % h.name())
-    while (not h.is_seed()):
-       s = h.status()
+    lastSave = time.time()
+    try:
+        # Finished rather than seeding, some files may be skipped
+        while (not h.is_finished() and not stopped):
+           start = time.time()
+           s = h.status()
+
+           state_str = ['queued', 'checking', 'downloading metadata', \
+              'downloading', 'finished', 'seeding', 'allocating', 'checking fastresume']
+           print '\r%.2f%% complete (down: %.1f kb/s up: %.1f kB/s peers: %d) %s' % \
+              (s.progress * 100, s.download_rate / 1000, s.upload_rate / 1000, \
+              s.num_peers, state_str[s.state]),
+           sys.stdout.flush()
 
-       state_str = ['queued', 'checking', 'downloading metadata', \
-          'downloading', 'finished', 'seeding', 'allocating', 'checking fastresume']
-       print '\r%.2f%% complete (down: %.1f kb/s up: %.1f kB/s peers: %d) %s' % \
-          (s.progress * 100, s.download_rate / 1000, s.upload_rate / 1000, \
-          s.num_peers, state_str[s.state]),
-       sys.stdout.flush()
+           if stats:
+               stats.Poll([h])
+           if resumeStore or stats:
+               for alert in ses.pop_alerts():
+                   if not (resumeStore and resumeStore.HandleAlert(alert)) and stats:
+                       stats.HandleAlert(alert)
+           if resumeStore and time.time() - lastSave >= args["resumeInterval"]:
+               resumeStore.Request([h])
+               lastSave = time.time()
 
-       time.sleep(1)
+           scheduler.Step()
+           if args.get("streamStatus"):
+               scheduler.WriteStatus(h, args["streamStatus"])
 
+           SessionManager.STEP_SECONDS.Observe(time.time() - start)
+           time.sleep(1)
+    finally:
+        if resumeStore:
+            resumeStore.SaveAll(ses, [h])
+
+    if stopped:
+        logger.info("Stopped [%s]" % h.name())
+        return
+    if args.get("streamStatus"):
+        scheduler.WriteStatus(h, args["streamStatus"])
+    if store and h.is_seed():
+        store.Register(args["torrentFile"], args["destPath"])
     logger.info("Completed [%s]" % h.name())
 
 
+def TorrentOptions(args):
+    """ The Scheduler options of the dnldtorrent and dnldfromkey flags """
+    params  = ["file:%s" % p for p in args.get("filePriorities") or []]
+    params += ["pieces:%s" % p for p in args.get("piecePriorities") or []]
+    if args.get("stream"):
+        params += ["stream=1",
+                   "readahead=%s" % args["readAhead"],
+                   "deadline=%s" % args["deadline"]]
+    return Scheduler.TorrentOptions(params)
+
+
+#############
+# ActionDaemon
+###
+
+def ActionDaemon(logger, args):
+    import Runtime
+    import SessionManager
+
+    manager = SessionManager.SessionManager(logger, args)
+    if not args["watchPaths"]:
+        manager.Run()
+        return
+
+    # Also index and push the watched paths, all from one event loop
+    if not (args["trackerAnnUri"] and args["trackerPushUri"]):
+        logger.error("--watch needs --tracker-ann-uri and --tracker-push-uri")
+        sys.exit(2)
+
+    logger.info("Watching [%s] and pushing to [%s]" % (args["watchPaths"], args["trackerPushUri"]))
+    pipeline, watcher, notifier, cleanup = NewAutoIndexer(logger, args)
+    try:
+        Runtime.Runtime(logger, manager, pipeline, watcher, notifier, args["watchPaths"]).Run()
+    finally:
+        cleanup()
+
+
+#############
+# ActionVerify
+###
+
+def ActionVerify(logger, args):
+    import Verifier
+
+    verifier = Verifier.Verifier(logger, args["jobs"])
+    bad, stats = verifier.Verify(args["torrentFile"],
+                                 args["destPath"],
+                                 args["firstBad"],
+                                 args["sample"],
+                                 args["seed"])
+
+    print "%(checked)s/%(pieces)s pieces checked, %(bad)s bad, %(MBps).1f MB/s" % stats
+    if bad:
+        print "Bad pieces: %s" % " ".join(str(index) for index in bad)
+        sys.exit(1)
+
+
+#############
+# ActionCatalog
+###
+
+def ActionCatalog(logger, args):
+    import Catalog
+
+    catalog = Catalog.Catalog(logger, args["catalogFile"])
+    try:
+        if args["command"] == "import":
+            imported, failed = catalog.Import(args["params"])
+            print "%s torrents imported, %s failed" % (imported, failed)
+
+        elif args["command"] in ("get", "hash"):
+            if len(args["params"]) != 1:
+                print "%s takes one %s" % (args["command"], "key" if args["command"] == "get" else "info-hash")
+                sys.exit(2)
+            if args["command"] == "get":
+                content = catalog.ByKey(args["params"][0])
+            else:
+                content = catalog.ByInfoHash(args["params"][0])
+            if content is None:
+                print "Not found [%s]" % args["params"][0]
+                sys.exit(1)
+            if args["output"]:
+                with open(args["output"], "wb") as f:
+                    f.write(content)
+            else:
+                sys.stdout.write(content)
+
+        elif args["command"] == "find":
+            for entry in catalog.Find(args["name"], args["minSize"], args["maxSize"], args["limit"]):
+                print "%(infoHash)s %(size)12s %(fileKey)s %(name)s" % entry
+
+        else:
+            print " ".join("%s=%s" % item for item in sorted(catalog.Stats().items()))
+    finally:
+        catalog.close()
+
+
+#############
+# ActionDaemonCtl
+###
+
+def ActionDaemonCtl(logger, args):
+    import ControlClient
+
+    print ControlClient.SendCommand(args["controlSocket"], " ".join(args["command"])),
+
+
 #############
 # ActionDNLDFromKey
 ###
 
 def ActionDNLDFromKey(logger, args):
+    import tempfile
+    import Catalog
+
+    # The local catalog first, the tracker when it does not know the key
+    catalog = Catalog.Catalog(logger, args["catalogFile"]) if args.get("catalogFile") else None
+    content = catalog.ByKey(args["fileKey"]) if catalog else None
+    if content is None:
+        logger.info("Retrieving key [%s]" % args["fileKey"])
+        client = NewTrackerClient(logger, args)
+        content = client.Get(args["trackerGetUri"], args["fileKey"])
+        client.close()
+        if catalog:
+            catalog.Add(content, args["fileKey"])
+    else:
+        logger.info("Found key [%s] in the catalog" % args["fileKey"])
+    if catalog:
+        catalog.close()
 
-    # Download the torrent identified by fileKey to a temp location
-    tempFile = tempfile.NamedTemporaryFile(delete = false)
-    logger.info("Retrieving key [%s] to [%s]" % (args["fileKey"], tempFile))
-    tempFile.write(urllib.urlopen(args["trackerGetUri"] + "?key=" + args["fileKey"]).read())
+    # Write the torrent identified by fileKey to a temp location
+    tempFile = tempfile.NamedTemporaryFile(delete = False)
+    tempFile.write(content)
     tempFile.close()
 
     args["torrentFile"] = tempFile.name
 
     # Pass the processing along to the regular
     # torrent download routine
-    ActionDNLDTorrent(logger, args)
-
-    # Cleanup the temp file
-    tempFile.unlink(tempFile.name)
+    try:
+        ActionDNLDTorrent(logger, args)
+    finally:
+        # Cleanup the temp file
+        os.unlink(tempFile.name)
 
 
 #############
 # ActionPushTorrent
 ###
 
-def ActionPushTorrent(logger, args):
-    requests.post(args["trackerPushUri"],
-                  files = { "torrentFile": (args["fileKey"], open(args["torrentFile"], 'rb')) },
-                )
+def ActionPushTorrent(logger, args, client = None):
+    ownClient = client is None
+    if ownClient:
+        client = NewTrackerClient(logger, args)
+
+    try:
+        if args.get("batch"):
+            ActionPushTorrentBatch(logger, args, client)
+        else:
+            client.Push(args["trackerPushUri"], args["fileKey"], args["torrentFile"])
+    finally:
+        if ownClient:
+            client.close()
+
+
+def ActionPushTorrentBatch(logger, args, client):
+    """ torrentFile lists one "<torrentFile> <fileKey>" per line, """
+    """ "-" reads the list from stdin as it is written """
+    import TrackerClient
+
+    pusher = TrackerClient.BatchPusher(logger,
+                                       client,
+                                       args["trackerPushUri"],
+                                       args["batchSize"],
+                                       args["flushInterval"])
+
+    listFile = sys.stdin if args["torrentFile"] == "-" else open(args["torrentFile"])
+    try:
+        for line in iter(listFile.readline, ""):
+            if line.strip():
+                torrentFile, fileKey = line.strip().rsplit(None, 1)
+                pusher.Add(fileKey, torrentFile)
+    finally:
+        pusher.close()
+        if listFile is not sys.stdin:
+            listFile.close()
+
+
+#############
+# NewTrackerClient
+###
+
+def NewTrackerClient(logger, args):
+    import TrackerClient
+
+    return TrackerClient.TrackerClient(logger,
+                                       poolSize = args.get("httpPool", 8),
+                                       timeout  = args.get("httpTimeout", 30),
+                                       retries  = args.get("httpRetries", 3))
 
 
 #############
@@ -114,44 +400,173 @@ def ActionPushTorrent(logger, args):
 ###
 
 def ActionAutoIndexer(logger, args):
-    logger.info("Watching [%s] and pushing to [%s]" % (args["trackerPushUri"], args["watchPaths"]))
+    logger.info("Watching [%s] and pushing to [%s]" % (args["watchPaths"], args["trackerPushUri"]))
+
+    pipeline, watcher, notifier, cleanup = NewAutoIndexer(logger, args)
+    pipeline.Start()
+    watcher.Start(args["watchPaths"])
+
+    logger.info("Main loop starting...")
+    try:
+        notifier.loop()
+    finally:
+        watcher.Stop()
+        pipeline.Stop()
+        cleanup()
 
-    eventHandler = ActionAutoIndexerEvents(logger, args)
-    watchManager = pyinotify.WatchManager()
 
-    for path in args["watchPaths"]:
-        watchManager.add_watch(path, pyinotify.IN_CLOSE_WRITE, rec = True)
+#############
+# NewAutoIndexer
+###
+
+def NewAutoIndexer(logger, args):
+    """ Returns the indexing pipeline, the tree watcher and inotify """
+    """ notifier feeding it and a cleanup function for after Stop(); """
+    """ the watcher is started after the pipeline and stopped before it """
+    import pyinotify
+    import Catalog
+    import HashCache
+    import TreeWatcher
+    import IndexerPipeline
+
+    hashCache = None
+    if args.get("hashCacheFile"):
+        hashCache = HashCache.HashCache(logger,
+                                        args["hashCacheFile"],
+                                        args["hashCacheSize"])
+    catalog = None
+    if args.get("catalogFile"):
+        catalog = Catalog.Catalog(logger, args["catalogFile"])
+
+    def MakeTorrent(sourceFile, destFile):
+        ActionMKTorrent(logger, { "destFile":      destFile,
+                                  "sourceFile":    sourceFile,
+                                  "trackerAnnUri": args["trackerAnnUri"],
+                                  "jobs":          args["jobs"],
+                                  "piecePolicy":   args["piecePolicy"],
+                                  "maxPieceSize":  args["maxPieceSize"],
+                                  "metaVersion":   args["metaVersion"] },
+                        hashCache)
+
+    client = NewTrackerClient(logger, args)
+
+    def PushTorrents(batch):
+        # Before the push, the torrent files are deleted after it
+        if catalog:
+            for fileKey, torrentFile in batch:
+                with open(torrentFile, "rb") as f:
+                    catalog.Add(f.read(), fileKey)
 
+        if args["batch"]:
+            client.PushBatch(args["trackerPushUri"], batch)
+            return
+
+        for fileKey, torrentFile in batch:
+            ActionPushTorrent(logger, { "fileKey":        fileKey,
+                                        "torrentFile":    torrentFile,
+                                        "trackerPushUri": args["trackerPushUri"] },
+                              client)
+
+    pipeline = IndexerPipeline.IndexerPipeline(logger, args, MakeTorrent, PushTorrents)
+
+    # Watches are added by the watcher as its scan reaches each directory
+    watchManager = pyinotify.WatchManager()
+    watcher = TreeWatcher.TreeWatcher(logger,
+                                      watchManager,
+                                      pipeline,
+                                      args.get("scanJobs", 4),
+                                      args.get("snapshotFile"))
+
+    eventHandler = TreeWatcher.TreeWatcherEvents(logger, watcher)
     notifier = pyinotify.Notifier(watchManager, eventHandler)
 
-    logger.info("Main loop starting...")
-    notifier.loop()
+    def Cleanup():
+        watcher.Save()
+        client.close()
+        if hashCache:
+            logger.info("Hash cache stats: %s" % hashCache.Stats())
+            hashCache.close()
+        if catalog:
+            logger.info("Catalog stats: %s" % catalog.Stats())
+            catalog.close()
+
+    return pipeline, watcher, notifier, Cleanup
 
 
 #############
-# ActionAutoIndexerEvents
+# ActionWorker
 ###
 
-class ActionAutoIndexerEvents(pyinotify.ProcessEvent):
-    def __init__(self, logger, args):
-        self.logger = logger.getChild(self.__class__.__name__)
-        self.args   = args
+WORKER_JOBS = ("mktorrent", "pushtorrent")
+
+
+def ActionWorker(logger, args):
+    """ Runs mktorrent and pushtorrent jobs read from stdin, one command """
+    """ line per job as given to pyBTclient.py, and answers each one in """
+    """ order with an "ok" or "error <message>" line on stdout. The jobs """
+    """ share the hash cache, catalog and tracker connections of the """
+    """ worker options, and its interpreter and imports """
+    import shlex
+    import Catalog
+    import HashCache
+
+    jobParser = NewArgParser(JobArgumentParser)
+    hashCache, catalog, client = None, None, None
+    if args["hashCacheFile"]:
+        hashCache = HashCache.HashCache(logger,
+                                        args["hashCacheFile"],
+                                        args["hashCacheSize"])
+    if args["catalogFile"]:
+        catalog = Catalog.Catalog(logger, args["catalogFile"])
 
-    def process_IN_CLOSE_WRITE(self, event):
-        path = os.path.join(event.path, event.name)
-        self.logger("process_IN_CLOSE_WRITE -> %s" % path)
+    done, failed = 0, 0
+    try:
+        for line in iter(sys.stdin.readline, ""):
+            if not line.strip():
+                continue
+            try:
+                jobArgs = vars(jobParser.parse_args(shlex.split(line)))
+                CheckArgs(jobParser, jobArgs)
+                if jobArgs["func"] == ActionMKTorrent:
+                    ActionMKTorrent(logger, jobArgs, hashCache, catalog)
+                elif jobArgs["func"] == ActionPushTorrent:
+                    if jobArgs["batch"] and jobArgs["torrentFile"] == "-":
+                        raise ValueError("The jobs are read from stdin, not a push list")
+                    client = client or NewTrackerClient(logger, args)
+                    ActionPushTorrent(logger, jobArgs, client)
+                else:
+                    raise ValueError("Only %s jobs are run by the worker" % " and ".join(WORKER_JOBS))
+                reply = "ok"
+                done += 1
+            except Exception as e:
+                logger.error("Job [%s] failed: %s" % (line.strip(), e))
+                reply = "error %s" % " ".join(str(e).split())
+                failed += 1
+            sys.stdout.write(reply + "\n")
+            sys.stdout.flush()
+    finally:
+        logger.info("Worker stopping, %s jobs done, %s failed" % (done, failed))
+        if client:
+            client.close()
+        if hashCache:
+            logger.info("Hash cache stats: %s" % hashCache.Stats())
+            hashCache.close()
+        if catalog:
+            catalog.close()
 
-        tempFile = tempfile.NamedTemporaryFile(delete = false)
-        tempFile.close()
 
-        ActionMKTorrent(logger, { "destFile":         tempFile.name,
-                                  "sourceFile":       path,
-                                  "trackerAnnUri":    self.args["trackerAnnUri"] })
-        ActionPushTorrent(logger, { "fileKey":        event.name,
-                                    "torrentFile":    tempFile.name,
-                                    "trackerPushUri": self.args["trackerPushUri"] })
+class JobArgumentParser(ArgumentParser):
+    """ Parses the worker jobs, errors raise ValueError instead of """
+    """ exiting and help goes to stderr, away from the replies """
 
-        tempFile.unlink(tempFile.name)
+    def error(self, message):
+        raise ValueError(message)
+
+    def exit(self, status = 0, message = None):
+        raise ValueError(message or "Exited with status %s" % status)
+
+    def print_help(self, file = None):
+        ArgumentParser.print_help(self, sys.stderr)
 
 
 #############
@@ -159,21 +574,69 @@ class ActionAutoIndexerEvents(pyinotify.ProcessEvent):
 ###
 
 def ActionTests(logger, args):
+    import Torrent
+    import HashEngine
+    import Benchmarks
 
     if args["testName"] == "tsize":
         torrent = Torrent.Torrent(logger)
         torrent.TestPieceSize()
+        bench = Benchmarks.Benchmarks(logger)
+        bench.TestPiecePolicies()
+
+    elif args["testName"] == "hashbench":
+        engine = HashEngine.HashEngine(logger, args["jobs"])
+        engine.TestThroughput(args["benchSize"])
+
+    elif args["testName"] == "bdecodebench":
+        bench = Benchmarks.Benchmarks(logger)
+        bench.TestBdecode(args["benchTorrents"])
+        bench.TestBdecodeLazy(args["benchTorrents"])
+
+    elif args["testName"] == "pushbench":
+        bench = Benchmarks.Benchmarks(logger)
+        bench.TestPush(args["benchCount"], args["jobs"])
+
+    elif args["testName"] == "v2check":
+        bench = Benchmarks.Benchmarks(logger)
+        bench.TestMetaVersions()
+
+    elif args["testName"] == "logbench":
+        bench = Benchmarks.Benchmarks(logger)
+        bench.TestLogging(args["benchCount"])
+
+    elif args["testName"] == "scanbench":
+        bench = Benchmarks.Benchmarks(logger)
+        bench.TestScan(args["benchCount"], jobs = args["jobs"])
+
+    elif args["testName"] == "startupbench":
+        bench = Benchmarks.Benchmarks(logger)
+        bench.TestStartup(args["benchRuns"])
+
+    elif args["testName"] == "streambench":
+        bench = Benchmarks.Benchmarks(logger)
+        bench.TestStreaming(args["benchSize"])
+
+    elif args["testName"] == "swarmbench":
+        bench = Benchmarks.Benchmarks(logger)
+        bench.TestSwarm(args["swarmProfiles"] or ("default", "high_performance_seed", "min_memory"),
+                        args["swarmLeechers"], args["benchSize"])
+
+    elif args["testName"] == "suite":
+        bench = Benchmarks.Benchmarks(logger)
+        bench.RunSuite(args["benchProfile"], args["jobs"], args["benchCount"],
+                       args["benchDir"], args["benchJson"])
 
 
 #############
-# Main
+# Command line
 ###
 
-if __name__ == "__main__":
+def NewArgParser(parserClass = ArgumentParser):
+    """ The parser of the command line, and of the worker jobs """
 
-    # Parse the command line arguments
     # Define the main parser (top-level)
-    argParser = ArgumentParser()
+    argParser = parserClass()
 
     argParser.add_argument("-f", "--foreground",
                            dest    = "foreground",
@@ -191,6 +654,34 @@ if __name__ == "__main__":
                            action  = "store",
                            default = "/tmp/pyBTclient.log",
                            help    = "Log file")
+    argParser.add_argument("--log-queue",
+                           dest    = "logQueue",
+                           action  = "store",
+                           type    = int,
+                           default = 0,
+                           help    = "Write the logs from a background thread through a queue of "
+                                     "this many records (default: 0, write on the calling thread)")
+    argParser.add_argument("--log-queue-policy",
+                           dest    = "logQueuePolicy",
+                           choices = ["block", "drop"],
+                           default = "block",
+                           help    = "When the log queue is full, wait for room or drop the record")
+    argParser.add_argument("--log-json",
+                           dest    = "logJson",
+                           action  = "store_true",
+                           default = False,
+                           help    = "Write one JSON object per log record")
+    argParser.add_argument("--metrics-port",
+                           dest    = "metricsPort",
+                           action  = "store",
+                           type    = int,
+                           default = None,
+                           help    = "Serve metrics on http://127.0.0.1:<port>/metrics (and /metrics.json)")
+    argParser.add_argument("--metrics-json",
+                           dest    = "metricsJson",
+                           action  = "store",
+                           default = None,
+                           help    = "Dump the metrics as JSON to this file on exit")
 
     subParsers = argParser.add_subparsers(help = "sub-command help")
 
@@ -198,13 +689,58 @@ if __name__ == "__main__":
     mktorrentParser = subParsers.add_parser("mktorrent", help = "mktorrent help")
     mktorrentParser.add_argument("sourceFile",
                                  action = "store",
-                                 help = "Source file for the torrent")
+                                 help = "Source file or directory for the torrent")
     mktorrentParser.add_argument("destFile",
                                  action = "store",
                                  help = "Filename of the torrent to be created")
     mktorrentParser.add_argument("trackerAnnUri",
                                  action = "store",
                                  help = "The address of the announce endpoint")
+    mktorrentParser.add_argument("-j", "--jobs",
+                                 dest = "jobs",
+                                 action = "store",
+                                 type = int,
+                                 default = 1,
+                                 help = "Number of piece hashing threads")
+    mktorrentParser.add_argument("--hash-cache",
+                                 dest = "hashCacheFile",
+                                 action = "store",
+                                 default = None,
+                                 help = "SQLite file caching piece hashes between runs")
+    mktorrentParser.add_argument("--hash-cache-size",
+                                 dest = "hashCacheSize",
+                                 action = "store",
+                                 type = int,
+                                 default = 256 * 1024 * 1024,
+                                 help = "Maximum bytes of piece hashes kept in the hash cache")
+    mktorrentParser.add_argument("--piece-policy",
+                                 dest = "piecePolicy",
+                                 action = "store",
+                                 default = None,
+                                 help = "Piece size policy: monotorrent, libtorrent, fixed:<bytes> "
+                                        "or count:<pieces> (default: the OptimalPieceSize rule)")
+    mktorrentParser.add_argument("--max-piece-size",
+                                 dest = "maxPieceSize",
+                                 action = "store",
+                                 type = int,
+                                 default = None,
+                                 help = "Largest piece size the policy may pick, in bytes")
+    mktorrentParser.add_argument("--meta-version",
+                                 dest = "metaVersion",
+                                 action = "store",
+                                 choices = ["v1", "v2", "hybrid"],
+                                 default = "v1",
+                                 help = "BitTorrent metadata version, hybrid torrents carry both (default: v1)")
+    mktorrentParser.add_argument("--catalog",
+                                 dest = "catalogFile",
+                                 action = "store",
+                                 default = None,
+                                 help = "SQLite catalog of torrents by key, info-hash, name and size")
+    mktorrentParser.add_argument("--file-key",
+                                 dest = "fileKey",
+                                 action = "store",
+                                 default = None,
+                                 help = "Key recorded for the torrent in the catalog")
     mktorrentParser.set_defaults(func = ActionMKTorrent)
 
     # Define the dnldtorrent sub-parser
@@ -231,8 +767,393 @@ if __name__ == "__main__":
                                    dest = "allocateStorage",
                                    action = "store_true",
                                    help = "This option does a full storage allocation")
+    dnldtorrentParser.add_argument("--state-dir",
+                                   dest = "stateDir",
+                                   action = "store",
+                                   default = None,
+                                   help = "Directory keeping fast-resume data between runs")
+    dnldtorrentParser.add_argument("--resume-interval",
+                                   dest = "resumeInterval",
+                                   action = "store",
+                                   type = int,
+                                   default = 60,
+                                   help = "Seconds between periodic saves of the resume data")
+    dnldtorrentParser.add_argument("--force-recheck",
+                                   dest = "forceRecheck",
+                                   action = "store_true",
+                                   help = "Ignore saved resume data and check all pieces on disk")
+    dnldtorrentParser.add_argument("--lt-profile",
+                                   dest = "ltProfile",
+                                   action = "store",
+                                   default = None,
+                                   help = "libtorrent settings profile: default, high_performance_seed, "
+                                          "min_memory or a .json/.ini settings file")
+    dnldtorrentParser.add_argument("--lt-setting",
+                                   dest = "ltSettings",
+                                   action = "append",
+                                   default = [],
+                                   help = "libtorrent setting name=value applied over the profile, may be repeated")
+    dnldtorrentParser.add_argument("--store",
+                                   dest = "storeDir",
+                                   action = "store",
+                                   default = None,
+                                   help = "Content addressed store of payloads: files already there are linked "
+                                          "in and verified instead of downloaded, downloads are added to it")
+    dnldtorrentParser.add_argument("--store-link",
+                                   dest = "storeLink",
+                                   action = "store",
+                                   choices = ["auto", "reflink", "hardlink"],
+                                   default = "auto",
+                                   help = "How files are shared with the store, auto == reflink when possible, "
+                                          "else a hard link once verified, else a copy")
+    dnldtorrentParser.add_argument("--download-limit",
+                                   dest = "downloadLimit",
+                                   action = "store",
+                                   type = int,
+                                   default = 0,
+                                   help = "Download rate limit of the session in bytes/s, 0 == none")
+    dnldtorrentParser.add_argument("--upload-limit",
+                                   dest = "uploadLimit",
+                                   action = "store",
+                                   type = int,
+                                   default = 0,
+                                   help = "Upload rate limit of the session in bytes/s, 0 == none")
+    dnldtorrentParser.add_argument("--file-priority",
+                                   dest = "filePriorities",
+                                   action = "append",
+                                   default = [],
+                                   help = "<glob>=<0..7> priority of the matching files, 0 skips them, may be repeated")
+    dnldtorrentParser.add_argument("--piece-priority",
+                                   dest = "piecePriorities",
+                                   action = "append",
+                                   default = [],
+                                   help = "<first>-<last>=<0..7> priority of a range of pieces, may be repeated")
+    dnldtorrentParser.add_argument("--stream",
+                                   dest = "stream",
+                                   action = "store_true",
+                                   help = "Download the wanted files in order, the pieces just past what is "
+                                          "already there with deadlines, so their heads can be read early")
+    dnldtorrentParser.add_argument("--read-ahead",
+                                   dest = "readAhead",
+                                   action = "store",
+                                   type = int,
+                                   default = Scheduler.DEFAULT_READ_AHEAD,
+                                   help = "Pieces given a deadline past the downloaded head with --stream")
+    dnldtorrentParser.add_argument("--deadline",
+                                   dest = "deadline",
+                                   action = "store",
+                                   type = int,
+                                   default = Scheduler.DEFAULT_DEADLINE,
+                                   help = "Milliseconds between the deadlines of consecutive read-ahead pieces")
+    dnldtorrentParser.add_argument("--stream-status",
+                                   dest = "streamStatus",
+                                   action = "store",
+                                   default = None,
+                                   help = "JSON file kept up to date with the bytes readable from the start of "
+                                          "each file, for consumers of --stream")
     dnldtorrentParser.set_defaults(func = ActionDNLDTorrent)
 
+    # Define the daemon sub-parser
+    daemonParser = subParsers.add_parser("daemon", help = "daemon help")
+    daemonParser.add_argument("destPath",
+                              action = "store",
+                              help = "Default location of the resulting file(s)")
+    daemonParser.add_argument("torrentFiles",
+                              action = "store",
+                              nargs = "*",
+                              help = "Torrent files to start with")
+    daemonParser.add_argument("--control-socket",
+                              dest = "controlSocket",
+                              action = "store",
+                              default = "/tmp/pyBTclient.sock",
+                              help = "Unix socket accepting add/addkey/status/quit commands")
+    daemonParser.add_argument("--tracker-get-uri",
+                              dest = "trackerGetUri",
+                              action = "store",
+                              default = None,
+                              help = "The address of the get endpoint, for addkey")
+    daemonParser.add_argument("--port-start",
+                              dest = "portStart",
+                              action = "store",
+                              type = int,
+                              default = 6881,
+                              help = "First port of the listen range")
+    daemonParser.add_argument("--port-end",
+                              dest = "portEnd",
+                              action = "store",
+                              type = int,
+                              default = 6981,
+                              help = "Last port of the listen range")
+    daemonParser.add_argument("--allocate-storage",
+                              dest = "allocateStorage",
+                              action = "store_true",
+                              help = "This option does a full storage allocation")
+    daemonParser.add_argument("--active-downloads",
+                              dest = "activeDownloads",
+                              action = "store",
+                              type = int,
+                              default = 8,
+                              help = "Maximum number of torrents downloading at once")
+    daemonParser.add_argument("--active-seeds",
+                              dest = "activeSeeds",
+                              action = "store",
+                              type = int,
+                              default = 200,
+                              help = "Maximum number of torrents seeding at once")
+    daemonParser.add_argument("--state-dir",
+                              dest = "stateDir",
+                              action = "store",
+                              default = None,
+                              help = "Directory keeping fast-resume data between runs")
+    daemonParser.add_argument("--resume-interval",
+                              dest = "resumeInterval",
+                              action = "store",
+                              type = int,
+                              default = 60,
+                              help = "Seconds between periodic saves of the resume data")
+    daemonParser.add_argument("--force-recheck",
+                              dest = "forceRecheck",
+                              action = "store_true",
+                              help = "Ignore saved resume data and check all pieces on disk")
+    daemonParser.add_argument("--http-timeout",
+                              dest = "httpTimeout",
+                              action = "store",
+                              type = float,
+                              default = 30.0,
+                              help = "Seconds before a tracker request times out")
+    daemonParser.add_argument("--http-retries",
+                              dest = "httpRetries",
+                              action = "store",
+                              type = int,
+                              default = 3,
+                              help = "Retries of a failed tracker request, with exponential backoff")
+    daemonParser.add_argument("--http-pool",
+                              dest = "httpPool",
+                              action = "store",
+                              type = int,
+                              default = 8,
+                              help = "Maximum concurrent tracker connections")
+    daemonParser.add_argument("--watch",
+                              dest = "watchPaths",
+                              action = "append",
+                              default = [],
+                              help = "Path to index and push, may be repeated")
+    daemonParser.add_argument("--tracker-ann-uri",
+                              dest = "trackerAnnUri",
+                              action = "store",
+                              default = None,
+                              help = "The address of the announce endpoint, for --watch")
+    daemonParser.add_argument("--tracker-push-uri",
+                              dest = "trackerPushUri",
+                              action = "store",
+                              default = None,
+                              help = "The address of the push endpoint, for --watch")
+    daemonParser.add_argument("--debounce",
+                              dest = "debounce",
+                              action = "store",
+                              type = float,
+                              default = 2.0,
+                              help = "Seconds a file must stay quiet before being indexed")
+    daemonParser.add_argument("--hash-workers",
+                              dest = "hashWorkers",
+                              action = "store",
+                              type = int,
+                              default = 2,
+                              help = "Number of files indexed concurrently")
+    daemonParser.add_argument("--jobs",
+                              dest = "jobs",
+                              action = "store",
+                              type = int,
+                              default = 1,
+                              help = "Number of piece hashing threads per file")
+    daemonParser.add_argument("--queue-size",
+                              dest = "queueSize",
+                              action = "store",
+                              type = int,
+                              default = 1000,
+                              help = "Bound of the hash and push queues")
+    daemonParser.add_argument("--batch",
+                              dest = "batch",
+                              action = "store_true",
+                              help = "Push many torrents per request")
+    daemonParser.add_argument("--batch-size",
+                              dest = "batchSize",
+                              action = "store",
+                              type = int,
+                              default = 50,
+                              help = "Maximum number of torrents per push batch")
+    daemonParser.add_argument("--flush-interval",
+                              dest = "flushInterval",
+                              action = "store",
+                              type = float,
+                              default = 1.0,
+                              help = "Seconds to wait for a push batch to fill")
+    daemonParser.add_argument("--stats-interval",
+                              dest = "statsInterval",
+                              action = "store",
+                              type = float,
+                              default = 60.0,
+                              help = "Seconds between pipeline stats log lines")
+    daemonParser.add_argument("--hash-cache",
+                              dest = "hashCacheFile",
+                              action = "store",
+                              default = None,
+                              help = "SQLite file caching piece hashes between runs")
+    daemonParser.add_argument("--hash-cache-size",
+                              dest = "hashCacheSize",
+                              action = "store",
+                              type = int,
+                              default = 256 * 1024 * 1024,
+                              help = "Maximum bytes of piece hashes kept in the hash cache")
+    daemonParser.add_argument("--piece-policy",
+                              dest = "piecePolicy",
+                              action = "store",
+                              default = None,
+                              help = "Piece size policy: monotorrent, libtorrent, fixed:<bytes> "
+                                     "or count:<pieces> (default: the OptimalPieceSize rule)")
+    daemonParser.add_argument("--max-piece-size",
+                              dest = "maxPieceSize",
+                              action = "store",
+                              type = int,
+                              default = None,
+                              help = "Largest piece size the policy may pick, in bytes")
+    daemonParser.add_argument("--meta-version",
+                              dest = "metaVersion",
+                              action = "store",
+                              choices = ["v1", "v2", "hybrid"],
+                              default = "v1",
+                              help = "BitTorrent metadata version, hybrid torrents carry both (default: v1)")
+    daemonParser.add_argument("--lt-profile",
+                              dest = "ltProfile",
+                              action = "store",
+                              default = None,
+                              help = "libtorrent settings profile: default, high_performance_seed, "
+                                     "min_memory or a .json/.ini settings file")
+    daemonParser.add_argument("--lt-setting",
+                              dest = "ltSettings",
+                              action = "append",
+                              default = [],
+                              help = "libtorrent setting name=value applied over the profile, may be repeated")
+    daemonParser.add_argument("--catalog",
+                              dest = "catalogFile",
+                              action = "store",
+                              default = None,
+                              help = "SQLite catalog of torrents by key, info-hash, name and size")
+    daemonParser.add_argument("--snapshot",
+                              dest = "snapshotFile",
+                              action = "store",
+                              default = None,
+                              help = "SQLite file of the watched files at the last clean shutdown, "
+                                     "the ones new or changed since are indexed at startup")
+    daemonParser.add_argument("--scan-jobs",
+                              dest = "scanJobs",
+                              action = "store",
+                              type = int,
+                              default = 4,
+                              help = "Number of threads walking the watched trees")
+    daemonParser.add_argument("--download-limit",
+                              dest = "downloadLimit",
+                              action = "store",
+                              type = int,
+                              default = 0,
+                              help = "Download rate limit of the session in bytes/s, 0 == none")
+    daemonParser.add_argument("--upload-limit",
+                              dest = "uploadLimit",
+                              action = "store",
+                              type = int,
+                              default = 0,
+                              help = "Upload rate limit of the session in bytes/s, 0 == none")
+    daemonParser.set_defaults(func = ActionDaemon)
+
+    # Define the verify sub-parser
+    verifyParser = subParsers.add_parser("verify", help = "verify help")
+    verifyParser.add_argument("torrentFile",
+                              action = "store",
+                              help = "Torrent file describing the payload")
+    verifyParser.add_argument("destPath",
+                              action = "store",
+                              help = "Directory holding the payload, as given to dnldtorrent")
+    verifyParser.add_argument("-j", "--jobs",
+                              dest = "jobs",
+                              action = "store",
+                              type = int,
+                              default = 4,
+                              help = "Number of threads hashing pieces")
+    verifyParser.add_argument("--first-bad",
+                              dest = "firstBad",
+                              action = "store_true",
+                              help = "Stop at the first bad piece")
+    verifyParser.add_argument("--sample",
+                              dest = "sample",
+                              action = "store",
+                              type = float,
+                              default = None,
+                              help = "Only spot-check this fraction of the pieces, picked at random")
+    verifyParser.add_argument("--seed",
+                              dest = "seed",
+                              action = "store",
+                              type = int,
+                              default = None,
+                              help = "Random seed of --sample, to repeat a spot-check")
+    verifyParser.set_defaults(func = ActionVerify)
+
+    # Define the catalog sub-parser
+    catalogParser = subParsers.add_parser("catalog", help = "catalog help")
+    catalogParser.add_argument("catalogFile",
+                               action = "store",
+                               help = "SQLite catalog file")
+    catalogParser.add_argument("command",
+                               action = "store",
+                               choices = ["import", "get", "hash", "find", "stats"],
+                               help = "import <torrent files or directories>, get <fileKey>, "
+                                      "hash <info-hash>, find or stats")
+    catalogParser.add_argument("params",
+                               action = "store",
+                               nargs = "*",
+                               help = "Parameters of the command")
+    catalogParser.add_argument("--name",
+                               dest = "name",
+                               action = "store",
+                               default = None,
+                               help = "find: SQL LIKE pattern of the torrent name, e.g. %%.iso")
+    catalogParser.add_argument("--min-size",
+                               dest = "minSize",
+                               action = "store",
+                               type = int,
+                               default = None,
+                               help = "find: smallest payload size, in bytes")
+    catalogParser.add_argument("--max-size",
+                               dest = "maxSize",
+                               action = "store",
+                               type = int,
+                               default = None,
+                               help = "find: largest payload size, in bytes")
+    catalogParser.add_argument("--limit",
+                               dest = "limit",
+                               action = "store",
+                               type = int,
+                               default = 100,
+                               help = "find: maximum number of torrents listed")
+    catalogParser.add_argument("-o", "--output",
+                               dest = "output",
+                               action = "store",
+                               default = None,
+                               help = "get/hash: write the torrent here instead of stdout")
+    catalogParser.set_defaults(func = ActionCatalog)
+
+    # Define the daemonctl sub-parser
+    daemonctlParser = subParsers.add_parser("daemonctl", help = "daemonctl help")
+    daemonctlParser.add_argument("command",
+                                 action = "store",
+                                 nargs = REMAINDER,
+                                 help = "Command for the daemon (add, addkey, status, quit)")
+    daemonctlParser.add_argument("--control-socket",
+                                 dest = "controlSocket",
+                                 action = "store",
+                                 default = "/tmp/pyBTclient.sock",
+                                 help = "Unix socket of the daemon")
+    daemonctlParser.set_defaults(func = ActionDaemonCtl)
+
     # Define the dnldfromkey sub-parser
     dnldfromkeyParser = subParsers.add_parser("dnldfromkey", help = "dnldfromkey help")
     dnldfromkeyParser.add_argument("fileKey",
@@ -260,19 +1181,150 @@ if __name__ == "__main__":
                                    dest = "allocateStorage",
                                    action = "store_true",
                                    help = "This option does a full storage allocation")
+    dnldfromkeyParser.add_argument("--state-dir",
+                                   dest = "stateDir",
+                                   action = "store",
+                                   default = None,
+                                   help = "Directory keeping fast-resume data between runs")
+    dnldfromkeyParser.add_argument("--resume-interval",
+                                   dest = "resumeInterval",
+                                   action = "store",
+                                   type = int,
+                                   default = 60,
+                                   help = "Seconds between periodic saves of the resume data")
+    dnldfromkeyParser.add_argument("--force-recheck",
+                                   dest = "forceRecheck",
+                                   action = "store_true",
+                                   help = "Ignore saved resume data and check all pieces on disk")
+    dnldfromkeyParser.add_argument("--http-timeout",
+                                   dest = "httpTimeout",
+                                   action = "store",
+                                   type = float,
+                                   default = 30.0,
+                                   help = "Seconds before a tracker request times out")
+    dnldfromkeyParser.add_argument("--http-retries",
+                                   dest = "httpRetries",
+                                   action = "store",
+                                   type = int,
+                                   default = 3,
+                                   help = "Retries of a failed tracker request, with exponential backoff")
+    dnldfromkeyParser.add_argument("--lt-profile",
+                                   dest = "ltProfile",
+                                   action = "store",
+                                   default = None,
+                                   help = "libtorrent settings profile: default, high_performance_seed, "
+                                          "min_memory or a .json/.ini settings file")
+    dnldfromkeyParser.add_argument("--lt-setting",
+                                   dest = "ltSettings",
+                                   action = "append",
+                                   default = [],
+                                   help = "libtorrent setting name=value applied over the profile, may be repeated")
+    dnldfromkeyParser.add_argument("--catalog",
+                                   dest = "catalogFile",
+                                   action = "store",
+                                   default = None,
+                                   help = "SQLite catalog of torrents by key, info-hash, name and size")
+    dnldfromkeyParser.add_argument("--store",
+                                   dest = "storeDir",
+                                   action = "store",
+                                   default = None,
+                                   help = "Content addressed store of payloads: files already there are linked "
+                                          "in and verified instead of downloaded, downloads are added to it")
+    dnldfromkeyParser.add_argument("--store-link",
+                                   dest = "storeLink",
+                                   action = "store",
+                                   choices = ["auto", "reflink", "hardlink"],
+                                   default = "auto",
+                                   help = "How files are shared with the store, auto == reflink when possible, "
+                                          "else a hard link once verified, else a copy")
+    dnldfromkeyParser.add_argument("--download-limit",
+                                   dest = "downloadLimit",
+                                   action = "store",
+                                   type = int,
+                                   default = 0,
+                                   help = "Download rate limit of the session in bytes/s, 0 == none")
+    dnldfromkeyParser.add_argument("--upload-limit",
+                                   dest = "uploadLimit",
+                                   action = "store",
+                                   type = int,
+                                   default = 0,
+                                   help = "Upload rate limit of the session in bytes/s, 0 == none")
+    dnldfromkeyParser.add_argument("--file-priority",
+                                   dest = "filePriorities",
+                                   action = "append",
+                                   default = [],
+                                   help = "<glob>=<0..7> priority of the matching files, 0 skips them, may be repeated")
+    dnldfromkeyParser.add_argument("--piece-priority",
+                                   dest = "piecePriorities",
+                                   action = "append",
+                                   default = [],
+                                   help = "<first>-<last>=<0..7> priority of a range of pieces, may be repeated")
+    dnldfromkeyParser.add_argument("--stream",
+                                   dest = "stream",
+                                   action = "store_true",
+                                   help = "Download the wanted files in order, the pieces just past what is "
+                                          "already there with deadlines, so their heads can be read early")
+    dnldfromkeyParser.add_argument("--read-ahead",
+                                   dest = "readAhead",
+                                   action = "store",
+                                   type = int,
+                                   default = Scheduler.DEFAULT_READ_AHEAD,
+                                   help = "Pieces given a deadline past the downloaded head with --stream")
+    dnldfromkeyParser.add_argument("--deadline",
+                                   dest = "deadline",
+                                   action = "store",
+                                   type = int,
+                                   default = Scheduler.DEFAULT_DEADLINE,
+                                   help = "Milliseconds between the deadlines of consecutive read-ahead pieces")
+    dnldfromkeyParser.add_argument("--stream-status",
+                                   dest = "streamStatus",
+                                   action = "store",
+                                   default = None,
+                                   help = "JSON file kept up to date with the bytes readable from the start of "
+                                          "each file, for consumers of --stream")
     dnldfromkeyParser.set_defaults(func = ActionDNLDFromKey)
 
     # Define the pushtorrent sub-parser
     pushtorrentParser = subParsers.add_parser("pushtorrent", help = "pushtorrent help")
     pushtorrentParser.add_argument("torrentFile",
                                    action = "store",
-                                   help = "Source torrent file")
+                                   help = "Source torrent file, with --batch a list of "
+                                          "'<torrentFile> <fileKey>' lines ('-' for stdin)")
     pushtorrentParser.add_argument("fileKey",
                                    action = "store",
-                                   help = "Key for the torrent definition")
+                                   nargs = "?",
+                                   help = "Key for the torrent definition, omitted with --batch")
     pushtorrentParser.add_argument("trackerPushUri",
                                    action = "store",
                                    help = "The address of the push endpoint")
+    pushtorrentParser.add_argument("--http-timeout",
+                                   dest = "httpTimeout",
+                                   action = "store",
+                                   type = float,
+                                   default = 30.0,
+                                   help = "Seconds before a tracker request times out")
+    pushtorrentParser.add_argument("--http-retries",
+                                   dest = "httpRetries",
+                                   action = "store",
+                                   type = int,
+                                   default = 3,
+                                   help = "Retries of a failed tracker request, with exponential backoff")
+    pushtorrentParser.add_argument("--batch",
+                                   dest = "batch",
+                                   action = "store_true",
+                                   help = "Push many torrents per request")
+    pushtorrentParser.add_argument("--batch-size",
+                                   dest = "batchSize",
+                                   action = "store",
+                                   type = int,
+                                   default = 50,
+                                   help = "Maximum number of torrents per push batch")
+    pushtorrentParser.add_argument("--flush-interval",
+                                   dest = "flushInterval",
+                                   action = "store",
+                                   type = float,
+                                   default = 1.0,
+                                   help = "Seconds to wait for a push batch to fill")
     pushtorrentParser.set_defaults(func = ActionPushTorrent)
 
     # Define the autoindexer sub-parser
@@ -285,27 +1337,292 @@ if __name__ == "__main__":
                                    help = "The address of the push endpoint")
     autoindexerParser.add_argument("watchPaths",
                                    action = "store",
-                                   nargs = argparse.REMAINDER,
+                                   nargs = REMAINDER,
                                    help = "The address of the push endpoint")
+    autoindexerParser.add_argument("--hash-cache",
+                                   dest = "hashCacheFile",
+                                   action = "store",
+                                   default = None,
+                                   help = "SQLite file caching piece hashes between runs")
+    autoindexerParser.add_argument("--hash-cache-size",
+                                   dest = "hashCacheSize",
+                                   action = "store",
+                                   type = int,
+                                   default = 256 * 1024 * 1024,
+                                   help = "Maximum bytes of piece hashes kept in the hash cache")
+    autoindexerParser.add_argument("--debounce",
+                                   dest = "debounce",
+                                   action = "store",
+                                   type = float,
+                                   default = 2.0,
+                                   help = "Seconds a file must stay quiet before being indexed")
+    autoindexerParser.add_argument("--hash-workers",
+                                   dest = "hashWorkers",
+                                   action = "store",
+                                   type = int,
+                                   default = 2,
+                                   help = "Number of files indexed concurrently")
+    autoindexerParser.add_argument("--jobs",
+                                   dest = "jobs",
+                                   action = "store",
+                                   type = int,
+                                   default = 1,
+                                   help = "Number of piece hashing threads per file")
+    autoindexerParser.add_argument("--queue-size",
+                                   dest = "queueSize",
+                                   action = "store",
+                                   type = int,
+                                   default = 1000,
+                                   help = "Bound of the hash and push queues")
+    autoindexerParser.add_argument("--batch",
+                                   dest = "batch",
+                                   action = "store_true",
+                                   help = "Push many torrents per request")
+    autoindexerParser.add_argument("--batch-size",
+                                   dest = "batchSize",
+                                   action = "store",
+                                   type = int,
+                                   default = 50,
+                                   help = "Maximum number of torrents per push batch")
+    autoindexerParser.add_argument("--flush-interval",
+                                   dest = "flushInterval",
+                                   action = "store",
+                                   type = float,
+                                   default = 1.0,
+                                   help = "Seconds to wait for a push batch to fill")
+    autoindexerParser.add_argument("--stats-interval",
+                                   dest = "statsInterval",
+                                   action = "store",
+                                   type = float,
+                                   default = 60.0,
+                                   help = "Seconds between pipeline stats log lines")
+    autoindexerParser.add_argument("--http-timeout",
+                                   dest = "httpTimeout",
+                                   action = "store",
+                                   type = float,
+                                   default = 30.0,
+                                   help = "Seconds before a tracker request times out")
+    autoindexerParser.add_argument("--http-retries",
+                                   dest = "httpRetries",
+                                   action = "store",
+                                   type = int,
+                                   default = 3,
+                                   help = "Retries of a failed tracker request, with exponential backoff")
+    autoindexerParser.add_argument("--http-pool",
+                                   dest = "httpPool",
+                                   action = "store",
+                                   type = int,
+                                   default = 8,
+                                   help = "Maximum concurrent tracker connections")
+    autoindexerParser.add_argument("--piece-policy",
+                                   dest = "piecePolicy",
+                                   action = "store",
+                                   default = None,
+                                   help = "Piece size policy: monotorrent, libtorrent, fixed:<bytes> "
+                                          "or count:<pieces> (default: the OptimalPieceSize rule)")
+    autoindexerParser.add_argument("--max-piece-size",
+                                   dest = "maxPieceSize",
+                                   action = "store",
+                                   type = int,
+                                   default = None,
+                                   help = "Largest piece size the policy may pick, in bytes")
+    autoindexerParser.add_argument("--meta-version",
+                                   dest = "metaVersion",
+                                   action = "store",
+                                   choices = ["v1", "v2", "hybrid"],
+                                   default = "v1",
+                                   help = "BitTorrent metadata version, hybrid torrents carry both (default: v1)")
+    autoindexerParser.add_argument("--catalog",
+                                   dest = "catalogFile",
+                                   action = "store",
+                                   default = None,
+                                   help = "SQLite catalog of torrents by key, info-hash, name and size")
+    autoindexerParser.add_argument("--snapshot",
+                                   dest = "snapshotFile",
+                                   action = "store",
+                                   default = None,
+                                   help = "SQLite file of the watched files at the last clean shutdown, "
+                                          "the ones new or changed since are indexed at startup")
+    autoindexerParser.add_argument("--scan-jobs",
+                                   dest = "scanJobs",
+                                   action = "store",
+                                   type = int,
+                                   default = 4,
+                                   help = "Number of threads walking the watched trees")
     autoindexerParser.set_defaults(func = ActionAutoIndexer)
 
+    # Define the worker sub-parser
+    workerParser = subParsers.add_parser("worker", help = "worker help")
+    workerParser.add_argument("--hash-cache",
+                              dest = "hashCacheFile",
+                              action = "store",
+                              default = None,
+                              help = "SQLite file caching piece hashes, shared by the mktorrent jobs")
+    workerParser.add_argument("--hash-cache-size",
+                              dest = "hashCacheSize",
+                              action = "store",
+                              type = int,
+                              default = 256 * 1024 * 1024,
+                              help = "Maximum bytes of piece hashes kept in the hash cache")
+    workerParser.add_argument("--catalog",
+                              dest = "catalogFile",
+                              action = "store",
+                              default = None,
+                              help = "SQLite catalog the mktorrent jobs record their torrents in")
+    workerParser.add_argument("--http-timeout",
+                              dest = "httpTimeout",
+                              action = "store",
+                              type = float,
+                              default = 30.0,
+                              help = "Seconds before a tracker request times out")
+    workerParser.add_argument("--http-retries",
+                              dest = "httpRetries",
+                              action = "store",
+                              type = int,
+                              default = 3,
+                              help = "Retries of a failed tracker request, with exponential backoff")
+    workerParser.add_argument("--http-pool",
+                              dest = "httpPool",
+                              action = "store",
+                              type = int,
+                              default = 8,
+                              help = "Maximum concurrent tracker connections")
+    workerParser.set_defaults(func = ActionWorker)
+
     # Define the tests sub-parser
     testsParser = subParsers.add_parser("tests", help = "tests help")
     testsParser.add_argument("testName",
-                             choices = ["tsize"],
+                             choices = ["tsize", "hashbench", "bdecodebench", "pushbench",
+                                        "v2check", "logbench", "suite", "swarmbench", "scanbench",
+                                        "streambench", "startupbench"],
                              help = "Name of the test to run")
+    testsParser.add_argument("-j", "--jobs",
+                             dest = "jobs",
+                             action = "store",
+                             type = int,
+                             default = 4,
+                             help = "Number of threads for hashbench, pushbench and scanbench")
+    testsParser.add_argument("--bench-size",
+                             dest = "benchSize",
+                             action = "store",
+                             type = int,
+                             default = 256 * 1024 * 1024,
+                             help = "Size in bytes of the synthetic hashbench, swarmbench and streambench file")
+    testsParser.add_argument("--bench-torrent",
+                             dest = "benchTorrents",
+                             action = "append",
+                             default = [],
+                             help = "Extra torrent file for bdecodebench, may be repeated")
+    testsParser.add_argument("--bench-count",
+                             dest = "benchCount",
+                             action = "store",
+                             type = int,
+                             default = 2000,
+                             help = "Number of operations for pushbench, logbench and suite, "
+                                    "of directories for scanbench")
+    testsParser.add_argument("--bench-runs",
+                             dest = "benchRuns",
+                             action = "store",
+                             type = int,
+                             default = 20,
+                             help = "Runs of each command timed by startupbench")
+    testsParser.add_argument("--bench-profile",
+                             dest = "benchProfile",
+                             action = "store",
+                             choices = ["quick", "full"],
+                             default = "quick",
+                             help = "Datasets of the suite: quick (up to 256 MiB, 10k files) "
+                                    "or full (up to 20 GiB, 100k files)")
+    testsParser.add_argument("--bench-dir",
+                             dest = "benchDir",
+                             action = "store",
+                             default = None,
+                             help = "Where the suite generates its datasets (default: the temp directory)")
+    testsParser.add_argument("--bench-json",
+                             dest = "benchJson",
+                             action = "store",
+                             default = None,
+                             help = "Write the suite results to this JSON file (default: stdout)")
+    testsParser.add_argument("--swarm-profile",
+                             dest = "swarmProfiles",
+                             action = "append",
+                             default = [],
+                             help = "libtorrent settings profile or file for swarmbench, may be "
+                                    "repeated (default: default, high_performance_seed, min_memory)")
+    testsParser.add_argument("--swarm-leechers",
+                             dest = "swarmLeechers",
+                             action = "store",
+                             type = int,
+                             default = 3,
+                             help = "Number of leecher sessions in swarmbench")
     testsParser.set_defaults(func = ActionTests)
 
+    return argParser
+
+
+def CheckArgs(argParser, argsDict):
+    """ The checks argparse cannot express, failing through argParser.error """
+    if argsDict["func"] == ActionPushTorrent and not argsDict["batch"] and not argsDict["fileKey"]:
+        argParser.error("pushtorrent: fileKey is required without --batch")
+
+    if argsDict.get("ltProfile") or argsDict.get("ltSettings"):
+        import SessionProfiles
+        try:
+            SessionProfiles.SessionSettings(argsDict["ltProfile"], argsDict["ltSettings"])
+        except (ValueError, IOError) as e:
+            argParser.error(str(e))
+
+    if argsDict.get("piecePolicy") or argsDict.get("maxPieceSize") is not None:
+        import PieceSize
+        try:
+            PieceSize.NewPiecePolicy(argsDict["piecePolicy"] or "monotorrent", argsDict["maxPieceSize"])
+        except ValueError as e:
+            argParser.error(str(e))
+
+    if argsDict["func"] in (ActionDNLDTorrent, ActionDNLDFromKey):
+        try:
+            TorrentOptions(argsDict)
+        except ValueError as e:
+            argParser.error(str(e))
+
+    if argsDict.get("debounce", 0) < 0:
+        argParser.error("--debounce must not be negative")
+
+    if argsDict["func"] == ActionVerify and argsDict["sample"] is not None and not 0 < argsDict["sample"] <= 1:
+        argParser.error("verify: --sample must be a fraction in (0, 1]")
+
+
+#############
+# Main
+###
+
+if __name__ == "__main__":
+
     # Parse the command line arguments
-    argsObj = argParser.parse_args()
-    argsDict = vars(argParser.parse_args())
+    argParser = NewArgParser()
+    argsDict  = vars(argParser.parse_args())
+    CheckArgs(argParser, argsDict)
 
     # Start the logging facilities
     logger = LogUtils.RotatingFile(__name__,
                                    argsDict["logLevel"],
                                    argsDict["logFile"],
-                                   argsDict["foreground"])
+                                   argsDict["foreground"],
+                                   argsDict["logQueue"],
+                                   argsDict["logQueuePolicy"],
+                                   argsDict["logJson"])
     logger.info("Started with arguments: " + str(argsDict))
 
+    # Metrics are only collected when they can be read
+    if argsDict["metricsPort"] or argsDict["metricsJson"]:
+        Metrics.registry.enabled = True
+    if argsDict["metricsPort"]:
+        Metrics.registry.Serve(argsDict["metricsPort"])
+        logger.info("Serving metrics on port %s" % argsDict["metricsPort"])
+
     # Run the action function
-    argsObj.func(logger, argsDict)
+    try:
+        argsDict["func"](logger, argsDict)
+    finally:
+        if argsDict["metricsJson"]:
+            Metrics.registry.DumpJson(argsDict["metricsJson"])